@@ -4,6 +4,7 @@ LOG_FILE="./src/log_generator/api_requests.log"
 PROCESSOR_LOG="./src/log_processor/log_processor.log"
 GENERATOR_LOG="./src/log_generator/log_generator.log"
 INFLUX_VOLUME="./influx-volume"
+RECOVERY_DIR="./src/log_processor/recovery"
 
 # Step 1: Empty the api_requests.log file
 if [ -f "$LOG_FILE" ]; then
@@ -45,4 +46,13 @@ else
     echo "$GENERATOR_LOG does not exist, skipping."
 fi
 
+# Step 6: Remove bytewax recovery partitions so the log processor doesn't resume from old offsets
+if [ -d "$RECOVERY_DIR" ]; then
+    echo "Removing $RECOVERY_DIR..."
+    rm -rf "$RECOVERY_DIR"
+    echo "$RECOVERY_DIR has been removed."
+else
+    echo "$RECOVERY_DIR does not exist, skipping."
+fi
+
 echo "Cleanup complete."
@@ -0,0 +1,138 @@
+"""
+Compares the former raw points path of the stats, FluxRecords and python lists (records_calculate below) against the
+CSV response parsed straight into numpy arrays (InfluxClient._read_durations/_calculate_durations):
+    python bench_raw_stats.py --points 1000000 10000000
+
+No InfluxDB needed, the query responses are generated up front and served from memory through the client's own
+query api, so what is timed is parsing the response and computing the stats. A FluxRecord takes ~1KB, the record
+path is skipped past --max-record-points to stay within memory.
+"""
+import argparse
+import io
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from influxdb_client import InfluxDBClient
+
+from influx_client import InfluxClient
+from quantile_sketch import quantile_rank
+
+ANNOTATIONS = (
+    "#datatype,string,long,dateTime:RFC3339,string,string,string,{value_type}\r\n"
+    "#group,false,false,false,true,true,true,false\r\n"
+    "#default,_result,,,,,,\r\n"
+    ",result,table,_time,customer_id,success,_field,_value\r\n"
+)
+
+
+def generate(points: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    durations = np.round(rng.lognormal(-1.6, 0.6, points), 3)
+    status_codes = rng.choice([200, 201, 400, 404, 500], points)
+    return status_codes, durations
+
+
+def raw_response(status_codes: np.ndarray, durations: np.ndarray) -> bytes:
+    """What the raw query returns: a duration and a status_code point per request, a table per field and success."""
+    times = [
+        (datetime(2024, 10, 1, tzinfo=timezone.utc) + timedelta(milliseconds=int(i))).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        for i in range(len(durations))
+    ]
+    success = status_codes < 400
+    blocks, table = [], 0
+    for field, values, value_type in (("duration", durations, "double"), ("status_code", status_codes, "long")):
+        lines = [ANNOTATIONS.format(value_type=value_type)]
+        for flag in (0, 1):
+            rows = np.flatnonzero(success == flag)
+            lines += [f",,{table},{times[i]},bench_cust,{flag},{field},{values[i]}\r\n" for i in rows]
+            table += 1
+        blocks.append("".join(lines))
+    return "\r\n".join(blocks).encode()
+
+
+def durations_response(status_codes: np.ndarray, durations: np.ndarray) -> bytes:
+    """What the durations query returns: a single table of success flags and durations, no annotations."""
+    success = (status_codes < 400).astype(int)
+    lines = [",result,table,success,_value\r\n"]
+    lines += [f",_result,0,{flag},{duration}\r\n" for flag, duration in zip(success.tolist(), durations.tolist())]
+    return "".join(lines).encode()
+
+
+def canned_client(payload: bytes) -> InfluxClient:
+    """An InfluxClient whose queries all get `payload` back, parsed by the real query api."""
+    influx_client = InfluxClient(aggregation_mode=InfluxClient.CLIENT_MODE)
+    influx_client.reader_client = InfluxDBClient(url="http://127.0.0.1:8086", token="bench", org="bench").query_api()
+    influx_client.reader_client._query_api.post_query = lambda **kwargs: io.BytesIO(payload)
+    return influx_client
+
+
+def best_of(repeat: int, func):
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def python_calculate(stats):
+    """The stats computed on python lists of each field's values."""
+    latencies = sorted(stats["duration"])
+    total_success = sum([1 if s < 400 else 0 for s in stats["status_code"]])
+    average_latency = sum(latencies) / len(latencies)
+    median_latency = latencies[quantile_rank(0.5, len(latencies))]
+    p99_latency = latencies[quantile_rank(0.99, len(latencies))]
+    return total_success, average_latency, median_latency, p99_latency
+
+
+def records_calculate(result):
+    """The record by record path: every FluxRecord's value appended to a list per field, then python_calculate."""
+    stats = defaultdict(list)
+    for table in result:
+        for record in table.records:
+            stats[record.values.get("_field")].append(record.values.get("_value"))
+    return python_calculate(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-record-points", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    for points in args.points:
+        status_codes, durations = generate(points)
+        print(f"{points} points")
+
+        influx_client = canned_client(durations_response(status_codes, durations))
+        numpy_elapsed, numpy_stats = best_of(
+            args.repeat, lambda: influx_client._calculate_durations(*influx_client._read_durations("start", "stop"))
+        )
+        print(f"{'numpy':>8}: {numpy_elapsed:.3f}s {numpy_stats}")
+
+        # the stats alone, from values already in memory
+        values = {"duration": durations.tolist(), "status_code": status_codes.tolist()}
+        python_elapsed, _ = best_of(args.repeat, lambda: python_calculate(values))
+        array_elapsed, _ = best_of(
+            args.repeat, lambda: influx_client._calculate_durations(status_codes < 400, durations)
+        )
+        print(f"{'compute':>8}: python lists {python_elapsed:.3f}s, numpy {array_elapsed:.3f}s "
+              f"({python_elapsed / array_elapsed:.1f}x)")
+
+        if points > args.max_record_points:
+            print(f"{'records':>8}: skipped, over --max-record-points")
+            continue
+        influx_client = canned_client(raw_response(status_codes, durations))
+        records_elapsed, records_stats = best_of(
+            args.repeat,
+            lambda: records_calculate(influx_client.reader_client.query(query="raw", org="bench"))
+        )
+        print(f"{'records':>8}: {records_elapsed:.3f}s {records_stats}")
+        print(f"{'speedup':>8}: {records_elapsed / numpy_elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
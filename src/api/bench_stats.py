@@ -0,0 +1,95 @@
+"""
+Compares server side (Flux) and client side (python) stats aggregation against a seeded dataset.
+
+Needs a running InfluxDB, e.g. from the rated_api container:
+    python bench_stats.py --points 200000 --repeat 5
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from influxdb_client import InfluxDBClient, Point
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+from config import INFLUXDB_TOKEN, INFLUXDB_BUCKET, INFLUXDB_ORG, INFLUXDB_URL
+from influx_client import InfluxClient
+
+BENCH_CUSTOMER_ID = "bench_cust"
+STATUS_CODES = [200, 201, 400, 401, 403, 404, 500]
+
+
+def seed(points: int, days: int) -> str:
+    random.seed(42)
+    start = datetime.utcnow().replace(microsecond=0) - timedelta(days=days)
+    step = (days * 24 * 60 * 60 * 1_000_000) // points
+
+    with InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG) as client:
+        write_api = client.write_api(write_options=SYNCHRONOUS)
+        batch = []
+        for i in range(points):
+            status_code = random.choice(STATUS_CODES)
+            batch.append(
+                Point("api_requests")
+                .tag("customer_id", BENCH_CUSTOMER_ID)
+                .tag("success", 1 if 200 <= status_code < 400 else 0)
+                .field("duration", round(random.uniform(0.1, 2.0), 3))
+                .field("status_code", status_code)
+                .field("request_path", "/api/v1/resource1")
+                .time(start + timedelta(microseconds=i * step))
+            )
+            if len(batch) == 5000:
+                write_api.write(INFLUXDB_BUCKET, INFLUXDB_ORG, batch)
+                batch = []
+        if batch:
+            write_api.write(INFLUXDB_BUCKET, INFLUXDB_ORG, batch)
+
+    return start.strftime("%Y-%m-%d")
+
+
+def cleanup() -> None:
+    with InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG) as client:
+        client.delete_api().delete(
+            start="1970-01-01T00:00:00Z",
+            stop="2049-12-31T23:59:59Z",
+            predicate=f'_measurement="api_requests" AND customer_id="{BENCH_CUSTOMER_ID}"',
+            bucket=INFLUXDB_BUCKET,
+            org=INFLUXDB_ORG
+        )
+
+
+def run(mode: str, from_date: str, repeat: int):
+    timings = []
+    stats = None
+    with InfluxClient(aggregation_mode=mode) as influx_client:
+        for _ in range(repeat):
+            influx_client.cache.clear()
+            started = time.perf_counter()
+            stats = influx_client.get_stats(BENCH_CUSTOMER_ID, from_date)
+            timings.append(time.perf_counter() - started)
+    return stats, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--keep", action="store_true", help="do not delete the seeded points afterwards")
+    args = parser.parse_args()
+
+    print(f"Seeding {args.points} points over {args.days} days for {BENCH_CUSTOMER_ID} ...")
+    from_date = seed(args.points, args.days)
+
+    try:
+        for mode in (InfluxClient.CLIENT_MODE, InfluxClient.SERVER_MODE):
+            stats, timings = run(mode, from_date, args.repeat)
+            print(f"{mode:>6}: best {min(timings) * 1000:.1f}ms, avg {sum(timings) / len(timings) * 1000:.1f}ms")
+            print(f"        {stats}")
+    finally:
+        if not args.keep:
+            cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,3 +4,24 @@ INFLUXDB_URL = os.getenv("INFLUXDB_URL")
 INFLUXDB_TOKEN = os.getenv("DOCKER_INFLUXDB_INIT_ADMIN_TOKEN")
 INFLUXDB_BUCKET = os.getenv("DOCKER_INFLUXDB_INIT_BUCKET")
 INFLUXDB_ORG = os.getenv("DOCKER_INFLUXDB_INIT_ORG")
+
+# Stats aggregation: "server" computes count/mean/quantiles in Flux, "client" pulls raw points and computes in python,
+# "rollup" merges the per customer/day rollups written by the log processor
+STATS_AGGREGATION_MODE = os.getenv("STATS_AGGREGATION_MODE", "server").lower()
+
+# Schema the log processor writes raw points with (its LOG_SCHEMA_MODE): "legacy" api_requests or "tagged"
+# api_requests_tagged, where the path and status class are tags and duration the only field
+LOG_SCHEMA_MODE = os.getenv("LOG_SCHEMA_MODE", "legacy").lower()
+
+# Connection pooling, one client is shared by the whole app and queries run on a bounded thread pool
+INFLUXDB_CONNECTION_POOL_MAXSIZE = int(os.getenv("INFLUXDB_CONNECTION_POOL_MAXSIZE", 10))
+INFLUXDB_QUERY_CONCURRENCY = int(os.getenv("INFLUXDB_QUERY_CONCURRENCY", INFLUXDB_CONNECTION_POOL_MAXSIZE))
+INFLUXDB_TIMEOUT_MS = int(os.getenv("INFLUXDB_TIMEOUT_MS", 10_000))
+
+# Stats cache: responses are kept for STATS_CACHE_TTL_SECONDS (0 disables it), in rollup mode the merged rollups of
+# the days before the last STATS_CACHE_OPEN_DAYS (LOG_ROLLUP_OPEN_DAYS of the log processor) for
+# STATS_CACHE_CLOSED_TTL_SECONDS, so rollups written late (e.g. replayed spills or imports) still show up
+STATS_CACHE_MAX_ENTRIES = int(os.getenv("STATS_CACHE_MAX_ENTRIES", 1024))
+STATS_CACHE_TTL_SECONDS = float(os.getenv("STATS_CACHE_TTL_SECONDS", 5))
+STATS_CACHE_OPEN_DAYS = int(os.getenv("STATS_CACHE_OPEN_DAYS", 2))
+STATS_CACHE_CLOSED_TTL_SECONDS = float(os.getenv("STATS_CACHE_CLOSED_TTL_SECONDS", 3600))
@@ -1,6 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from typing import AsyncIterator, Dict, List
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from dependencies import get_influx_client
 from influx_client import InfluxClient
-from models import CustomerStatsResponse
+from models import CustomerStatsResponse, DailyCustomerStatsResponse, PathStatsResponse
 from validators import CustomerStatsRequest
 import logging
 
@@ -17,44 +21,132 @@ logging.basicConfig(
 router = APIRouter(prefix="/customers", tags=["Customers"])
 
 
+@router.get("/stats", response_model=Dict[str, CustomerStatsResponse])
+async def get_bulk_customer_stats_endpoint(
+        customer_id: List[str] = Query(
+            [], description="Customers to return stats for, repeat it for several customers, every customer if omitted"
+        ),
+        request: CustomerStatsRequest = Depends(),
+        influx_client: InfluxClient = Depends(get_influx_client)
+):
+    validated_date = request.from_date
+
+    logger.info(f"Received request for bulk customer stats: customers={len(customer_id) or 'all'}, "
+                f"from_date={validated_date}")
+
+    try:
+        stats = await influx_client.run(influx_client.get_bulk_stats, customer_id, validated_date)
+        if not stats:
+            logger.warning(f"No stats found for customers={customer_id or 'all'}, from_date={validated_date}")
+            raise HTTPException(status_code=404, detail="Customer data not found")
+        logger.info(f"Returning stats for {len(stats)} customers, from_date={validated_date}")
+        return stats
+    except Exception as e:
+        logger.error(f"Error while retrieving bulk customer stats, from_date={validated_date}: {e}")
+        raise HTTPException(status_code=getattr(e, "status_code", 500), detail=f"Failed to retrieve stats: {e}")
+
+
 @router.get("/{customer_id}/stats", response_model=CustomerStatsResponse)
 async def get_customer_stats_endpoint(
         customer_id: str,
-        request: CustomerStatsRequest = Depends()
+        request: CustomerStatsRequest = Depends(),
+        influx_client: InfluxClient = Depends(get_influx_client)
 ):
     validated_date = request.from_date
 
     logger.info(f"Received request for customer stats: customer_id={customer_id}, from_date={validated_date}")
 
     try:
-        with InfluxClient() as influx_client:
-            stats = influx_client.get_stats(customer_id, validated_date)
-            if not stats:
-                logger.warning(f"No stats found for customer_id={customer_id}, from_date={validated_date}")
-                raise HTTPException(status_code=404, detail="Customer data not found")
-            logger.info(f"Returning stats for customer_id={customer_id}, from_date={validated_date}")
-            return stats
+        stats = await influx_client.run(influx_client.get_stats, customer_id, validated_date)
+        if not stats:
+            logger.warning(f"No stats found for customer_id={customer_id}, from_date={validated_date}")
+            raise HTTPException(status_code=404, detail="Customer data not found")
+        logger.info(f"Returning stats for customer_id={customer_id}, from_date={validated_date}")
+        return stats
     except Exception as e:
         logger.error(f"Error while retrieving stats for customer_id={customer_id}, from_date={validated_date}: {e}")
         raise HTTPException(status_code=getattr(e, "status_code", 500), detail=f"Failed to retrieve stats: {e}")
 
 
+@router.get("/{customer_id}/stats/paths", response_model=Dict[str, PathStatsResponse])
+async def get_customer_path_stats_endpoint(
+        customer_id: str,
+        request: CustomerStatsRequest = Depends(),
+        influx_client: InfluxClient = Depends(get_influx_client)
+):
+    validated_date = request.from_date
+
+    logger.info(f"Received request for path stats: customer_id={customer_id}, from_date={validated_date}")
+
+    try:
+        stats = await influx_client.run(influx_client.get_path_stats, customer_id, validated_date)
+        if not stats:
+            logger.warning(f"No path stats found for customer_id={customer_id}, from_date={validated_date}")
+            raise HTTPException(status_code=404, detail="Customer data not found")
+        logger.info(f"Returning stats of {len(stats)} paths for customer_id={customer_id}, from_date={validated_date}")
+        return stats
+    except Exception as e:
+        logger.error(f"Error while retrieving path stats for customer_id={customer_id}, "
+                     f"from_date={validated_date}: {e}")
+        raise HTTPException(status_code=getattr(e, "status_code", 500), detail=f"Failed to retrieve stats: {e}")
+
+
+async def _ndjson(first_row: Dict, rows: AsyncIterator[Dict]) -> AsyncIterator[str]:
+    yield DailyCustomerStatsResponse(**first_row).model_dump_json() + "\n"
+    async for row in rows:
+        yield DailyCustomerStatsResponse(**row).model_dump_json() + "\n"
+
+
+@router.get(
+    "/{customer_id}/stats/daily",
+    response_class=StreamingResponse,
+    responses={200: {
+        "description": "One DailyCustomerStatsResponse per line, oldest day first",
+        "content": {"application/x-ndjson": {"schema": DailyCustomerStatsResponse.model_json_schema()}},
+    }}
+)
+async def get_customer_daily_stats_endpoint(
+        customer_id: str,
+        request: CustomerStatsRequest = Depends(),
+        influx_client: InfluxClient = Depends(get_influx_client)
+):
+    validated_date = request.from_date
+
+    logger.info(f"Received request for daily customer stats: customer_id={customer_id}, from_date={validated_date}")
+
+    # rows are streamed as they come out of InfluxDB, only the first one is awaited so errors still get a status code
+    rows = influx_client.iterate(influx_client.get_daily_stats, customer_id, validated_date)
+    try:
+        first_row = await anext(rows, None)
+        if not first_row:
+            logger.warning(f"No daily stats found for customer_id={customer_id}, from_date={validated_date}")
+            raise HTTPException(status_code=404, detail="Customer data not found")
+    except Exception as e:
+        await rows.aclose()
+        logger.error(f"Error while retrieving daily stats for customer_id={customer_id}, "
+                     f"from_date={validated_date}: {e}")
+        raise HTTPException(status_code=getattr(e, "status_code", 500), detail=f"Failed to retrieve stats: {e}")
+
+    logger.info(f"Streaming daily stats for customer_id={customer_id}, from_date={validated_date}")
+    return StreamingResponse(_ndjson(first_row, rows), media_type="application/x-ndjson")
+
+
 @router.get("/customer/stats/all", response_model=CustomerStatsResponse)
 async def get_all_stats_endpoint(
-        request: CustomerStatsRequest = Depends()
+        request: CustomerStatsRequest = Depends(),
+        influx_client: InfluxClient = Depends(get_influx_client)
 ):
     validated_date = request.from_date
 
     logger.info(f"Received request for all customer stats: from_date={validated_date}")
 
     try:
-        with InfluxClient() as influx_client:
-            stats = influx_client.get_all_stats(validated_date)
-            if not stats:
-                logger.warning(f"No stats found from_date={validated_date}")
-                raise HTTPException(status_code=404, detail="Customer data not found")
-            logger.info(f"Returning stats for all customers, from_date={validated_date}")
-            return stats
+        stats = await influx_client.run(influx_client.get_all_stats, validated_date)
+        if not stats:
+            logger.warning(f"No stats found from_date={validated_date}")
+            raise HTTPException(status_code=404, detail="Customer data not found")
+        logger.info(f"Returning stats for all customers, from_date={validated_date}")
+        return stats
     except Exception as e:
         logger.error(f"Error while retrieving stats for all customers, from_date={validated_date}: {e}")
         raise HTTPException(status_code=getattr(e, "status_code", 500), detail=f"Failed to retrieve stats: {e}")
\ No newline at end of file
@@ -0,0 +1,7 @@
+from fastapi import Request
+from influx_client import InfluxClient
+
+
+def get_influx_client(request: Request) -> InfluxClient:
+    """The app-lifetime client created in main.lifespan."""
+    return request.app.state.influx_client
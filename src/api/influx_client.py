@@ -1,32 +1,124 @@
+import heapq
+import io
 import logging
+from functools import partial
 
-from influxdb_client.client.write_api import SYNCHRONOUS
-from datetime import datetime
-from typing import Dict, Tuple, Optional
+import anyio.to_thread
+from anyio import CapacityLimiter
+from datetime import date, datetime, timedelta, timezone
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, Sequence, Tuple, Optional, Union
 
-from config import INFLUXDB_TOKEN, INFLUXDB_BUCKET, INFLUXDB_ORG, INFLUXDB_URL
-from influxdb_client import InfluxDBClient
+from config import (
+    INFLUXDB_TOKEN,
+    INFLUXDB_BUCKET,
+    INFLUXDB_ORG,
+    INFLUXDB_URL,
+    INFLUXDB_CONNECTION_POOL_MAXSIZE,
+    INFLUXDB_QUERY_CONCURRENCY,
+    INFLUXDB_TIMEOUT_MS,
+    LOG_SCHEMA_MODE,
+    STATS_AGGREGATION_MODE,
+    STATS_CACHE_CLOSED_TTL_SECONDS,
+    STATS_CACHE_MAX_ENTRIES,
+    STATS_CACHE_OPEN_DAYS,
+    STATS_CACHE_TTL_SECONDS,
+)
+import numpy as np
+from influxdb_client import Dialect, InfluxDBClient
+from quantile_sketch import QuantileSketch, quantile_rank
+from stats_cache import StatsCache
+
+# a customer id, a tuple of them or None for every customer
+CustomerIds = Union[None, str, Tuple[str, ...]]
+
+
+class RollupTotals:
+    """Sums of daily rollup rows, the stats of any range of days are computed from these."""
+
+    def __init__(self) -> None:
+        self.successful_requests = 0
+        self.failed_requests = 0
+        self.duration_sum = 0.0
+        self.sketch = QuantileSketch()
+
+    def add(self, values: Dict) -> None:
+        self.successful_requests += int(values.get("successful_requests") or 0)
+        self.failed_requests += int(values.get("failed_requests") or 0)
+        self.duration_sum += values.get("duration_sum") or 0.0
+        self.sketch.merge(QuantileSketch.from_string(values.get("duration_sketch")))
+
+    def merge(self, other: "RollupTotals") -> None:
+        self.successful_requests += other.successful_requests
+        self.failed_requests += other.failed_requests
+        self.duration_sum += other.duration_sum
+        self.sketch.merge(other.sketch)
 
 
 class InfluxClient:
     PRECISION = 5
+    # plain CSV, just a header row and the data rows, what the vectorized raw path parses
+    CSV_DIALECT = Dialect(header=True, delimiter=",", annotations=[], comment_prefix="#")
+    # raw points measurement per LOG_SCHEMA_MODE, both have a duration field and customer_id and success tags
+    MEASUREMENTS = {"legacy": "api_requests", "tagged": "api_requests_tagged"}
+    SERVER_MODE = "server"
+    CLIENT_MODE = "client"
+    ROLLUP_MODE = "rollup"
 
-    def __init__(self) -> None:
+    def __init__(self, aggregation_mode: Optional[str] = None, schema_mode: Optional[str] = None) -> None:
         self.bucket: str = INFLUXDB_BUCKET
         self.org: str = INFLUXDB_ORG
         self.url: str = INFLUXDB_URL
         self.token: str = INFLUXDB_TOKEN
+        self.aggregation_mode: str = aggregation_mode or STATS_AGGREGATION_MODE
+        self.measurement: str = self.MEASUREMENTS[schema_mode or LOG_SCHEMA_MODE]
         self._client: Optional[InfluxDBClient] = None
+        self._limiter = CapacityLimiter(INFLUXDB_QUERY_CONCURRENCY)
+        self.cache = StatsCache(STATS_CACHE_MAX_ENTRIES)
 
     def __enter__(self):
-        self._client = InfluxDBClient(url=self.url, token=self.token, org=self.org)
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self) -> "InfluxClient":
+        """
+        Creates the underlying client, its HTTP connection pool is reused by every query until close() is called.
+        """
+        self._client = InfluxDBClient(
+            url=self.url, token=self.token, org=self.org,
+            timeout=INFLUXDB_TIMEOUT_MS, connection_pool_maxsize=INFLUXDB_CONNECTION_POOL_MAXSIZE
+        )
         self.reader_client = self._client.query_api()
-        self.writer_client = self._client.write_api(write_options=SYNCHRONOUS)
         return self
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
+    def close(self) -> None:
         if self._client:
             self._client.close()
+            self._client = None
+
+    async def run(self, func: Callable, *args):
+        """
+        Runs a blocking query method off the event loop, at most INFLUXDB_QUERY_CONCURRENCY at a time so queued
+        requests wait for a thread instead of a pooled connection.
+        """
+        return await anyio.to_thread.run_sync(partial(func, *args), limiter=self._limiter)
+
+    async def iterate(self, func: Callable, *args) -> AsyncIterator:
+        """Like run() for a blocking generator, every item is pulled on the same bounded thread pool."""
+        iterator = iter(func(*args))
+        done = object()
+        try:
+            while True:
+                item = await anyio.to_thread.run_sync(next, iterator, done, limiter=self._limiter)
+                if item is done:
+                    return
+                yield item
+        finally:
+            # the client may go away half way through a stream, release the query's connection
+            if hasattr(iterator, "close"):
+                await anyio.to_thread.run_sync(iterator.close, limiter=self._limiter)
 
     @staticmethod
     def get_start_end_times(_date: str) -> Tuple[str, str]:
@@ -35,69 +127,494 @@ class InfluxClient:
         return start_time.isoformat() + "Z", end_time.isoformat() + "Z"
 
     def get_all_stats(self, _date: str) -> Optional[Dict[str, float]]:
+        return self.get_stats(None, _date)
+
+    def get_stats(self, _customer_id: Optional[str], _date: str) -> Optional[Dict[str, float]]:
+        """
+        Ranges always end now, so results are only cached for STATS_CACHE_TTL_SECONDS. Missing stats aren't cached,
+        the customer's first requests show up right away.
+        """
+        def compute():
+            start_time, end_time = InfluxClient.get_start_end_times(_date)
+            return self._get_stats(start_time, end_time, _customer_id)
+
+        return self.cache.get_or_compute(("stats", _customer_id, _date), compute, ttl=STATS_CACHE_TTL_SECONDS)
+
+    def get_bulk_stats(self, _customer_ids: Optional[Sequence[str]],
+                       _date: str) -> Optional[Dict[str, Dict[str, float]]]:
+        """
+        Stats of each of `_customer_ids` (every customer if empty) keyed by customer id, computed by one query grouped
+        by customer_id instead of a get_stats() per customer. Customers without requests are left out.
+        """
+        customer_ids = tuple(sorted(set(_customer_ids))) if _customer_ids else None
+
+        def compute():
+            start_time, end_time = InfluxClient.get_start_end_times(_date)
+            return self._get_bulk_stats(start_time, end_time, customer_ids) or None
+
+        return self.cache.get_or_compute(("bulk", customer_ids, _date), compute, ttl=STATS_CACHE_TTL_SECONDS)
+
+    def get_path_stats(self, _customer_id: str, _date: str) -> Optional[Dict[str, Dict[str, float]]]:
+        """
+        Stats of each request path of the customer keyed by path, with their error rate. Always aggregated server
+        side in a single query grouped by path, rollups are per customer and day only.
+        """
+        def compute():
+            start_time, end_time = InfluxClient.get_start_end_times(_date)
+            query = self._aggregated_query(start_time, end_time, _customer_id, group_by="path")
+            paths = self._calculate_aggregated_by(self.reader_client.query(org=self.org, query=query), "path")
+            for stats in paths.values():
+                stats["error_rate"] = round(stats["failed_requests"] / stats["total_requests"] * 100, self.PRECISION)
+            return paths or None
+
+        return self.cache.get_or_compute(("paths", _customer_id, _date), compute, ttl=STATS_CACHE_TTL_SECONDS)
+
+    def get_daily_stats(self, _customer_id: str, _date: str) -> Iterator[Dict[str, float]]:
+        """
+        Streams one stats row per (UTC) day with data from `_date` on, each with its "date". The rollup and server
+        modes fall back like _get_stats does when they fail or find nothing before their first row, the rollup mode
+        also aggregates the raw points of the days its rollups don't cover.
+        """
         start_time, end_time = InfluxClient.get_start_end_times(_date)
+        sources = []
+        if self.aggregation_mode == self.ROLLUP_MODE:
+            sources.append(partial(self._daily_rollup_stats, start_time, end_time, _customer_id))
+        if self.aggregation_mode in (self.SERVER_MODE, self.ROLLUP_MODE):
+            sources.append(partial(self._daily_aggregated_stats, start_time, end_time, _customer_id))
+
+        for source in sources:
+            rows = source()
+            try:
+                first_row = next(rows)
+            except StopIteration:
+                logging.info(f"{source.func.__name__} found no days, trying the next aggregation")
+                continue
+            except Exception as e:
+                logging.warning(f"{source.func.__name__} failed, trying the next aggregation: {e}")
+                continue
+            yield first_row
+            yield from rows
+            return
+
+        yield from self._daily_raw_stats(_date, _customer_id)
+
+    def _daily_rollup_stats(self, start_time: str, end_time: str, customer_id: str) -> Iterator[Dict[str, float]]:
+        """
+        The rollup row of every day whose rollup counts all of the day's raw points, merged in date order with the
+        _daily_aggregated_stats of the other days (lines the log processor got after it closed their day).
+        """
+        counts = self._request_counts(start_time, end_time, customer_id, daily=True)
+        rollups = []
+        query = self._rollup_query(start_time, end_time, customer_id)
+        for record in self.reader_client.query_stream(org=self.org, query=query):
+            day, stats = record.get_time().date().isoformat(), self._rollup_stats([record])
+            if stats and stats["total_requests"] == counts.get(day):
+                rollups.append({"date": day, **stats})
+
+        covered = {row["date"] for row in rollups}
+        if covered.issuperset(counts):
+            yield from rollups
+            return
+        logging.info(f"Daily rollups don't cover {len(set(counts) - covered)} days, aggregating their raw points")
+        aggregated = (row for row in self._daily_aggregated_stats(start_time, end_time, customer_id)
+                      if row["date"] not in covered)
+        yield from heapq.merge(rollups, aggregated, key=lambda row: row["date"])
+
+    def _daily_aggregated_stats(self, start_time: str, end_time: str,
+                                customer_id: str) -> Iterator[Dict[str, float]]:
+        query = self._daily_aggregated_query(start_time, end_time, customer_id)
+        for record in self.reader_client.query_stream(org=self.org, query=query):
+            stats = self._aggregated_stats(record.values)
+            if stats:
+                yield {"date": record.get_time().date().isoformat(), **stats}
+
+    def _daily_raw_stats(self, _date: str, customer_id: str) -> Iterator[Dict[str, float]]:
+        """One raw query per day, only a day of raw points is in memory at a time."""
+        day = datetime.strptime(_date, "%Y-%m-%d").date()
+        while day <= date.today():
+            stats = self._calculate_durations(
+                *self._read_durations(f"{day}T00:00:00Z", f"{day + timedelta(days=1)}T00:00:00Z", customer_id)
+            )
+            if stats:
+                yield {"date": day.isoformat(), **stats}
+            day += timedelta(days=1)
+
+    def _get_stats(self, start_time: str, end_time: str, customer_id: Optional[str] = None) -> Optional[Dict[str, float]]:
+        """
+        Computes stats server side unless the client mode is configured, the python path is kept as a fallback
+        in case the aggregation query fails (e.g. an older InfluxDB without the quantile methods we rely on).
+        The rollup mode merges the daily rollups written by the log processor and falls back to the server side
+        aggregation when they don't count every raw point of the range.
+        """
+        if self.aggregation_mode == self.ROLLUP_MODE:
+            try:
+                stats = self._rollup_range_stats(start_time, end_time, customer_id)
+                if stats:
+                    return stats
+                logging.info("Daily rollups don't cover the range, aggregating raw points")
+            except Exception as e:
+                logging.warning(f"Reading daily rollups failed, aggregating raw points: {e}")
+
+        if self.aggregation_mode in (self.SERVER_MODE, self.ROLLUP_MODE):
+            try:
+                query = self._aggregated_query(start_time, end_time, customer_id)
+                result = self.reader_client.query(org=self.org, query=query)
+                return self._calculate_aggregated(result)
+            except Exception as e:
+                logging.warning(f"Server side aggregation failed, falling back to client side calculation: {e}")
+
+        return self._calculate_durations(*self._read_durations(start_time, end_time, customer_id))
+
+    def _get_bulk_stats(self, start_time: str, end_time: str,
+                        customer_ids: CustomerIds = None) -> Optional[Dict[str, Dict[str, float]]]:
+        """
+        _get_stats grouped by customer, with the same fallbacks. In rollup mode only the customers the rollups don't
+        cover are aggregated from the raw points, the covered ones keep their rollup stats.
+        """
+        rollup_stats = {}
+        if self.aggregation_mode == self.ROLLUP_MODE:
+            try:
+                totals, uncovered = self._covered_rollup_totals(start_time, end_time, customer_ids, by_customer=True)
+                rollup_stats = self._calculate_each(totals, self._rollup_totals_stats)
+                if not uncovered:
+                    return rollup_stats
+                logging.info(f"Daily rollups don't cover {len(uncovered)} customers, aggregating raw points")
+                # a filter listing every uncovered customer could be huge, all customers are aggregated instead
+                customer_ids = uncovered if customer_ids else None
+            except Exception as e:
+                logging.warning(f"Reading daily rollups failed, aggregating raw points: {e}")
+
+        if self.aggregation_mode in (self.SERVER_MODE, self.ROLLUP_MODE):
+            try:
+                query = self._aggregated_query(start_time, end_time, customer_ids, group_by="customer_id")
+                result = self.reader_client.query(org=self.org, query=query)
+                return {**self._calculate_aggregated_by(result, "customer_id"), **rollup_stats}
+            except Exception as e:
+                logging.warning(f"Server side aggregation failed, falling back to client side calculation: {e}")
+
+        customer_durations = self._read_customer_durations(start_time, end_time, customer_ids)
+        return {**self._calculate_each(customer_durations, lambda columns: self._calculate_durations(*columns)),
+                **rollup_stats}
+
+    def _rollup_range_stats(self, start_time: str, end_time: str,
+                            customer_id: Optional[str] = None) -> Optional[Dict[str, float]]:
+        totals, _ = self._covered_rollup_totals(start_time, end_time, customer_id)
+        return self._rollup_totals_stats(totals[None]) if None in totals else None
+
+    def _covered_rollup_totals(self, start_time: str, end_time: str, customer_ids: CustomerIds = None,
+                               by_customer: bool = False) -> Tuple[Dict[Optional[str], RollupTotals], Tuple]:
+        """
+        The rollup totals of the customers (None unless `by_customer`) whose rollups count every raw point of the
+        range, and the ids of the customers with raw points the rollups miss. Lines the log processor read after it
+        had closed their day, or that it is still writing, are not in the rollups and their stats can't be merged
+        from them. The raw points are counted by the storage engine, far cheaper than aggregating them.
+        """
+        counts = self._request_counts(start_time, end_time, customer_ids, by_customer)
+        totals = self._rollup_range_totals(start_time, end_time, customer_ids, by_customer)
+        covered = {customer_id: customer_totals for customer_id, customer_totals in totals.items()
+                   if customer_totals.successful_requests + customer_totals.failed_requests == counts.get(customer_id)}
+        return covered, tuple(sorted(customer_id for customer_id in counts if customer_id not in covered))
 
-        query = """
+    def _rollup_range_totals(self, start_time: str, end_time: str, customer_ids: CustomerIds = None,
+                             by_customer: bool = False) -> Dict[Optional[str], RollupTotals]:
+        """
+        The log processor only updates the rollups of its last open days, the merged rollups of the days before
+        STATS_CACHE_OPEN_DAYS are cached for STATS_CACHE_CLOSED_TTL_SECONDS and only the open days are read every time.
+        Closed days still change when spilled rollups are replayed late or logs are imported, hence the finite TTL.
+        """
+        open_from = f"{datetime.now(timezone.utc).date() - timedelta(days=STATS_CACHE_OPEN_DAYS - 1)}T00:00:00Z"
+        ranges = []
+        if start_time < open_from:
+            closed_start = start_time
+            ranges.append(self.cache.get_or_compute(
+                ("rollups", customer_ids, by_customer, closed_start, open_from),
+                lambda: self._rollup_totals(closed_start, open_from, customer_ids, by_customer),
+                ttl=STATS_CACHE_CLOSED_TTL_SECONDS
+            ))
+            start_time = open_from
+        ranges.append(self._rollup_totals(start_time, end_time, customer_ids, by_customer))
+
+        totals = defaultdict(RollupTotals)
+        for range_totals in ranges:
+            for customer_id, customer_totals in range_totals.items():
+                totals[customer_id].merge(customer_totals)
+        return totals
+
+    def _rollup_totals(self, start_time: str, end_time: str, customer_ids: CustomerIds = None,
+                       by_customer: bool = False) -> Dict[Optional[str], RollupTotals]:
+        """Rollups summed per customer id, or under None when not `by_customer`."""
+        totals = defaultdict(RollupTotals)
+        query = self._rollup_query(start_time, end_time, customer_ids)
+        for table in self.reader_client.query(org=self.org, query=query):
+            for record in table.records:
+                totals[record.values.get("customer_id") if by_customer else None].add(record.values)
+        return dict(totals)
+
+    def _request_counts(self, start_time: str, end_time: str, customer_ids: CustomerIds = None,
+                        by_customer: bool = False, daily: bool = False) -> Dict[Optional[str], int]:
+        """Raw requests counted per customer id (None unless `by_customer`), or per (UTC) day when `daily`."""
+        query = self._request_count_query(start_time, end_time, customer_ids, by_customer, daily)
+        counts = {}
+        for table in self.reader_client.query(org=self.org, query=query):
+            for record in table.records:
+                if daily:
+                    key = record.get_time().date().isoformat()
+                else:
+                    key = record.values.get("customer_id") if by_customer else None
+                counts[key] = int(record.get_value())
+        return counts
+
+    @staticmethod
+    def _customer_filter(customer_ids: CustomerIds) -> str:
+        if customer_ids is None:
+            return ""
+        if isinstance(customer_ids, str):
+            return f' and r.customer_id == "{customer_ids}"'
+        # an "or" of equalities, unlike contains() it is pushed down to the storage engine
+        return " and ({})".format(" or ".join(f'r.customer_id == "{customer_id}"' for customer_id in customer_ids))
+
+    def _durations_query(self, start_time: str, end_time: str, customer_id: CustomerIds = None,
+                         by_customer: bool = False) -> str:
+        """Every request's duration point and success tag (and customer id `by_customer`) as a single table."""
+        columns = '"customer_id", "success", "_value"' if by_customer else '"success", "_value"'
+        return """
                 from(bucket: "{bucket}")
                   |> range(start: {start_time}, stop: {end_time})
-                  |> filter(fn: (r) => r._measurement == "api_requests")
-                """.format(bucket=self.bucket, start_time=start_time, end_time=end_time)
+                  |> filter(fn: (r) => r._measurement == "{measurement}" and r._field == "duration"{customer_filter})
+                  |> keep(columns: [{columns}])
+                  |> group()
+                """.format(bucket=self.bucket, start_time=start_time, end_time=end_time, columns=columns,
+                           measurement=self.measurement, customer_filter=self._customer_filter(customer_id))
 
-        result = self.reader_client.query(org=self.org, query=query)
+    def _read_durations(self, start_time: str, end_time: str,
+                        customer_id: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Success flags and durations of the raw points as arrays. The CSV response is parsed by numpy as it streams
+        in, there's no FluxRecord (a dict per point) and no python list on the way.
+        """
+        query = self._durations_query(start_time, end_time, customer_id)
+        response = self.reader_client.query_raw(org=self.org, query=query, dialect=self.CSV_DIALECT)
+        try:
+            lines = io.TextIOWrapper(response, encoding="utf-8")
+            header = lines.readline().strip().split(",")
+            if "_value" not in header:
+                return np.empty(0), np.empty(0)
+            columns = np.loadtxt(lines, delimiter=",", usecols=(header.index("success"), header.index("_value")),
+                                 ndmin=2)
+            return columns[:, 0], columns[:, 1]
+        finally:
+            response.close()
 
-        return self._calculate(result)
+    def _read_customer_durations(self, start_time: str, end_time: str,
+                                 customer_ids: CustomerIds = None) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """_read_durations of every customer from one query, the rows are split by customer id with an argsort."""
+        query = self._durations_query(start_time, end_time, customer_ids, by_customer=True)
+        response = self.reader_client.query_raw(org=self.org, query=query, dialect=self.CSV_DIALECT)
+        try:
+            lines = io.TextIOWrapper(response, encoding="utf-8")
+            header = lines.readline().strip().split(",")
+            if "_value" not in header:
+                return {}
+            # string columns are read in chunks of rows, which warns about the blank line ending the CSV
+            columns = np.loadtxt(filter(str.strip, lines), delimiter=",", quotechar='"', dtype=str, ndmin=2, usecols=(
+                header.index("customer_id"), header.index("success"), header.index("_value")
+            ))
+        finally:
+            response.close()
 
-    def get_stats(self, _customer_id: str, _date: str) -> Optional[Dict[str, float]]:
-        start_time, end_time = InfluxClient.get_start_end_times(_date)
-        query = """
+        customers, inverse = np.unique(columns[:, 0], return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        splits = np.cumsum(np.bincount(inverse, minlength=len(customers)))[:-1]
+        success = np.split(columns[order, 1].astype(np.float64), splits)
+        durations = np.split(columns[order, 2].astype(np.float64), splits)
+        return dict(zip(customers.tolist(), zip(success, durations)))
+
+    def _calculate_durations(self, success: np.ndarray, durations: np.ndarray) -> Optional[Dict[str, float]]:
+        """Stats of the raw points' arrays, the median and p99 are selected with a partial sort instead of a sort."""
+        total_requests = durations.size
+        if not total_requests:
+            return None
+
+        total_success = int(np.count_nonzero(success))
+        median_rank, p99_rank = quantile_rank(0.5, total_requests), quantile_rank(0.99, total_requests)
+        ranked = np.partition(durations, [median_rank, p99_rank])
+        return self._build_stats(
+            total_requests, total_success, total_requests - total_success,
+            float(durations.mean()), float(ranked[median_rank]), float(ranked[p99_rank])
+        )
+
+    def _aggregated_query(self, start_time: str, end_time: str, customer_id: CustomerIds = None,
+                          group_by: Optional[str] = None) -> str:
+        """
+        Every request has exactly one duration point, so counting/aggregating the duration field gives us all the
+        stats. The result is a single table with one row per stat, a handful of numbers instead of every raw point.
+        `group_by` (customer_id or path) groups everything by that column as well, a row per group and stat.
+        """
+        group, key = (f'"{group_by}"', f"{group_by}: r.{group_by}, ") if group_by else ("", "")
+        fields, reshape = 'r._field == "duration"', ""
+        if group_by == "path" and self.measurement == self.MEASUREMENTS["legacy"]:
+            # legacy points keep the path in a field, it is pivoted next to the duration of the same point
+            fields = '(r._field == "duration" or r._field == "request_path")'
+            reshape = """
+                  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+                  |> map(fn: (r) => ({r with _value: r.duration, path: r.request_path}))"""
+        return """
+                data = from(bucket: "{bucket}")
+                  |> range(start: {start_time}, stop: {end_time})
+                  |> filter(fn: (r) => r._measurement == "{measurement}" and {fields}{customer_filter}){reshape}
+
+                requests = data
+                  |> group(columns: [{group}{comma}"success"])
+                  |> count()
+                  |> map(fn: (r) => ({{
+                      {key}stat: if r.success == "1" then "successful_requests" else "failed_requests",
+                      _value: float(v: r._value)
+                  }}))
+
+                latencies = data |> group(columns: [{group}])
+                average = latencies |> mean() |> map(fn: (r) => ({{{key}stat: "average_latency", _value: r._value}}))
+                median = latencies
+                  |> quantile(q: 0.5, method: "exact_selector")
+                  |> map(fn: (r) => ({{{key}stat: "median_latency", _value: r._value}}))
+                p99 = latencies
+                  |> quantile(q: 0.99, method: "exact_selector")
+                  |> map(fn: (r) => ({{{key}stat: "p99_latency", _value: r._value}}))
+
+                union(tables: [requests, average, median, p99]) |> group()
+                """.format(bucket=self.bucket, start_time=start_time, end_time=end_time,
+                           measurement=self.measurement, customer_filter=self._customer_filter(customer_id),
+                           fields=fields, reshape=reshape, group=group, comma=", " if group else "", key=key)
+
+    def _request_count_query(self, start_time: str, end_time: str, customer_ids: CustomerIds = None,
+                             by_customer: bool = False, daily: bool = False) -> str:
+        """A count of the duration field, one per request, that InfluxDB answers without reading the points."""
+        count = 'aggregateWindow(every: 1d, fn: count, timeSrc: "_start", createEmpty: false)' if daily else "count()"
+        return """
                 from(bucket: "{bucket}")
                   |> range(start: {start_time}, stop: {end_time})
-                  |> filter(fn: (r) => r._measurement == "api_requests" and r.customer_id == "{customer_id}")
-                  |> keep(columns: ["_time", "customer_id", "success", "_field", "_value"])
-                """.format(bucket=self.bucket, start_time=start_time, end_time=end_time, customer_id=_customer_id)
+                  |> filter(fn: (r) => r._measurement == "{measurement}" and r._field == "duration"{customer_filter})
+                  |> group(columns: [{group}])
+                  |> {count}
+                """.format(bucket=self.bucket, start_time=start_time, end_time=end_time, measurement=self.measurement,
+                           customer_filter=self._customer_filter(customer_ids),
+                           group='"customer_id"' if by_customer else "", count=count)
 
-        result = self.reader_client.query(org=self.org, query=query)
-        return self._calculate(result)
+    def _rollup_query(self, start_time: str, end_time: str, customer_id: CustomerIds = None) -> str:
+        """One row per customer and day, ranges always start at midnight so the first day is complete."""
+        return """
+                from(bucket: "{bucket}")
+                  |> range(start: {start_time}, stop: {end_time})
+                  |> filter(fn: (r) => r._measurement == "api_requests_daily"{customer_filter})
+                  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+                """.format(bucket=self.bucket, start_time=start_time, end_time=end_time,
+                           customer_filter=self._customer_filter(customer_id))
 
-    def _calculate(self, _result) -> Optional[Dict[str, float]]:
-        try:
-            stats = {}
-            for table in _result:
-                for record in table.records:
-                    metric = record.values.get("_field")
-                    value = record.values.get("_value")
-                    if stats.get(metric):
-                        stats[metric].append(value)
-                    else:
-                        stats[metric] = [value]
-
-            # Process total requests, success, and failed
-            for i, v in stats.items():
-                logging.info(f"{i}: {len(v)}")
-            total_requests = stats.get("total_requests", max([len(s) for s in stats.values()]))
-            total_success = stats.get("total_success", sum([1 if s < 400 else 0 for s in stats["status_code"]]))
-            total_failed = stats.get("total_failed", sum([1 if s >= 400 else 0 for s in stats["status_code"]]))
-
-            # Calculate average, median, and p99 latency
-            latencies = stats.get("duration", [])
-
-            if latencies:
-                latencies = sorted(latencies)
-                average_latency = sum(latencies) / len(latencies) if latencies else None
-                median_latency = latencies[len(latencies) // 2] if latencies else None
-                p99_latency = latencies[int(len(latencies) * 0.99) - 1] if len(latencies) >= 100 else latencies[-1]
-            else:
-                average_latency, median_latency, p99_latency = None, None, None
-
-            return {
-                "total_requests": total_requests,
-                "successful_requests": total_success,
-                "failed_requests": total_failed,
-                "uptime": round((total_success / total_requests) * 100, self.PRECISION) if total_requests else 0,
-                "average_latency": round(average_latency, self.PRECISION),
-                "median_latency": round(median_latency, self.PRECISION),
-                "p99_latency": round(p99_latency, self.PRECISION)
-            }
-        except Exception as e:
-            logging.error(f"Error while retrieving stats for all customers: {e}")
+    def _daily_aggregated_query(self, start_time: str, end_time: str, customer_id: str) -> str:
+        """_aggregated_query per (UTC) day, pivoted to one row per day with a column per stat."""
+        return """
+                daily = (tables=<-, fn) => tables
+                  |> aggregateWindow(every: 1d, fn: fn, timeSrc: "_start", createEmpty: false)
+
+                data = from(bucket: "{bucket}")
+                  |> range(start: {start_time}, stop: {end_time})
+                  |> filter(fn: (r) => r._measurement == "{measurement}" and r._field == "duration"
+                      and r.customer_id == "{customer_id}")
+
+                requests = data
+                  |> group(columns: ["success"])
+                  |> daily(fn: count)
+                  |> map(fn: (r) => ({{
+                      _time: r._time,
+                      stat: if r.success == "1" then "successful_requests" else "failed_requests",
+                      _value: float(v: r._value)
+                  }}))
+
+                latencies = data |> group()
+                average = latencies
+                  |> daily(fn: mean)
+                  |> map(fn: (r) => ({{_time: r._time, stat: "average_latency", _value: r._value}}))
+                median = latencies
+                  |> daily(fn: (column, tables=<-) =>
+                      tables |> quantile(q: 0.5, method: "exact_selector", column: column))
+                  |> map(fn: (r) => ({{_time: r._time, stat: "median_latency", _value: r._value}}))
+                p99 = latencies
+                  |> daily(fn: (column, tables=<-) =>
+                      tables |> quantile(q: 0.99, method: "exact_selector", column: column))
+                  |> map(fn: (r) => ({{_time: r._time, stat: "p99_latency", _value: r._value}}))
+
+                union(tables: [requests, average, median, p99])
+                  |> group()
+                  |> pivot(rowKey: ["_time"], columnKey: ["stat"], valueColumn: "_value")
+                  |> sort(columns: ["_time"])
+                """.format(bucket=self.bucket, start_time=start_time, end_time=end_time, customer_id=customer_id,
+                           measurement=self.measurement)
+
+    def _rollup_stats(self, records: Iterable) -> Optional[Dict[str, float]]:
+        totals = RollupTotals()
+        for record in records:
+            totals.add(record.values)
+        return self._rollup_totals_stats(totals)
+
+    def _rollup_totals_stats(self, totals: RollupTotals) -> Optional[Dict[str, float]]:
+        total_success, total_failed, sketch = totals.successful_requests, totals.failed_requests, totals.sketch
+        total_requests = total_success + total_failed
+        if not total_requests:
             return None
+
+        median_latency, p99_latency = sketch.values_at_ranks(
+            [quantile_rank(0.5, sketch.count), quantile_rank(0.99, sketch.count)]
+        )
+        return self._build_stats(
+            total_requests, total_success, total_failed, totals.duration_sum / total_requests,
+            median_latency, p99_latency
+        )
+
+    def _calculate_aggregated(self, _result) -> Optional[Dict[str, float]]:
+        stats = {}
+        for table in _result:
+            for record in table.records:
+                stats[record.values.get("stat")] = record.values.get("_value")
+        return self._aggregated_stats(stats)
+
+    def _calculate_aggregated_by(self, _result, column: str) -> Dict[str, Dict[str, float]]:
+        """_calculate_aggregated per value of the column a query was grouped by."""
+        stats = defaultdict(dict)
+        for table in _result:
+            for record in table.records:
+                stats[record.values.get(column)][record.values.get("stat")] = record.values.get("_value")
+        return self._calculate_each(stats, self._aggregated_stats)
+
+    def _aggregated_stats(self, stats: Dict[str, float]) -> Optional[Dict[str, float]]:
+        """Stats from the stat -> value pairs of the aggregation queries."""
+        total_success = int(stats.get("successful_requests") or 0)
+        total_failed = int(stats.get("failed_requests") or 0)
+        total_requests = total_success + total_failed
+        if not total_requests:
+            return None
+
+        return self._build_stats(
+            total_requests, total_success, total_failed,
+            stats.get("average_latency"), stats.get("median_latency"), stats.get("p99_latency")
+        )
+
+    @staticmethod
+    def _calculate_each(values: Dict, calculate: Callable) -> Dict[str, Dict[str, float]]:
+        """Applies calculate to the values of every key (customer id, path), leaving out keys without stats."""
+        stats = {}
+        for key, key_values in values.items():
+            key_stats = calculate(key_values)
+            if key_stats:
+                stats[key] = key_stats
+        return stats
+
+    def _build_stats(self, total_requests, total_success, total_failed,
+                     average_latency, median_latency, p99_latency) -> Dict[str, float]:
+        return {
+            "total_requests": total_requests,
+            "successful_requests": total_success,
+            "failed_requests": total_failed,
+            "uptime": round((total_success / total_requests) * 100, self.PRECISION) if total_requests else 0,
+            "average_latency": round(average_latency, self.PRECISION),
+            "median_latency": round(median_latency, self.PRECISION),
+            "p99_latency": round(p99_latency, self.PRECISION)
+        }
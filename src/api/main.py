@@ -1,16 +1,62 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 from customers import router as customers_router
+from influx_client import InfluxClient
+from metrics import REQUEST_SECONDS, StatsCacheCollector
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.influx_client = InfluxClient().open()
+    cache_collector = StatsCacheCollector(app.state.influx_client)
+    REGISTRY.register(cache_collector)
+    yield
+    REGISTRY.unregister(cache_collector)
+    app.state.influx_client.close()
 
-app = FastAPI(title="Customer Log Stats API", version="1.0.0")
+
+app = FastAPI(title="Customer Log Stats API", version="1.0.0", lifespan=lifespan)
 
 app.include_router(customers_router)
 
 
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # the route template, so /customers/{customer_id}/stats is one series and not one per customer
+    route = request.scope.get("route")
+    endpoint = route.path if route is not None else "unmatched"
+    REQUEST_SECONDS.labels(request.method, endpoint, response.status_code).observe(time.perf_counter() - started)
+    return response
+
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to LogStream2Influx ;)"}
 
 
+@app.get("/cache")
+def read_cache_counters(request: Request):
+    """Hits, misses and entries of the stats cache."""
+    return request.app.state.influx_client.cache.counters()
+
+
+@app.delete("/cache", status_code=204)
+def clear_cache(request: Request):
+    """Drops every cached stat, e.g. after backfilling days that were already cached."""
+    request.app.state.influx_client.cache.clear()
+
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Prometheus metrics: request latency per endpoint and the stats cache counters."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,25 @@
+"""Prometheus metrics of the API, served on /metrics."""
+from typing import Iterator
+
+from prometheus_client import Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+REQUEST_SECONDS = Histogram(
+    "api_request_seconds", "Request latency per endpoint, up to the start of the response body",
+    ["method", "endpoint", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+
+class StatsCacheCollector(Collector):
+    """Hits, misses and entries of the shared InfluxClient's stats cache, read on every scrape."""
+
+    def __init__(self, influx_client):
+        self.influx_client = influx_client
+
+    def collect(self) -> Iterator:
+        counters = self.influx_client.cache.counters()
+        yield CounterMetricFamily("api_stats_cache_hits", "Stats cache hits", value=counters["hits"])
+        yield CounterMetricFamily("api_stats_cache_misses", "Stats cache misses", value=counters["misses"])
+        yield GaugeMetricFamily("api_stats_cache_entries", "Stats cache entries", value=counters["entries"])
@@ -24,3 +24,27 @@ class CustomerStatsResponse(BaseModel):
             }
         }
 
+
+
+class DailyCustomerStatsResponse(CustomerStatsResponse):
+    date: str = Field(..., description="Day (UTC) the stats cover, in YYYY-MM-DD format")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "date": "2024-10-01",
+                **CustomerStatsResponse.Config.json_schema_extra["example"]
+            }
+        }
+
+
+class PathStatsResponse(CustomerStatsResponse):
+    error_rate: Optional[float] = Field(None, description="Failed requests percentage")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                **CustomerStatsResponse.Config.json_schema_extra["example"],
+                "error_rate": 10.0
+            }
+        }
@@ -1,3 +1,4 @@
+import json
 import unittest
 from unittest.mock import patch
 from fastapi.testclient import TestClient
@@ -8,7 +9,10 @@ import logging
 class TestCustomerAPI(unittest.TestCase):
     def setUp(self):
         logging.disable(logging.CRITICAL)
+        # entering the client runs the app lifespan, which creates the shared influx client
         self.client = TestClient(app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
         self.mock_stats_response = {
             "total_requests": 10,
             "successful_requests": 6,
@@ -80,6 +84,108 @@ class TestCustomerAPI(unittest.TestCase):
             "p99_latency": None
         })
 
+    @patch('influx_client.InfluxClient.get_stats')
+    def test_influx_client_is_shared_across_requests(self, mock_get_stats):
+        mock_get_stats.return_value = self.mock_stats_response
+        shared_client = app.state.influx_client
+
+        self.client.get("/customers/cust_1/stats?from_date=2024-10-01")
+        self.client.get("/customers/cust_2/stats?from_date=2024-10-01")
+
+        self.assertIs(app.state.influx_client, shared_client)
+        self.assertEqual(mock_get_stats.call_count, 2)
+
+    @patch('influx_client.InfluxClient.get_bulk_stats')
+    def test_get_bulk_customer_stats_returns_stats_by_customer(self, mock_get_bulk_stats):
+        mock_get_bulk_stats.return_value = {"cust_1": self.mock_stats_response, "cust_2": self.mock_stats_response}
+
+        response = self.client.get("/customers/stats?from_date=2024-10-01&customer_id=cust_1&customer_id=cust_2")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), mock_get_bulk_stats.return_value)
+        mock_get_bulk_stats.assert_called_once_with(["cust_1", "cust_2"], "2024-10-01")
+
+    @patch('influx_client.InfluxClient.get_bulk_stats')
+    def test_get_bulk_customer_stats_of_every_customer_and_no_data(self, mock_get_bulk_stats):
+        mock_get_bulk_stats.return_value = None
+
+        response = self.client.get("/customers/stats?from_date=2024-10-01")
+
+        self.assertEqual(response.status_code, 404)
+        mock_get_bulk_stats.assert_called_once_with([], "2024-10-01")
+
+    @patch('influx_client.InfluxClient.get_path_stats')
+    def test_get_customer_path_stats(self, mock_get_path_stats):
+        path_stats = {**self.mock_stats_response, "error_rate": 40.0}
+        mock_get_path_stats.return_value = {"/api/v1/resource1": path_stats}
+
+        response = self.client.get("/customers/cust_1/stats/paths?from_date=2024-10-01")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"/api/v1/resource1": path_stats})
+        mock_get_path_stats.assert_called_once_with("cust_1", "2024-10-01")
+
+        mock_get_path_stats.return_value = None
+        self.assertEqual(self.client.get("/customers/cust_1/stats/paths?from_date=2024-10-01").status_code, 404)
+
+    def test_cache_counters_and_invalidation(self):
+        app.state.influx_client.cache.set(("stats", "cust_1", "2024-10-01"), self.mock_stats_response, ttl=None)
+        app.state.influx_client.cache.get(("stats", "cust_1", "2024-10-01"))
+
+        self.assertEqual(self.client.get("/cache").json(), {"hits": 1, "misses": 0, "entries": 1})
+        self.assertEqual(self.client.delete("/cache").status_code, 204)
+        self.assertEqual(self.client.get("/cache").json()["entries"], 0)
+
+    @patch('influx_client.InfluxClient.get_stats')
+    def test_metrics_report_latency_per_endpoint_and_cache_counters(self, mock_get_stats):
+        mock_get_stats.return_value = self.mock_stats_response
+        self.client.get("/customers/cust_1/stats?from_date=2024-10-01")
+        self.client.get("/customers/cust_2/stats?from_date=2024-10-01")
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('api_request_seconds_count{endpoint="/customers/{customer_id}/stats",method="GET",status="200"}',
+                      response.text)
+        self.assertNotIn("cust_1", response.text)
+        self.assertIn("api_stats_cache_entries 0.0", response.text)
+
+    @patch('influx_client.InfluxClient.get_daily_stats')
+    def test_get_customer_daily_stats_streams_one_row_per_day(self, mock_get_daily_stats):
+        days = [{"date": f"2024-10-0{day}", **self.mock_stats_response} for day in (1, 2, 3)]
+        mock_get_daily_stats.return_value = iter(days)
+
+        response = self.client.get("/customers/cust_1/stats/daily?from_date=2024-10-01")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+        self.assertEqual([json.loads(line) for line in response.text.splitlines()], days)
+        mock_get_daily_stats.assert_called_once_with("cust_1", "2024-10-01")
+
+    @patch('influx_client.InfluxClient.get_daily_stats')
+    def test_get_customer_daily_stats_no_data_found(self, mock_get_daily_stats):
+        mock_get_daily_stats.return_value = iter([])
+
+        response = self.client.get("/customers/cust_1/stats/daily?from_date=2024-10-01")
+
+        self.assertEqual(response.status_code, 404)
+
+    @patch('influx_client.InfluxClient.get_daily_stats')
+    def test_get_customer_daily_stats_error_before_first_row(self, mock_get_daily_stats):
+        def failing_rows(*args):
+            raise Exception("query failed")
+            yield
+
+        mock_get_daily_stats.side_effect = failing_rows
+
+        response = self.client.get("/customers/cust_1/stats/daily?from_date=2024-10-01")
+
+        self.assertEqual(response.status_code, 500)
+
+    def test_get_customer_daily_stats_fails_on_passing_bad_date(self):
+        response = self.client.get("/customers/cust_1/stats/daily?from_date=01-01-2023")
+        self.assertEqual(response.status_code, 422)
+
 
 if __name__ == '__main__':
     unittest.main()
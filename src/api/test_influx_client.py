@@ -0,0 +1,435 @@
+import io
+import random
+import unittest
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import MagicMock
+import numpy as np
+from influxdb_client.client.flux_table import FluxTable, FluxRecord
+from config import STATS_CACHE_CLOSED_TTL_SECONDS, STATS_CACHE_OPEN_DAYS
+from influx_client import InfluxClient, RollupTotals
+from quantile_sketch import QuantileSketch, quantile_rank
+from stats_cache import StatsCache
+import logging
+
+
+def make_result(rows):
+    table = FluxTable()
+    table.records = [FluxRecord(table=0, values=row) for row in rows]
+    return [table]
+
+
+def make_csv(success, durations, customer_ids=None):
+    """The raw response of a durations query, with a customer_id column when `customer_ids` are given."""
+    if not durations:
+        return io.BytesIO(b"\r\n")
+    if customer_ids is None:
+        lines = [",result,table,success,_value"]
+        lines += [f",_result,0,{flag},{duration}" for flag, duration in zip(success, durations)]
+    else:
+        lines = [",result,table,customer_id,success,_value"]
+        lines += [f",_result,0,{customer_id},{flag},{duration}"
+                  for customer_id, flag, duration in zip(customer_ids, success, durations)]
+    return io.BytesIO(("\r\n".join(lines) + "\r\n\r\n").encode())
+
+
+class TestInfluxClient(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.aggregated_rows = [
+            {"stat": "successful_requests", "_value": 3.0},
+            {"stat": "failed_requests", "_value": 2.0},
+            {"stat": "average_latency", "_value": 0.84},
+            {"stat": "median_latency", "_value": 0.7},
+            {"stat": "p99_latency", "_value": 1.5},
+        ]
+        self.raw_csv = lambda: make_csv((1, 1, 0, 0, 1), (0.5, 0.6, 0.9, 0.7, 1.5))
+        # the stats of the raw points above
+        self.raw_stats = {
+            "total_requests": 5,
+            "successful_requests": 3,
+            "failed_requests": 2,
+            "uptime": 60.0,
+            "average_latency": 0.84,
+            "median_latency": 0.7,
+            "p99_latency": 1.5
+        }
+
+    def test_calculate_aggregated_builds_stats_from_server_side_rows(self):
+        stats = InfluxClient()._calculate_aggregated(make_result(self.aggregated_rows))
+
+        self.assertEqual(stats, self.raw_stats)
+
+    def test_calculate_aggregated_matches_client_side_calculation(self):
+        client = InfluxClient()
+        client.reader_client = MagicMock()
+        client.reader_client.query_raw.return_value = self.raw_csv()
+
+        self.assertEqual(
+            client._calculate_aggregated(make_result(self.aggregated_rows)),
+            client._calculate_durations(*client._read_durations("start", "stop", "cust_1"))
+        )
+
+    def test_calculate_aggregated_returns_none_without_requests(self):
+        self.assertIsNone(InfluxClient()._calculate_aggregated(make_result([])))
+
+    def test_server_mode_falls_back_to_client_side_calculation_on_query_error(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.SERVER_MODE)
+        client.reader_client = MagicMock()
+        client.reader_client.query.side_effect = Exception("unsupported")
+        client.reader_client.query_raw.return_value = self.raw_csv()
+
+        stats = client.get_stats("cust_1", "2024-09-29")
+
+        client.reader_client.query.assert_called_once()
+        client.reader_client.query_raw.assert_called_once()
+        self.assertEqual(stats["total_requests"], 5)
+        self.assertEqual(stats["p99_latency"], 1.5)
+
+    def test_client_mode_only_queries_raw_points(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.CLIENT_MODE)
+        client.reader_client = MagicMock()
+        client.reader_client.query_raw.return_value = self.raw_csv()
+
+        stats = client.get_stats("cust_1", "2024-09-29")
+
+        client.reader_client.query.assert_not_called()
+        client.reader_client.query_raw.assert_called_once()
+        self.assertNotIn("quantile", client.reader_client.query_raw.call_args.kwargs["query"])
+        self.assertEqual(stats, self.raw_stats)
+
+    def test_path_stats_are_grouped_by_path_in_one_query(self):
+        for schema_mode, pivot in (("legacy", True), ("tagged", False)):
+            client = InfluxClient(aggregation_mode=InfluxClient.ROLLUP_MODE, schema_mode=schema_mode)
+            client.reader_client = MagicMock()
+            rows = [{"path": path, **row} for path in ("/api/v1/resource1", "/api/v1/resource2")
+                    for row in self.aggregated_rows]
+            client.reader_client.query.return_value = make_result(rows)
+
+            stats = client.get_path_stats("cust_1", "2024-09-29")
+
+            expected = {**client._calculate_aggregated(make_result(self.aggregated_rows)), "error_rate": 40.0}
+            self.assertEqual(stats, {"/api/v1/resource1": expected, "/api/v1/resource2": expected})
+            query = client.reader_client.query.call_args.kwargs["query"]
+            client.reader_client.query.assert_called_once()
+            self.assertIn('group(columns: ["path", "success"])', query)
+            self.assertEqual("pivot(" in query, pivot, schema_mode)
+
+    def test_tagged_schema_queries_its_measurement_and_counts_success_tags(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.SERVER_MODE, schema_mode="tagged")
+
+        for query in (client._durations_query("start", "stop", "cust_1", by_customer=True),
+                      client._durations_query("start", "stop"),
+                      client._aggregated_query("start", "stop"), client._daily_aggregated_query("start", "stop", "c")):
+            self.assertIn('r._measurement == "api_requests_tagged"', query)
+        self.assertIn('keep(columns: ["success", "_value"])', client._durations_query("start", "stop"))
+
+    def test_vectorized_calculation_matches_sorting_the_durations(self):
+        client = InfluxClient()
+        rng = random.Random(7)
+        for count in (1, 99, 100, 1001):
+            durations = [round(rng.lognormvariate(-1.6, 0.6), 3) for _ in range(count)]
+            success = [rng.choice((1, 0, 0)) for _ in range(count)]
+            client.reader_client = MagicMock()
+            client.reader_client.query_raw.return_value = make_csv(success, durations)
+
+            vectorized = client._calculate_durations(*client._read_durations("start", "stop", "cust_1"))
+
+            ordered = sorted(durations)
+            self.assertEqual(vectorized, client._build_stats(
+                count, sum(success), count - sum(success), sum(durations) / count,
+                ordered[quantile_rank(0.5, count)], ordered[quantile_rank(0.99, count)]
+            ), count)
+
+        client.reader_client.query_raw.return_value = make_csv([], [])
+        self.assertIsNone(client._calculate_durations(*client._read_durations("start", "stop", "cust_1")))
+
+
+    def rollup_rows(self):
+        days = [(0.5, 0.6), (0.9, 0.7, 1.5)]
+        successful = [(1, 1), (0, 0, 1)]
+        rows = []
+        for durations, success in zip(days, successful):
+            sketch = QuantileSketch()
+            for duration in durations:
+                sketch.add(duration)
+            rows.append({
+                "successful_requests": sum(success), "failed_requests": len(success) - sum(success),
+                "duration_sum": sum(durations), "duration_sketch": sketch.to_string()
+            })
+        return rows
+
+    def test_rollup_stats_merge_days_within_sketch_accuracy(self):
+        client = InfluxClient()
+        records = make_result(self.rollup_rows())[0].records
+        totals = RollupTotals()
+        for record in records:
+            totals.add(record.values)
+
+        for stats in (client._rollup_stats(records), client._rollup_totals_stats(totals)):
+            for stat in ("total_requests", "successful_requests", "failed_requests", "uptime", "average_latency"):
+                self.assertEqual(stats[stat], self.raw_stats[stat], stat)
+            for stat in ("median_latency", "p99_latency"):
+                self.assertAlmostEqual(stats[stat], self.raw_stats[stat],
+                                       delta=self.raw_stats[stat] * QuantileSketch.DEFAULT_RELATIVE_ACCURACY)
+
+    def test_rollup_mode_reads_rollups_and_falls_back_without_them(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.ROLLUP_MODE)
+        client.reader_client = MagicMock()
+        # the raw request count, then the closed days and the open days are read apart
+        client.reader_client.query.side_effect = [
+            make_result([{"_value": 5}]), make_result(self.rollup_rows()), make_result([])
+        ]
+
+        self.assertEqual(client.get_stats("cust_1", "2024-09-29")["total_requests"], 5)
+        queries = [call.kwargs["query"] for call in client.reader_client.query.call_args_list]
+        self.assertIn("count()", queries[0])
+        self.assertIn("api_requests_daily", queries[2])
+
+        client.cache.clear()
+        client.reader_client.query.side_effect = [
+            make_result([{"_value": 5}]), make_result([]), make_result([]), make_result(self.aggregated_rows)
+        ]
+        self.assertEqual(client.get_stats("cust_1", "2024-09-29")["median_latency"], 0.7)
+
+    def test_rollup_mode_aggregates_raw_points_the_rollups_miss(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.ROLLUP_MODE)
+        client.reader_client = MagicMock()
+        # a late line of a closed day is in the raw points but not in the rollups
+        client.reader_client.query.side_effect = [
+            make_result([{"_value": 6}]), make_result(self.rollup_rows()), make_result([]),
+            make_result(self.aggregated_rows)
+        ]
+
+        self.assertEqual(client.get_stats("cust_1", "2024-09-29"),
+                         client._calculate_aggregated(make_result(self.aggregated_rows)))
+        self.assertIn("exact_selector", client.reader_client.query.call_args.kwargs["query"])
+
+
+    def test_stats_are_cached_but_missing_stats_are_not(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.CLIENT_MODE)
+        client.reader_client = MagicMock()
+        client.reader_client.query_raw.side_effect = [make_csv([], []), self.raw_csv()]
+
+        self.assertIsNone(client.get_stats("cust_1", "2024-09-29"))
+        self.assertEqual(client.get_stats("cust_1", "2024-09-29")["total_requests"], 5)
+        self.assertEqual(client.get_stats("cust_1", "2024-09-29")["total_requests"], 5)
+
+        self.assertEqual(client.reader_client.query_raw.call_count, 2)
+        self.assertEqual(client.cache.counters(), {"hits": 1, "misses": 2, "entries": 1})
+
+    def test_rollups_of_closed_days_are_cached_and_open_days_read_again(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.ROLLUP_MODE)
+        client.reader_client = MagicMock()
+        closed, open_days = self.rollup_rows()
+        client.reader_client.query.side_effect = [
+            make_result([closed]), make_result([open_days]), make_result([open_days, open_days])
+        ]
+        start_time, end_time = InfluxClient.get_start_end_times(
+            (date.today() - timedelta(days=STATS_CACHE_OPEN_DAYS + 10)).isoformat()
+        )
+
+        first = client._rollup_range_totals(start_time, end_time, "cust_1")[None]
+        second = client._rollup_range_totals(start_time, end_time, "cust_1")[None]
+
+        self.assertEqual((first.successful_requests + first.failed_requests,
+                          second.successful_requests + second.failed_requests), (5, 8))
+        queries = [call.kwargs["query"] for call in client.reader_client.query.call_args_list]
+        self.assertEqual(len(queries), 3)
+        open_from = (datetime.now(timezone.utc).date() - timedelta(days=STATS_CACHE_OPEN_DAYS - 1)).isoformat()
+        self.assertIn(f"stop: {open_from}T00:00:00Z", queries[0])
+        self.assertIn(f"start: {open_from}T00:00:00Z", queries[1])
+        self.assertEqual(queries[1], queries[2])
+
+    def test_rollups_of_closed_days_expire_after_the_closed_ttl(self):
+        now = [0.0]
+        client = InfluxClient(aggregation_mode=InfluxClient.ROLLUP_MODE)
+        client.cache = StatsCache(8, clock=lambda: now[0])
+        client.reader_client = MagicMock()
+        closed, open_days = self.rollup_rows()
+        client.reader_client.query.side_effect = [
+            make_result([closed]), make_result([open_days]), make_result([closed, closed]), make_result([open_days])
+        ]
+        start_time, end_time = InfluxClient.get_start_end_times(
+            (date.today() - timedelta(days=STATS_CACHE_OPEN_DAYS + 10)).isoformat()
+        )
+
+        first = client._rollup_range_totals(start_time, end_time, "cust_1")[None]
+        now[0] += STATS_CACHE_CLOSED_TTL_SECONDS + 1
+        late = client._rollup_range_totals(start_time, end_time, "cust_1")[None]
+
+        self.assertEqual(client.reader_client.query.call_count, 4)
+        self.assertEqual((first.successful_requests + first.failed_requests,
+                          late.successful_requests + late.failed_requests), (5, 7))
+
+    def test_bulk_stats_are_grouped_by_customer_in_one_query(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.SERVER_MODE)
+        client.reader_client = MagicMock()
+        rows = [{"customer_id": customer_id, **row} for customer_id in ("cust_1", "cust_2") for row in self.aggregated_rows]
+        client.reader_client.query.return_value = make_result(rows)
+
+        stats = client.get_bulk_stats(["cust_2", "cust_1", "cust_2"], "2024-09-29")
+
+        expected = client._calculate_aggregated(make_result(self.aggregated_rows))
+        self.assertEqual(stats, {"cust_1": expected, "cust_2": expected})
+        client.reader_client.query.assert_called_once()
+        query = client.reader_client.query.call_args.kwargs["query"]
+        self.assertIn('(r.customer_id == "cust_1" or r.customer_id == "cust_2")', query)
+        self.assertIn('group(columns: ["customer_id", "success"])', query)
+
+    def test_bulk_stats_from_rollups_and_raw_points(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.ROLLUP_MODE)
+        client.reader_client = MagicMock()
+        rollups = [{"customer_id": "cust_1", **row} for row in self.rollup_rows()]
+        rollups[1]["customer_id"] = "cust_2"
+        counts = [{"customer_id": "cust_1", "_value": 2}, {"customer_id": "cust_2", "_value": 3}]
+        client.reader_client.query.side_effect = [make_result(counts), make_result(rollups), make_result([])]
+
+        stats = client.get_bulk_stats([], "2024-09-29")
+
+        self.assertEqual({customer: row["total_requests"] for customer, row in stats.items()}, {"cust_1": 2, "cust_2": 3})
+        self.assertNotIn("r.customer_id ==", client.reader_client.query.call_args.kwargs["query"])
+        self.assertEqual(client.reader_client.query.call_count, 3)
+
+        client = InfluxClient(aggregation_mode=InfluxClient.CLIENT_MODE)
+        client.reader_client = MagicMock()
+        client.reader_client.query_raw.return_value = make_csv((1, 1, 0, 0, 1), (0.5, 0.6, 0.9, 0.7, 1.5),
+                                                               ["cust_1"] * 5)
+
+        self.assertEqual(client.get_bulk_stats(["cust_1"], "2024-09-29"),
+                         {"cust_1": self.raw_stats})
+        client.reader_client.query.assert_not_called()
+        self.assertIn('keep(columns: ["customer_id", "success", "_value"])',
+                      client.reader_client.query_raw.call_args.kwargs["query"])
+
+    def test_bulk_stats_aggregate_the_customers_the_rollups_miss(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.ROLLUP_MODE)
+        client.reader_client = MagicMock()
+        rollups = [{"customer_id": "cust_1", **row} for row in self.rollup_rows()]
+        rollups[1]["customer_id"] = "cust_2"
+        counts = [{"customer_id": "cust_1", "_value": 2}, {"customer_id": "cust_2", "_value": 4},
+                  {"customer_id": "cust_3", "_value": 5}]
+        aggregated = [{"customer_id": customer_id, **row} for customer_id in ("cust_2", "cust_3")
+                      for row in self.aggregated_rows]
+        client.reader_client.query.side_effect = [
+            make_result(counts), make_result(rollups), make_result([]), make_result(aggregated)
+        ]
+
+        stats = client.get_bulk_stats(["cust_1", "cust_2", "cust_3"], "2024-09-29")
+
+        expected = client._calculate_aggregated(make_result(self.aggregated_rows))
+        self.assertEqual(stats["cust_1"]["total_requests"], 2)
+        self.assertEqual((stats["cust_2"], stats["cust_3"]), (expected, expected))
+        self.assertIn('(r.customer_id == "cust_2" or r.customer_id == "cust_3")',
+                      client.reader_client.query.call_args.kwargs["query"])
+
+    def test_client_side_ranks_are_the_ranks_of_flux_exact_selector(self):
+        client = InfluxClient()
+        rng = random.Random(3)
+        for count in (2, 4, 100, 150, 1000):
+            durations = [rng.randint(1, 2000) / 1000 for _ in range(count)]
+            ordered = sorted(durations)
+
+            def exact_selector(q):
+                # what Flux quantile(method: "exact_selector") returns: the smallest value with at least q * count
+                # values at or below it
+                return next(value for value in ordered if sum(d <= value for d in ordered) >= q * count)
+
+            stats = client._calculate_durations(np.ones(count), np.array(durations))
+            self.assertEqual((stats["median_latency"], stats["p99_latency"]),
+                             (exact_selector(0.5), exact_selector(0.99)), count)
+
+        # an even sample takes the lower of the two middle values
+        stats = client._calculate_durations(np.ones(4), np.array([0.4, 0.1, 0.3, 0.2]))
+        self.assertEqual((stats["median_latency"], stats["p99_latency"]), (0.2, 0.4))
+
+    def test_client_mode_bulk_stats_match_the_stats_of_each_customer(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.CLIENT_MODE)
+        client.reader_client = MagicMock()
+        rng = random.Random(11)
+        customer_ids = [rng.choice(("cust_1", "cust_2", '"cust,3"')) for _ in range(500)]
+        success = [rng.choice((0, 1)) for _ in customer_ids]
+        durations = [round(rng.lognormvariate(-1.6, 0.6), 3) for _ in customer_ids]
+        client.reader_client.query_raw.return_value = make_csv(success, durations, customer_ids)
+
+        stats = client.get_bulk_stats([], "2024-09-29")
+
+        self.assertEqual(set(stats), {"cust_1", "cust_2", "cust,3"})
+        for customer_id, customer_stats in stats.items():
+            rows = [(flag, duration) for quoted, flag, duration in zip(customer_ids, success, durations)
+                    if quoted.strip('"') == customer_id]
+            self.assertEqual(customer_stats, client._calculate_durations(*map(np.array, zip(*rows))), customer_id)
+
+        client.reader_client.query_raw.return_value = make_csv([], [])
+        client.cache.clear()
+        self.assertIsNone(client.get_bulk_stats([], "2024-09-29"))
+
+    def test_daily_stats_stream_one_row_per_rollup_day(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.ROLLUP_MODE)
+        client.reader_client = MagicMock()
+        rows = self.rollup_rows()
+        for day, row in zip((14, 15), rows):
+            row["_time"] = datetime(2024, 9, day, tzinfo=timezone.utc)
+        client.reader_client.query.return_value = make_result(
+            [{"_time": row["_time"], "_value": total} for row, total in zip(rows, (2, 3))]
+        )
+        client.reader_client.query_stream.return_value = iter(make_result(rows)[0].records)
+
+        days = list(client.get_daily_stats("cust_1", "2024-09-14"))
+
+        self.assertEqual([day["date"] for day in days], ["2024-09-14", "2024-09-15"])
+        self.assertEqual([day["total_requests"] for day in days], [2, 3])
+        self.assertEqual(days[0]["uptime"], 100.0)
+        client.reader_client.query_stream.assert_called_once()
+
+    def test_daily_stats_aggregate_the_days_the_rollups_miss(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.ROLLUP_MODE)
+        client.reader_client = MagicMock()
+        rows = self.rollup_rows()
+        for day, row in zip((14, 16), rows):
+            row["_time"] = datetime(2024, 9, day, tzinfo=timezone.utc)
+        aggregated = {row["stat"]: row["_value"] for row in self.aggregated_rows}
+        late = [{**aggregated, "_time": datetime(2024, 9, day, tzinfo=timezone.utc)} for day in (15, 16)]
+        # the 15th has no rollup, the rollup of the 16th misses a late line
+        client.reader_client.query.return_value = make_result(
+            [{"_time": datetime(2024, 9, day, tzinfo=timezone.utc), "_value": total} for day, total in
+             ((14, 2), (15, 5), (16, 4))]
+        )
+        client.reader_client.query_stream.side_effect = [
+            iter(make_result(rows)[0].records), iter(make_result(late)[0].records)
+        ]
+
+        days = list(client.get_daily_stats("cust_1", "2024-09-14"))
+
+        expected = client._calculate_aggregated(make_result(self.aggregated_rows))
+        self.assertEqual([day["date"] for day in days], ["2024-09-14", "2024-09-15", "2024-09-16"])
+        self.assertEqual(days[0]["total_requests"], 2)
+        self.assertEqual(days[1:], [{"date": "2024-09-15", **expected}, {"date": "2024-09-16", **expected}])
+
+    def test_daily_stats_fall_back_to_daily_aggregation_without_rollups(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.ROLLUP_MODE)
+        client.reader_client = MagicMock()
+        aggregated = {row["stat"]: row["_value"] for row in self.aggregated_rows}
+        aggregated["_time"] = datetime(2024, 9, 14, tzinfo=timezone.utc)
+        client.reader_client.query.return_value = make_result([{"_time": aggregated["_time"], "_value": 5}])
+        client.reader_client.query_stream.side_effect = [iter([]), iter(make_result([aggregated])[0].records)]
+
+        days = list(client.get_daily_stats("cust_1", "2024-09-14"))
+
+        self.assertEqual(days, [{"date": "2024-09-14", **client._calculate_aggregated(make_result(self.aggregated_rows))}])
+        self.assertIn("aggregateWindow", client.reader_client.query_stream.call_args.kwargs["query"])
+
+    def test_client_mode_daily_stats_query_one_day_at_a_time(self):
+        client = InfluxClient(aggregation_mode=InfluxClient.CLIENT_MODE)
+        client.reader_client = MagicMock()
+        client.reader_client.query_raw.side_effect = [make_csv([], []), self.raw_csv(), make_csv([], [])]
+        start = (date.today() - timedelta(days=2)).isoformat()
+
+        days = list(client.get_daily_stats("cust_1", start))
+
+        self.assertEqual(client.reader_client.query_raw.call_count, 3)
+        self.assertEqual(days, [{"date": (date.today() - timedelta(days=1)).isoformat(),
+                                 **self.raw_stats}])
+
+
+if __name__ == '__main__':
+    unittest.main()
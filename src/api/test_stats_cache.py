@@ -0,0 +1,57 @@
+import unittest
+from stats_cache import StatsCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStatsCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = StatsCache(max_entries=2, clock=self.clock)
+
+    def test_entries_expire_after_their_ttl(self):
+        self.cache.set("today", 1, ttl=5)
+        self.cache.set("closed", 2, ttl=None)
+
+        self.clock.now = 4.9
+        self.assertEqual((self.cache.get("today"), self.cache.get("closed")), (1, 2))
+        self.clock.now = 1_000_000
+        self.assertEqual((self.cache.get("today"), self.cache.get("closed")), (None, 2))
+        self.assertEqual(self.cache.counters(), {"hits": 3, "misses": 1, "entries": 1})
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set("a", 1, ttl=None)
+        self.cache.set("b", 2, ttl=None)
+        self.cache.get("a")
+        self.cache.set("c", 3, ttl=None)
+
+        self.assertEqual([self.cache.get(key) for key in "abc"], [1, None, 3])
+
+    def test_get_or_compute_only_computes_misses_and_skips_empty_results(self):
+        computed = []
+
+        def compute():
+            computed.append(1)
+            return len(computed) if len(computed) > 1 else None
+
+        self.assertIsNone(self.cache.get_or_compute("key", compute, ttl=5))
+        self.assertEqual(self.cache.get_or_compute("key", compute, ttl=5), 2)
+        self.assertEqual(self.cache.get_or_compute("key", compute, ttl=5), 2)
+        self.assertEqual(len(computed), 2)
+
+    def test_zero_ttl_and_clear(self):
+        self.cache.set("off", 1, ttl=0)
+        self.cache.set("on", 1, ttl=None)
+        self.cache.clear()
+
+        self.assertEqual((self.cache.get("off"), self.cache.get("on")), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
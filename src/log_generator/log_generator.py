@@ -4,6 +4,63 @@ import datetime
 import time
 import logging
 
+import numpy as np
+
+GENERATOR_MODE_CLASSIC = "classic"
+GENERATOR_MODE_FAST = "fast"
+# lines formatted per vectorized chunk in fast mode, this bounds its memory whatever the batch size or max logs are
+FAST_CHUNK_LINES = 100_000
+
+# Workload profiles of the fast mode. uniform is what the classic mode generates. production has a few hot customers
+# (Zipf), heavy tailed durations, a baseline of errors with bursts of 500s and timestamps of the time a line is written.
+# backfill is production with timestamps increasing over the past LOG_WORKLOAD_BACKFILL_DAYS instead.
+# error_rate < 0 picks the status codes uniformly.
+WORKLOAD_PROFILES = {
+    "uniform": {
+        "customers": 50, "customer_distribution": "uniform", "zipf_exponent": 1.1,
+        "durations": "uniform", "duration_median": 0.2, "duration_sigma": 1.0, "duration_minimum": 0.05,
+        "pareto_alpha": 1.5, "error_rate": -1.0, "burst_fraction": 0.0, "burst_seconds": 60,
+        "burst_error_rate": 0.5, "timestamps": "random", "backfill_days": 30,
+    },
+}
+WORKLOAD_PROFILES["production"] = dict(
+    WORKLOAD_PROFILES["uniform"], customers=5000, customer_distribution="zipf", durations="lognormal",
+    error_rate=0.02, burst_fraction=0.05, timestamps="live",
+)
+WORKLOAD_PROFILES["backfill"] = dict(WORKLOAD_PROFILES["production"], timestamps="backfill")
+
+
+def _byte_table(values):
+    """
+    The values as a uint8 matrix with one row per value, right aligned and padded on the left to the longest one, and
+    the padding of each row.
+    """
+    values = [value.encode() for value in values]
+    width = max(len(value) for value in values)
+    table = np.frombuffer(b"".join(value.rjust(width) for value in values), dtype=np.uint8).reshape(len(values), width)
+    return table, np.array([width - len(value) for value in values])
+
+
+def _pack(columns):
+    """
+    Joins byte matrices column wise and then row by row, leaving out the padding: each column is (matrix, padding)
+    with the bytes of a line right aligned in its row after `padding` bytes, padding None means the whole row is used.
+    """
+    lines = np.hstack([matrix for matrix, _ in columns])
+    keep = np.hstack([np.ones(matrix.shape, dtype=bool) if padding is None
+                      else np.arange(matrix.shape[1]) >= padding[:, None] for matrix, padding in columns])
+    return lines[keep].tobytes()
+
+
+def _unit_hash(values):
+    """A fixed pseudo random number in [0, 1) per integer (splitmix64), the same for the same value in every batch."""
+    x = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
 class LogGenerator:
     def __init__(self):
         # Load environment variables and parameters
@@ -11,13 +68,19 @@ class LogGenerator:
         self.log_interval_seconds = int(os.getenv("LOG_INTERVAL_SECONDS"))
         self.log_file_path = os.getenv("LOG_FILE_PATH", "api_requests.log")
         self.max_logs = int(os.getenv("MAX_LOGS_TO_GENERATE"))  # Stop after max number of logs
+        self.mode = os.getenv("LOG_GENERATOR_MODE", GENERATOR_MODE_CLASSIC)  # classic or fast (numpy, 1M+ lines/s)
 
         # Log Data initialization
         random.seed(42)  # Set seed for reproducibility
-        self.customer_ids = [f"cust_{i}" for i in range(1, 51)]
+        self.workload = self._load_workload()
+        self.customer_ids = [f"cust_{i}" for i in range(1, self.workload["customers"] + 1)]
         self.request_paths = ["/api/v1/resource1", "/api/v1/resource2", "/api/v1/resource3", "/api/v1/resource4"]
         self.status_codes = [200, 201, 400, 401, 403, 404, 500]
-        self.durations = [random.uniform(0.1, 2.0) for _ in range(self.max_logs)]
+        if self.mode == GENERATOR_MODE_FAST:
+            self.rng = np.random.default_rng(42)
+            self._build_fast_tables()
+        else:
+            self.durations = [random.uniform(0.1, 2.0) for _ in range(self.max_logs)]
 
         # Logging
         self.configure_logging()
@@ -28,7 +91,7 @@ class LogGenerator:
             level=logging.INFO,
             format='%(asctime)s %(levelname)s: %(message)s',
             handlers=[
-                logging.FileHandler('log_generator.log'),
+                logging.FileHandler('log_generator.log', delay=True),
                 logging.StreamHandler()
             ]
         )
@@ -49,6 +112,134 @@ class LogGenerator:
         duration = f"{random.choice(self.durations):.3f}"
         return f"{timestamp} {customer_id} {request_path} {status_code} {duration}\n"
 
+    def _load_workload(self):
+        """
+        The settings of LOG_WORKLOAD_PROFILE, each of them can be overridden by its LOG_WORKLOAD_<NAME> env var
+        (LOG_WORKLOAD_CUSTOMERS=10000, LOG_WORKLOAD_DURATIONS=pareto...).
+        """
+        profile = self.workload_profile = os.getenv("LOG_WORKLOAD_PROFILE", "uniform")
+        if profile not in WORKLOAD_PROFILES:
+            raise ValueError(f"Unknown LOG_WORKLOAD_PROFILE {profile!r}, expected {', '.join(WORKLOAD_PROFILES)}")
+        if profile != "uniform" and self.mode != GENERATOR_MODE_FAST:
+            raise ValueError(f"LOG_WORKLOAD_PROFILE={profile} needs LOG_GENERATOR_MODE={GENERATOR_MODE_FAST}")
+        workload = {}
+        for name, default in WORKLOAD_PROFILES[profile].items():
+            value = os.getenv(f"LOG_WORKLOAD_{name.upper()}")
+            workload[name] = default if not value else type(default)(value)
+        return workload
+
+    def _build_fast_tables(self):
+        """
+        The customer ids and `path status ` parts as byte matrices, one padded row per value. generate_log_batch()
+        gathers rows of them by index and drops the padding at the end.
+        """
+        workload = self.workload
+        self.customer_table = _byte_table(f"{customer_id} " for customer_id in self.customer_ids)
+        self.request_table = _byte_table(f"{path} {status} " for path in self.request_paths
+                                         for status in self.status_codes)
+        self.success_statuses = np.array([i for i, status in enumerate(self.status_codes) if status < 400])
+        self.error_statuses = np.array([i for i, status in enumerate(self.status_codes) if status >= 400])
+        self.burst_status = self.status_codes.index(500)
+        if workload["customer_distribution"] == "zipf":
+            # customer i (cust_1 first) is picked with a probability proportional to 1 / i ** exponent
+            weights = 1.0 / np.arange(1, len(self.customer_ids) + 1) ** workload["zipf_exponent"]
+            self.customer_cdf = np.cumsum(weights) / weights.sum()
+        self.epoch = datetime.datetime(1970, 1, 1)
+        # backfill spreads MAX_LOGS_TO_GENERATE lines evenly over the window ending when the generator started
+        self.backfill_start = self._seconds(datetime.datetime.now()) - workload["backfill_days"] * 86400
+        self.lines_generated = 0
+
+    def _seconds(self, moment):
+        """Local wall clock time as seconds since 1970-01-01, the lines carry no timezone either."""
+        return int((moment - self.epoch).total_seconds())
+
+    def _timestamps(self, size):
+        timestamps = self.workload["timestamps"]
+        now = self._seconds(datetime.datetime.now())
+        if timestamps == "live":
+            return np.full(size, now, dtype=np.int64)
+        if timestamps == "backfill":
+            window = self.workload["backfill_days"] * 86400
+            lines = np.arange(self.lines_generated, self.lines_generated + size, dtype=np.int64)
+            return self.backfill_start + lines * window // max(self.max_logs, 1)
+        # random: within the past 30 days like generate_timestamp()
+        past_days = 30
+        return now - past_days * 86400 + self.rng.integers(0, past_days * 24 * 60 * 60, size, endpoint=True)
+
+    def _customers(self, size):
+        if self.workload["customer_distribution"] == "zipf":
+            return np.minimum(np.searchsorted(self.customer_cdf, self.rng.random(size)), len(self.customer_ids) - 1)
+        return self.rng.integers(0, len(self.customer_ids), size)
+
+    def _statuses(self, size, timestamps):
+        """Indexes into status_codes. A burst hits whole LOG_WORKLOAD_BURST_SECONDS windows and fails with 500s."""
+        workload = self.workload
+        if workload["error_rate"] < 0:
+            return self.rng.integers(0, len(self.status_codes), size)
+        in_burst = _unit_hash(timestamps // workload["burst_seconds"]) < workload["burst_fraction"]
+        error_rate = np.where(in_burst, workload["burst_error_rate"], workload["error_rate"])
+        failed = self.rng.random(size) < error_rate
+        statuses = np.where(failed, self.rng.choice(self.error_statuses, size),
+                            self.rng.choice(self.success_statuses, size))
+        return np.where(failed & in_burst, self.burst_status, statuses)
+
+    def _durations_ms(self, size):
+        workload = self.workload
+        durations = workload["durations"]
+        if durations == "lognormal":
+            seconds = self.rng.lognormal(np.log(workload["duration_median"]), workload["duration_sigma"], size)
+        elif durations == "pareto":
+            # numpy's pareto is the Lomax distribution, shifted by one it is Pareto with a minimum of duration_minimum
+            seconds = workload["duration_minimum"] * (1 + self.rng.pareto(workload["pareto_alpha"], size))
+        else:
+            seconds = self.rng.uniform(0.1, 2.0, size)
+        # at most three digits before the decimal point
+        return np.clip(np.rint(seconds * 1000), 1, 999_999).astype(np.int64)
+
+    def generate_log_batch(self, size):
+        """
+        `size` log lines like generate_log_entry() in one bytes object, drawn with numpy for the workload profile and
+        formatted as byte matrices (`YYYY-MM-DD HH:MM:SS `, `cust `, `path status `, `D.DDD\n` per row) instead of one
+        string per line.
+        """
+        timestamps = self._timestamps(size)
+        customers = self._customers(size)
+        requests = self.rng.integers(0, len(self.request_paths), size) * len(self.status_codes) \
+            + self._statuses(size, timestamps)
+        milliseconds = self._durations_ms(size)
+        self.lines_generated += size
+
+        # the dates come from a table of the days in this batch, the rest is integer arithmetic
+        days = timestamps // 86400
+        first_day = int(days.min())
+        dates = _byte_table((self.epoch + datetime.timedelta(days=day)).strftime("%Y-%m-%d ")
+                            for day in range(first_day, int(days.max()) + 1))[0]
+        times = np.empty((size, 20), dtype=np.uint8)
+        times[:, 0:11] = dates[days - first_day]
+        time_of_day = timestamps % 86400
+        for column, value in ((11, time_of_day // 3600), (14, time_of_day // 60 % 60), (17, time_of_day % 60)):
+            times[:, column] = 48 + value // 10
+            times[:, column + 1] = 48 + value % 10
+        times[:, [13, 16]] = ord(":")
+        times[:, 19] = ord(" ")
+
+        # up to 3 digits of whole seconds with the leading zeros dropped as padding, then `.DDD\n`
+        whole = milliseconds // 1000
+        durations = np.empty((size, 8), dtype=np.uint8)
+        for column, value in enumerate((whole // 100, whole // 10 % 10, whole % 10, None,
+                                        milliseconds // 100 % 10, milliseconds // 10 % 10, milliseconds % 10)):
+            durations[:, column] = ord(".") if value is None else 48 + value
+        durations[:, 7] = ord("\n")
+
+        customer_table, customer_padding = self.customer_table
+        request_table, request_padding = self.request_table
+        return _pack([
+            (times, None),
+            (customer_table[customers], customer_padding[customers]),
+            (request_table[requests], request_padding[requests]),
+            (durations, 2 - (whole >= 10) - (whole >= 100)),
+        ])
+
     def ingest_logs(self):
         """
         This function simulates a real life scenario where logs keep growing in a .log file.
@@ -59,6 +250,8 @@ class LogGenerator:
         total_logs_written = 0
 
         logging.info(f"Starting log generation with batch size {self.log_batch_size} and interval {self.log_interval_seconds}s")
+        if self.mode == GENERATOR_MODE_FAST:
+            return self.ingest_logs_fast()
 
         while total_logs_written < self.max_logs:
             with open(self.log_file_path, "a") as log_file:
@@ -74,6 +267,29 @@ class LogGenerator:
 
         logging.info("Log generation completed.")
 
+    def ingest_logs_fast(self):
+        """
+        ingest_logs() with lines from generate_log_batch(), written FAST_CHUNK_LINES at a time with one write call each.
+        Like ingest_logs() the file is opened again for every batch, so after logrotate renames it the next batch goes
+        to a new file at LOG_FILE_PATH. The interval is measured from the start of a batch, so LOG_BATCH_SIZE per
+        LOG_INTERVAL_SECONDS is the actual rate as long as generating a batch takes less than the interval.
+        """
+        logging.info(f"Workload profile {self.workload_profile}: {self.workload}")
+        total_logs_written = 0
+        while total_logs_written < self.max_logs:
+            started = time.monotonic()
+            batch_size = min(self.log_batch_size, self.max_logs - total_logs_written)
+            with open(self.log_file_path, "ab") as log_file:
+                for offset in range(0, batch_size, FAST_CHUNK_LINES):
+                    log_file.write(self.generate_log_batch(min(FAST_CHUNK_LINES, batch_size - offset)))
+            total_logs_written += batch_size
+
+            logging.info(f"Generated {batch_size} logs. Total logs written: {total_logs_written}")
+            if total_logs_written < self.max_logs:
+                time.sleep(max(0.0, started + self.log_interval_seconds - time.monotonic()))
+
+        logging.info("Log generation completed.")
+
 
 if __name__ == '__main__':
     import time
@@ -0,0 +1,153 @@
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from log_generator import GENERATOR_MODE_FAST, WORKLOAD_PROFILES, LogGenerator, _byte_table, _pack
+
+# the lines are checked with the log processor's own parser
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "log_processor"))
+from log_handler import LineProtocolLogHandler  # noqa: E402
+from rejections import Rejections  # noqa: E402
+
+
+def fast_generator(lines, profile="uniform", **env):
+    env = {"LOG_BATCH_SIZE": str(lines), "LOG_INTERVAL_SECONDS": "0", "MAX_LOGS_TO_GENERATE": str(lines),
+           "LOG_GENERATOR_MODE": GENERATOR_MODE_FAST, "LOG_WORKLOAD_PROFILE": profile, **env}
+    with patch.dict(os.environ, env), patch.object(LogGenerator, "configure_logging"):
+        return LogGenerator()
+
+
+def parse(data):
+    """Every line of a batch split into (datetime, customer, path, status, duration)."""
+    rows = []
+    for line in data.decode().splitlines():
+        day, time, customer, path, status, duration = line.split(" ")
+        rows.append((datetime.datetime.strptime(f"{day} {time}", "%Y-%m-%d %H:%M:%S"), customer, path,
+                     int(status), float(duration)))
+    return rows
+
+
+class TestPacking(unittest.TestCase):
+    def test_byte_table_right_aligns_the_values(self):
+        table, padding = _byte_table(["a ", "bcd "])
+
+        self.assertEqual(table.tobytes(), b"  a bcd ")
+        self.assertEqual(padding.tolist(), [2, 0])
+
+    def test_pack_joins_the_rows_without_their_padding(self):
+        names, padding = _byte_table(["a ", "bcd "])
+        newlines = np.full((3, 1), ord("\n"), dtype=np.uint8)
+
+        self.assertEqual(_pack([(names[[1, 0, 1]], padding[[1, 0, 1]]), (newlines, None)]), b"bcd \na \nbcd \n")
+
+
+class TestFastGenerator(unittest.TestCase):
+    LINES = 20_000
+
+    def check_lines(self, data, lines):
+        """Every line is parsed by the log processor without a rejection."""
+        rejections = Rejections(log_every=0)
+        parsed = LineProtocolLogHandler(None, rejections=rejections).prepare_log(data.decode().splitlines())
+
+        self.assertEqual(data.count(b"\n"), lines)
+        self.assertEqual(parsed.count(b"\n"), lines)
+        self.assertEqual(rejections.counts(), {})
+
+    def test_batch_lines_parse_and_fall_in_the_uniform_ranges(self):
+        generator = fast_generator(self.LINES)
+        now = datetime.datetime.now().replace(microsecond=0)
+
+        data = generator.generate_log_batch(self.LINES)
+
+        self.check_lines(data, self.LINES)
+        rows = parse(data)
+        timestamps = [timestamp for timestamp, *_ in rows]
+        self.assertGreaterEqual(min(timestamps), now - datetime.timedelta(days=30))
+        self.assertLessEqual(max(timestamps), now + datetime.timedelta(seconds=1))
+        self.assertEqual({customer for _, customer, *_ in rows}, set(generator.customer_ids))
+        self.assertEqual({path for _, _, path, *_ in rows}, set(generator.request_paths))
+        self.assertEqual({status for *_, status, _ in rows}, set(generator.status_codes))
+        durations = [duration for *_, duration in rows]
+        self.assertGreaterEqual(min(durations), 0.1)
+        self.assertLessEqual(max(durations), 2.0)
+
+    def test_durations_of_every_width_are_formatted(self):
+        generator = fast_generator(7)
+        generator._durations_ms = lambda size: np.array([1, 999, 1000, 9999, 10_000, 123_456, 999_999])
+
+        data = generator.generate_log_batch(7)
+
+        self.check_lines(data, 7)
+        self.assertEqual([line.rsplit(b" ", 1)[1] for line in data.splitlines()],
+                         [b"0.001", b"0.999", b"1.000", b"9.999", b"10.000", b"123.456", b"999.999"])
+
+    def test_every_batch_reopens_the_log_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, "api_requests.log")
+        generator = fast_generator(100, LOG_FILE_PATH=path, LOG_BATCH_SIZE="60")
+
+        # logrotate renames the file between the two batches
+        with patch("log_generator.time.sleep", lambda _: os.rename(path, path + ".1")):
+            generator.ingest_logs_fast()
+
+        with open(path + ".1", "rb") as rotated, open(path, "rb") as current:
+            self.check_lines(rotated.read(), 60)
+            self.check_lines(current.read(), 40)
+
+
+class TestWorkloadProfiles(unittest.TestCase):
+    LINES = 20_000
+
+    def batch(self, profile, **env):
+        """The lines of a batch of a profile, checked to parse without a rejection."""
+        data = fast_generator(self.LINES, profile, **env).generate_log_batch(self.LINES)
+        rejections = Rejections(log_every=0)
+        parsed = LineProtocolLogHandler(None, rejections=rejections).prepare_log(data.decode().splitlines())
+        self.assertEqual((parsed.count(b"\n"), rejections.counts()), (self.LINES, {}), profile)
+        return parse(data)
+
+    def test_every_profile_writes_well_formed_lines(self):
+        for profile in WORKLOAD_PROFILES:
+            self.assertEqual(len(self.batch(profile)), self.LINES)
+
+    def test_production_errors_and_customers(self):
+        rows = self.batch("production", LOG_WORKLOAD_BURST_FRACTION="0")
+        failed = [status for *_, status, _ in rows if status >= 400]
+        customers = [customer for _, customer, *_ in rows]
+        durations = sorted(duration for *_, duration in rows)
+
+        self.assertAlmostEqual(len(failed) / self.LINES, 0.02, delta=0.006)
+        # Zipf with exponent 1.1 over 5000 customers: cust_1 ~16% of the lines, cust_2 ~7%
+        self.assertAlmostEqual(customers.count("cust_1") / self.LINES, 0.158, delta=0.015)
+        self.assertAlmostEqual(customers.count("cust_2") / self.LINES, 0.074, delta=0.01)
+        self.assertGreater(len(set(customers)), 1000)
+        self.assertAlmostEqual(durations[self.LINES // 2], 0.2, delta=0.02)
+
+    def test_production_bursts_fail_with_500s(self):
+        rows = self.batch("production", LOG_WORKLOAD_BURST_FRACTION="1")
+        failed = [status for *_, status, _ in rows if status >= 400]
+
+        self.assertAlmostEqual(len(failed) / self.LINES, 0.5, delta=0.03)
+        self.assertEqual(set(failed), {500})
+
+    def test_backfill_timestamps_increase_over_the_past_days(self):
+        now = datetime.datetime.now().replace(microsecond=0)
+
+        timestamps = [timestamp for timestamp, *_ in self.batch("backfill")]
+
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertGreaterEqual(timestamps[0], now - datetime.timedelta(days=30, seconds=1))
+        self.assertLess(timestamps[-1], now - datetime.timedelta(minutes=1))
+        # MAX_LOGS_TO_GENERATE lines spread evenly over the whole window
+        self.assertGreater(timestamps[-1] - timestamps[0], datetime.timedelta(days=29))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+"""
+End to end ingest benchmark: LogGenerator lines are appended to a temp log file at `--rate` lines per second while the
+real dataflow (create_dataflow, polling source, handler, writer) runs in a `python -m bytewax.run` child process and
+writes to a local stand-in for InfluxDB's write endpoint (see bench_writes.py). No InfluxDB needed, run it from a
+checkout since it imports the generator from ../log_generator:
+    python bench_ingest.py --rate 50000 --seconds 30 [--workers 1] [--json results.json]
+
+Reported: the rate lines were generated and acknowledged at, the latency from appending a generator batch to the file
+until InfluxDB acknowledged its last point, and the CPU time and peak RSS of the dataflow process. The processor's
+settings come from the environment like in the container (LOG_PARSER, LOG_BATCH_SIZE, LOG_WRITE_GZIP_LEVEL, ...),
+except that it starts reading at the beginning of the file and neither spills nor keeps bytewax snapshots.
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from unittest.mock import patch
+
+from bench_writes import StandInInflux
+from rollup import ROLLUP_MEASUREMENT
+
+BUCKET = ORG = "bench"
+
+
+def get_flow(log_file_path: str):
+    """The dataflow of main.py, built by the bytewax.run child."""
+    from dataflow_manager import create_dataflow
+    from storage import InfluxDBStorage
+
+    storage = InfluxDBStorage()
+    rollup_storage = InfluxDBStorage(writer_threads=1)
+    atexit.register(storage.close)
+    atexit.register(rollup_storage.close)
+    return create_dataflow(log_file_path, storage, rollup_storage)
+
+
+def log_generator(rate: int, seconds: float):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "log_generator"))
+    from log_generator import LogGenerator
+
+    # the generator reads its settings from the environment once, they must not leak into the processor's
+    settings = dict(LOG_BATCH_SIZE=str(rate), LOG_INTERVAL_SECONDS="1", LOG_GENERATOR_MODE="fast",
+                    MAX_LOGS_TO_GENERATE=str(max(1, int(rate * seconds))))
+    with patch.dict(os.environ, settings):
+        return LogGenerator()
+
+
+def generate(generator, log_file_path: str, rate: int, seconds: float, tick: float = 0.05):
+    """Appends rate * tick lines every tick, returns (time.monotonic() after each append, lines written by then)."""
+    appended, written = [], 0
+    started = time.monotonic()
+    with open(log_file_path, "ab") as log_file:
+        while time.monotonic() - started < seconds:
+            due = int((time.monotonic() - started + tick) * rate)
+            if due > written:
+                log_file.write(generator.generate_log_batch(due - written))
+                log_file.flush()
+                written = due
+                appended.append((time.monotonic(), written))
+            time.sleep(max(0.0, started + len(appended) * tick - time.monotonic()))
+    return appended
+
+
+def latencies(appended, acks):
+    """Seconds from appending each generator batch until its last line was acknowledged, None if it never was."""
+    ack_times = [at for at, _ in acks]
+    ack_points = [points for _, points in acks]
+    result = []
+    for at, written in appended:
+        i = bisect_left(ack_points, written)
+        result.append(ack_times[i] - at if i < len(acks) else None)
+    return result
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+def run(args) -> dict:
+    directory = tempfile.mkdtemp(prefix="bench_ingest_")
+    log_file_path = os.path.join(directory, "api_requests.log")
+    open(log_file_path, "w").close()
+    server = StandInInflux(args.rtt_ms, args.mbit_per_s, args.us_per_point,
+                           ignore_measurement=f"{ROLLUP_MEASUREMENT},".encode())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    generator = log_generator(args.rate, args.seconds)
+
+    env = dict(os.environ, INFLUXDB_URL=server.url, DOCKER_INFLUXDB_INIT_ORG=ORG, DOCKER_INFLUXDB_INIT_BUCKET=BUCKET,
+               DOCKER_INFLUXDB_INIT_ADMIN_TOKEN="bench", LOG_START_POSITION="beginning", LOG_SPILL_DIRECTORY="",
+               LOG_METRICS_PORT="0", LOGGING_LEVEL="WARNING")
+    env.pop("BYTEWAX_RECOVERY_DIRECTORY", None)
+    child_log = open(os.path.join(directory, "log_processor.log"), "w+")
+    child = subprocess.Popen(
+        [sys.executable, "-m", "bytewax.run", f"bench_ingest:get_flow({log_file_path!r})", "-w", str(args.workers)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=child_log, stderr=subprocess.STDOUT
+    )
+    try:
+        time.sleep(args.warmup)
+        appended = generate(generator, log_file_path, args.rate, args.seconds)
+        generated = appended[-1][1] if appended else 0
+        deadline = time.monotonic() + args.drain_timeout
+        while server.counted_points < generated and time.monotonic() < deadline and child.poll() is None:
+            time.sleep(0.05)
+    finally:
+        crashed = child.poll() is not None
+        if not crashed:
+            child.send_signal(signal.SIGINT)
+        child.wait()
+        server.shutdown()
+        if crashed:
+            child_log.seek(0)
+            print(child_log.read()[-5000:], file=sys.stderr)
+        child_log.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    # the child was waited for, so its CPU time and peak RSS are in the children's usage now
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    acked = latencies(appended, list(server.acks))
+    done = [latency for latency in acked if latency is not None]
+    first_append = appended[0][0] if appended else 0.0
+    last_ack = server.acks[-1][0] if server.acks else first_append
+    elapsed = max(last_ack - first_append, 1e-9)
+    return {
+        "target_lines_per_s": args.rate,
+        "generated_lines": generated,
+        "generated_lines_per_s": round(generated / args.seconds),
+        "acked_lines": server.counted_points,
+        "acked_lines_per_s": round(server.counted_points / elapsed),
+        "write_requests": server.requests,
+        "mb_received": round(server.bytes_received / 1e6, 2),
+        "latency_p50_s": round(percentile(done, 0.50), 3),
+        "latency_p95_s": round(percentile(done, 0.95), 3),
+        "latency_p99_s": round(percentile(done, 0.99), 3),
+        "latency_max_s": round(max(done, default=float("nan")), 3),
+        "unacked_batches": len(acked) - len(done),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 2),
+        "cpu_percent": round(100 * (usage.ru_utime + usage.ru_stime) / elapsed, 1),
+        # ru_maxrss is in kilobytes on linux
+        "max_rss_mb": round(usage.ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=int, default=20_000, help="log lines per second")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--warmup", type=float, default=3, help="seconds the dataflow gets to start")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="seconds to wait for the last writes")
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    parser.add_argument("--mbit-per-s", type=float, default=10_000.0)
+    parser.add_argument("--us-per-point", type=float, default=0.0)
+    parser.add_argument("--json", help="also write the results to this file, to compare commits")
+    args = parser.parse_args()
+
+    # before the generator configures its own logging, which would log to a file
+    logging.basicConfig(level=logging.WARNING)
+    results = run(args)
+    try:
+        results["commit"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                           check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    for name, value in results.items():
+        print(f"{name:>22}: {value}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
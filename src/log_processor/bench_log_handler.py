@@ -0,0 +1,80 @@
+"""
+Microbenchmark of the dict path (LogHandler + influx client serialization) against the line protocol fast path
+(LineProtocolLogHandler) on generator shaped lines. No InfluxDB needed:
+    python bench_log_handler.py --lines 1000000
+"""
+import argparse
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+from influxdb_client.client.write_api import PointSettings
+from influxdb_client.client.write.point import Point
+from log_handler import LogHandler, LineProtocolLogHandler
+
+CUSTOMER_IDS = [f"cust_{i}" for i in range(1, 51)]
+REQUEST_PATHS = ["/api/v1/resource1", "/api/v1/resource2", "/api/v1/resource3", "/api/v1/resource4"]
+STATUS_CODES = [200, 201, 400, 401, 403, 404, 500]
+
+
+class SerializingStorage:
+    """Does what the influx client does with each batch before it goes over the wire."""
+
+    def __init__(self):
+        self.point_settings = PointSettings()
+        self.points = 0
+
+    def store_log(self, log_data):
+        if isinstance(log_data, bytes):
+            self.points += len(log_data.splitlines())
+            return
+        for record in log_data:
+            Point.from_dict(record).to_line_protocol()
+            self.points += 1
+
+
+def generate_lines(count: int):
+    random.seed(42)
+    start = datetime(2024, 9, 1)
+    lines = []
+    for i in range(count):
+        # generator timestamps move forward a second at a time, a handful of lines share each second
+        timestamp = (start + timedelta(seconds=i // 10)).strftime("%Y-%m-%d %H:%M:%S")
+        lines.append(
+            f"{timestamp} {random.choice(CUSTOMER_IDS)} {random.choice(REQUEST_PATHS)} "
+            f"{random.choice(STATUS_CODES)} {random.uniform(0.1, 2.0):.3f}"
+        )
+    return lines
+
+
+def run(handler_cls, lines, batch_size: int):
+    storage = SerializingStorage()
+    handler = handler_cls(storage)
+    started = time.perf_counter()
+    for i in range(0, len(lines), batch_size):
+        handler.handle_log(lines[i:i + batch_size])
+    elapsed = time.perf_counter() - started
+    return storage.points, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=1000, help="lines per handle_log call (STREAM_MAX_SIZE)")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    lines = generate_lines(args.lines)
+
+    results = {}
+    for handler_cls in (LogHandler, LineProtocolLogHandler):
+        points, elapsed = run(handler_cls, lines, args.batch_size)
+        results[handler_cls.__name__] = elapsed
+        print(f"{handler_cls.__name__:>24}: {points} points in {elapsed:.2f}s, {points / elapsed:,.0f} lines/s")
+
+    print(f"speedup: {results['LogHandler'] / results['LineProtocolLogHandler']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Compares QuantileSketch with sorting every latency, what the exact stats of the raw points need, on generated latencies:
+    python bench_quantile_sketch.py --values 1000000 --days 30
+Reports the time to summarize the values, to merge a month of daily sketches, the encoded size and the error at
+the median and p99 ranks.
+"""
+import argparse
+import time
+
+from quantile_sketch import QuantileSketch
+from test_quantile_sketch import latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--values", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=30, help="daily sketches to merge")
+    args = parser.parse_args()
+
+    values = latencies(args.values)
+    ranks = [len(values) // 2, int(len(values) * 0.99) - 1]
+
+    started = time.perf_counter()
+    exact = sorted(values)
+    exact_values = [exact[rank] for rank in ranks]
+    sort_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    sketch_values = sketch.values_at_ranks(ranks)
+    sketch_elapsed = time.perf_counter() - started
+
+    print(f"{'sort':>8}: {sort_elapsed:.3f}s for {len(values)} values")
+    print(f"{'sketch':>8}: {sketch_elapsed:.3f}s for {len(values)} values, {len(sketch.bins)} buckets, "
+          f"{len(sketch.to_bytes())} bytes ({len(sketch.to_string())} as base64) vs {8 * len(values)} bytes of floats")
+    for name, exact_value, sketch_value in zip(("median", "p99"), exact_values, sketch_values):
+        print(f"{name:>8}: exact {exact_value:.5f}, sketch {sketch_value:.5f}, "
+              f"error {abs(sketch_value - exact_value) / exact_value:.3%}")
+
+    # the stats endpoint reading a month of rollups: decode and merge one sketch per day
+    daily = [sketch.to_string()] * args.days
+    started = time.perf_counter()
+    merged = QuantileSketch()
+    for encoded in daily:
+        merged.merge(QuantileSketch.from_string(encoded))
+    merged.values_at_ranks([merged.count // 2, int(merged.count * 0.99) - 1])
+    print(f"{'merge':>8}: {time.perf_counter() - started:.4f}s for {args.days} daily sketches "
+          f"({merged.count} values)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Writes the same points through the BatchWriter with fixed 500 point batches (what the processor used to send), gzip
+and the adaptive batch size, to a local stand-in for InfluxDB's write endpoint. No InfluxDB needed:
+    python bench_writes.py --points 1000000 --rtt-ms 2 --mbit-per-s 100
+
+The stand-in accepts every write after a delay modelling a cross-AZ link: `--rtt-ms` per request plus the request
+body at `--mbit-per-s`, plus `--us-per-point` of ingest work. It decompresses and counts what it gets, so what is
+compared is requests, bytes over the wire and points per second through the real write path
+(storage.post_line_protocol).
+"""
+import argparse
+import gzip
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from influxdb_client import InfluxDBClient, WriteService
+
+from bench_log_handler import generate_lines
+from log_handler import LineProtocolLogHandler
+from storage import post_line_protocol
+from writer import AdaptiveBatchSize, BatchWriter
+
+
+class StandInInflux(ThreadingHTTPServer):
+    """
+    Accepts every write to /api/v2/write after the modelled delay. Besides the totals it records when each write was
+    acknowledged and how many points of measurements other than `ignore_measurement` were acknowledged by then.
+    """
+    daemon_threads = True
+
+    def __init__(self, rtt_ms: float, mbit_per_s: float, us_per_point: float, ignore_measurement: bytes = b""):
+        super().__init__(("127.0.0.1", 0), _WriteHandler)
+        self.ignore_measurement = ignore_measurement
+        self.rtt = rtt_ms / 1000
+        self.bytes_per_s = mbit_per_s * 1_000_000 / 8
+        self.seconds_per_point = us_per_point / 1_000_000
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = self.bytes_received = self.points = self.counted_points = 0
+        self.acks = []  # (time.monotonic() of the response, counted points acknowledged so far)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _WriteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        data = gzip.decompress(body) if self.headers.get("Content-Encoding") == "gzip" else body
+        points = data.count(b"\n") + 1
+        ignored = 0
+        if server.ignore_measurement:
+            ignored = data.count(b"\n" + server.ignore_measurement) + data.startswith(server.ignore_measurement)
+        time.sleep(server.rtt + len(body) / server.bytes_per_s + points * server.seconds_per_point)
+        with server.lock:
+            server.requests += 1
+            server.bytes_received += len(body)
+            server.points += points
+            server.counted_points += points - ignored
+            server.acks.append((time.monotonic(), server.counted_points))
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serialize(lines, chunk: int = 1000):
+    handler = LineProtocolLogHandler(None)
+    return [handler.prepare_log(lines[i:i + chunk]).splitlines() for i in range(0, len(lines), chunk)]
+
+
+def run(server: StandInInflux, write_service: WriteService, chunks, gzip_level: int, sizer, threads: int):
+    server.reset()
+    writer = BatchWriter(
+        send=lambda data: post_line_protocol(write_service, data, gzip_level, bucket="bench", org="bench"),
+        batch_size=500, flush_interval_ms=100, queue_size=8, threads=threads, retry_interval_ms=100, max_retries=0,
+        sizer=sizer,
+    )
+    started = time.perf_counter()
+    for chunk in chunks:
+        writer.write(chunk)
+    writer.close()
+    return time.perf_counter() - started, writer.metrics()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--rtt-ms", type=float, default=2.0)
+    parser.add_argument("--mbit-per-s", type=float, default=100.0)
+    parser.add_argument("--us-per-point", type=float, default=1.0)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--gzip-level", type=int, default=1)
+    parser.add_argument("--max-bytes", type=int, default=8 * 1024 * 1024)
+    parser.add_argument("--latency-target-ms", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    chunks = serialize(generate_lines(args.points))
+    server = StandInInflux(args.rtt_ms, args.mbit_per_s, args.us_per_point)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    scenarios = [
+        ("500 points", 0, None),
+        ("500 points, gzip", args.gzip_level, None),
+        ("adaptive", 0, AdaptiveBatchSize(500, args.max_bytes, args.latency_target_ms)),
+        ("adaptive, gzip", args.gzip_level, AdaptiveBatchSize(500, args.max_bytes, args.latency_target_ms)),
+    ]
+    with InfluxDBClient(url=server.url, token="bench", org="bench") as client:
+        write_service = WriteService(client.api_client)
+        for name, gzip_level, sizer in scenarios:
+            elapsed, metrics = run(server, write_service, chunks, gzip_level, sizer, args.threads)
+            print(f"{name:>18}: {server.points / elapsed:>9,.0f} points/s, {server.requests:>5} requests, "
+                  f"{server.bytes_received / 1e6:7.1f}MB sent ({metrics['bytes_written'] / 1e6:.1f}MB line protocol), "
+                  f"avg write {metrics['write_seconds_avg'] * 1000:.1f}ms, final batch {metrics['batch_size']} points")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
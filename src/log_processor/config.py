@@ -11,8 +11,34 @@ INFLUXDB_BUCKET = os.getenv("DOCKER_INFLUXDB_INIT_BUCKET")
 
 # Log Processing Configuration
 LOG_FILE_PATH = os.getenv("LOG_FILE_PATH", "/log_generator/api_requests.log")
-LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 10000))  # Increased batch size
-LOG_FLUSH_INTERVAL_MS = int(os.getenv("LOG_FLUSH_INTERVAL_MS", 100))  # Reduced flush interval in milliseconds
+LOG_READ_BLOCK_SIZE = int(os.getenv("LOG_READ_BLOCK_SIZE", 1024 * 1024))  # Bytes read from the log file per poll
+LOG_START_POSITION = os.getenv("LOG_START_POSITION", "saved").lower()  # "saved" offset, "end" or "beginning"
+LOG_ROTATED_GLOB = os.getenv("LOG_ROTATED_GLOB", "")  # Rotated log files to catch up on, e.g. "api_requests.log.*"
+LOG_RANGE_PARTITIONS = int(os.getenv("LOG_RANGE_PARTITIONS", 0))  # >0 reads static log files once, in byte ranges
+LOG_DAILY_ROLLUPS = os.getenv("LOG_DAILY_ROLLUPS", "true").lower() == "true"  # Per customer/day rollups
+LOG_ROLLUP_OPEN_DAYS = int(os.getenv("LOG_ROLLUP_OPEN_DAYS", 2))  # UTC days open by the wall clock, today included
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 10000))  # Points per write request to InfluxDB, to start with
+LOG_FLUSH_INTERVAL_MS = int(os.getenv("LOG_FLUSH_INTERVAL_MS", 100))  # Max time a point waits in the write batch
+LOG_BATCH_MAX_BYTES = int(os.getenv("LOG_BATCH_MAX_BYTES", 8 * 1024 * 1024))  # Max uncompressed bytes per write
+LOG_WRITE_LATENCY_TARGET_MS = int(os.getenv("LOG_WRITE_LATENCY_TARGET_MS", 1000))  # Batches grow while faster
+LOG_WRITE_GZIP_LEVEL = int(os.getenv("LOG_WRITE_GZIP_LEVEL", 1))  # 0 writes uncompressed
+LOG_WRITER_THREADS = int(os.getenv("LOG_WRITER_THREADS", 2))  # Concurrent write requests to InfluxDB
+LOG_WRITE_QUEUE_SIZE = int(os.getenv("LOG_WRITE_QUEUE_SIZE", 8))  # Batches waiting to be written before ingest blocks
+LOG_RETRY_INTERVAL_MS = int(os.getenv("LOG_RETRY_INTERVAL_MS", 5000))  # First retry delay, doubled on every retry
+LOG_MAX_RETRIES = int(os.getenv("LOG_MAX_RETRIES", 5))  # Retries before a batch is spilled (or dropped)
+LOG_MAX_RETRY_INTERVAL_MS = int(os.getenv("LOG_MAX_RETRY_INTERVAL_MS", 60000))  # Longest wait between replays
+LOG_SPILL_DIRECTORY = os.getenv("LOG_SPILL_DIRECTORY", "")  # Failed batches are kept here until replayed, "" drops them
+LOG_SPILL_SEGMENT_BYTES = int(os.getenv("LOG_SPILL_SEGMENT_BYTES", 64 * 1024 * 1024))  # Size of a spill file
+LOG_SPILL_MAX_BYTES = int(os.getenv("LOG_SPILL_MAX_BYTES", 1024 * 1024 * 1024))  # Batches past this are dropped
+LOG_SCHEMA_MODE = os.getenv("LOG_SCHEMA_MODE", "legacy").lower()  # "legacy" or "tagged" (path/status class tags)
+LOG_PARSER = os.getenv("LOG_PARSER", "fast").lower()  # "fast" writes line protocol directly, "dict" builds records
+LOG_TIMESTAMP_CACHE_SIZE = int(os.getenv("LOG_TIMESTAMP_CACHE_SIZE", 65536))  # Distinct second-resolution timestamps
+LOG_DEAD_LETTER_PATH = os.getenv("LOG_DEAD_LETTER_PATH", "")  # Rejected lines are appended here, "" only counts them
+LOG_DEAD_LETTER_MAX_BYTES = int(os.getenv("LOG_DEAD_LETTER_MAX_BYTES", 100 * 1024 * 1024))  # Lines past it are dropped
+LOG_REJECTED_LOG_EVERY = int(os.getenv("LOG_REJECTED_LOG_EVERY", 1000))  # Logs 1 in N rejected lines per reason, 0 none
+
+# Prometheus metrics on http://<host>:LOG_METRICS_PORT/metrics, 0 turns them off
+LOG_METRICS_PORT = int(os.getenv("LOG_METRICS_PORT", 9100))
 
 # Logging Configuration
 LOGGING_LEVEL = os.getenv("LOGGING_LEVEL", "INFO").upper()
@@ -3,16 +3,86 @@ from datetime import timedelta
 
 import bytewax.operators as op
 from bytewax.dataflow import Dataflow
+from bytewax.outputs import FixedPartitionedSink, StatefulSinkPartition
+from typing import List
 from polling_source import LogPollingSource
-from log_handler import LogHandler
-from config import STREAM_MAX_SIZE, STREAM_MAX_WAIT_TIME_IN_SECONDS
+from range_source import LogFileRangeSource
+from log_handler import LogHandler, LineProtocolLogHandler
+from rollup import DailyRollups, update_daily_rollups
+from config import (
+    LOG_DAILY_ROLLUPS,
+    LOG_PARSER,
+    LOG_RANGE_PARTITIONS,
+    LOG_ROLLUP_OPEN_DAYS,
+    STREAM_MAX_SIZE,
+    STREAM_MAX_WAIT_TIME_IN_SECONDS,
+)
 
 
-def create_dataflow(log_file_path, influx_storage):
+class _LogStoragePartition(StatefulSinkPartition):
+    def __init__(self, storage):
+        self.storage = storage
+
+    def write_batch(self, items):
+        for log_data in items:
+            self.storage.store_log(log_data)
+
+    def snapshot(self):
+        # the input offsets in this snapshot cover everything handed to the storage, so it has to be written first
+        self.storage.flush()
+        return None
+
+    def close(self):
+        logging.info(f"Dataflow finished, flushing {self.storage}")
+        self.storage.flush()
+
+
+class LogStorageSink(FixedPartitionedSink):
+    """
+    Stores the parsed batches of each input partition, one sink partition per input partition so the writes are
+    spread over the bytewax workers like the input is. The storage is flushed on every bytewax snapshot and when
+    the dataflow closes, by the same process that wrote to it.
+    """
+
+    def __init__(self, parts: List[str], storage):
+        self.parts = parts
+        self._part_index = {part: i for i, part in enumerate(sorted(parts))}
+        self.storage = storage
+
+    def list_parts(self):
+        return self.parts
+
+    def part_fn(self, item_key: str) -> int:
+        # bytewax indexes this into the sorted partition keys, send each batch to the partition of its input
+        return self._part_index[item_key]
+
+    def build_part(self, step_id, for_part, resume_state):
+        return _LogStoragePartition(self.storage)
+
+
+def split_into_batches(chunks: List[List[str]], max_size: int = STREAM_MAX_SIZE) -> List[List[str]]:
+    """
+    The source emits a chunk of lines per poll and collect groups the chunks, so regroup the lines into batches of
+    at most STREAM_MAX_SIZE lines for the log handler.
+    """
+    lines = [line for chunk in chunks for line in chunk]
+    return [lines[i:i + max_size] for i in range(0, len(lines), max_size)]
+
+
+def create_dataflow(log_file_path, influx_storage, rollup_storage):
+    """
+    Reads, parses and stores the log lines through `influx_storage`. The daily rollup points go through
+    `rollup_storage`, each one overwrites the previous cumulative point of its customer and day so it has to write
+    them in order, on a single writer thread.
+    """
     logging.info(f"Creating dataflow for log file: {log_file_path}")
     flow = Dataflow("log_processor_flow")
 
-    log_stream = op.input("polling_input", flow, LogPollingSource(log_file_path, poll_interval=1))
+    if LOG_RANGE_PARTITIONS > 0:
+        source = LogFileRangeSource(log_file_path, ranges=LOG_RANGE_PARTITIONS)
+    else:
+        source = LogPollingSource(log_file_path, poll_interval=1)
+    log_stream = op.input("polling_input", flow, source)
 
     logging.info(f"stream is setup to collect {STREAM_MAX_SIZE}, with a timeout {STREAM_MAX_WAIT_TIME_IN_SECONDS}")
     collected_stream = op.collect(
@@ -20,13 +90,32 @@ def create_dataflow(log_file_path, influx_storage):
         timeout=timedelta(seconds=STREAM_MAX_WAIT_TIME_IN_SECONDS), max_size=STREAM_MAX_SIZE
     )
 
-    extracted_stream = op.map("extract_log_line", collected_stream, lambda x: x[1])
+    # batches stay keyed by the input partition they were read from
+    extracted_stream = op.flat_map(
+        "extract_log_line", collected_stream, lambda x: [(x[0], batch) for batch in split_into_batches(x[1])]
+    )
+
+    log_handler = LineProtocolLogHandler(influx_storage) if LOG_PARSER == "fast" else LogHandler(influx_storage)
+    logging.info(f"Using {log_handler.__class__.__name__} to process logs")
+
+    def process_log(key_batch):
+        key, log_lines = key_batch
+        rollups = DailyRollups() if LOG_DAILY_ROLLUPS else None
+        log_data = log_handler.prepare_log(log_lines, rollups)
+        return key, (log_data, rollups.values() if rollups is not None else [])
 
-    log_handler_cls = LogHandler(influx_storage)
-    processed_stream = op.map("process_log", extracted_stream, log_handler_cls.handle_log)
+    processed_stream = op.map("process_log", extracted_stream, process_log)
+    log_stream = op.map("raw_logs", processed_stream, lambda x: (x[0], x[1][0]))
+    op.output("store_logs", log_stream, LogStorageSink(source.list_parts(), influx_storage))
     logging.info("Log processing step added to dataflow.")
 
-    op.inspect("inspect_step", processed_stream, lambda step_id, x: None)
-    logging.info("Inspect step added to dataflow.")
+    if LOG_DAILY_ROLLUPS:
+        partial_rollups = op.flat_map("partial_rollups", processed_stream, lambda x: x[1][1])
+        keyed_rollups = op.key_on("key_customer", partial_rollups, lambda rollup: rollup.customer_id)
+        rollup_points = op.stateful_map("daily_rollups", keyed_rollups, update_daily_rollups)
+        rollup_points = op.filter_map("changed_rollups", rollup_points, lambda x: x[1])
+        keyed_points = op.key_on("key_daily_rollups", rollup_points, lambda _: "daily_rollups")
+        op.output("store_daily_rollups", keyed_points, LogStorageSink(["daily_rollups"], rollup_storage))
+        logging.info(f"Daily rollups step added to dataflow, {LOG_ROLLUP_OPEN_DAYS} days kept open.")
 
     return flow
@@ -0,0 +1,205 @@
+"""
+Imports existing log files into InfluxDB in one go, instead of tailing them with the dataflow:
+    python import_logs.py /log_generator/api_requests.log [more files, directories or patterns] [--processes 4]
+
+Plain files are split into `--chunk-bytes` byte ranges that worker processes read through mmap, gzipped files are
+decompressed by this process and their chunks handed to the workers. Each chunk is parsed by the same handler as the
+dataflow (LOG_PARSER, LOG_SCHEMA_MODE) and written through InfluxDBStorage on `--writers` threads, so the points are
+exactly what the dataflow writes for these lines and importing a file twice just overwrites them. Progress and
+throughput are printed every `--progress-seconds`.
+
+The daily rollups of the imported lines are written at the end, they replace the rollup points of the same customer
+and day. Import days the dataflow isn't writing, or pass `--no-rollups`.
+"""
+import argparse
+import logging
+import mmap
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterator, List, Tuple
+
+from config import LOG_DAILY_ROLLUPS, LOG_DEAD_LETTER_PATH, LOG_PARSER, LOG_WRITER_THREADS
+from log_handler import LineProtocolLogHandler, LogHandler
+from polling_source import open_log_file, resolve_log_files
+from range_source import split_ranges
+from rejections import Rejections
+from rollup import DailyRollup, DailyRollups
+from storage import InfluxDBStorage
+
+# (line protocol or records, lines, parsed lines, partial rollups)
+ParsedChunk = Tuple[object, int, int, List[DailyRollup]]
+
+_handler = None
+
+
+def _init_worker(parser: str, dead_letter_path: str) -> None:
+    global _handler
+    # the handlers log every batch at info, the workers only report problems
+    logging.basicConfig(level=logging.WARNING)
+    rejections = Rejections.from_config(dead_letter_path)
+    _handler = LineProtocolLogHandler(None, rejections=rejections) if parser == "fast" \
+        else LogHandler(None, rejections=rejections)
+
+
+def read_range(log_file_path: str, start: int, end: int) -> bytes:
+    """The lines starting inside [start, end), split the way range_source.py splits a file."""
+    with open(log_file_path, "rb") as log_file, mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if start > 0:
+            # a line crossing `start` belongs to the previous range
+            newline = data.find(b"\n", start - 1)
+            start = len(data) if newline < 0 else newline + 1
+        if start >= end:
+            return b""
+        # the last line starting before `end` is read to its newline
+        newline = data.find(b"\n", end - 1)
+        return data[start:len(data) if newline < 0 else newline + 1]
+
+
+def parse_chunk(data: bytes, rollups: bool) -> ParsedChunk:
+    lines = [line for line in data.decode(errors="replace").splitlines() if line.strip()]
+    partial_rollups = DailyRollups() if rollups else None
+    log_data = _handler.prepare_log(lines, partial_rollups)
+    parsed = len(log_data) if isinstance(log_data, list) else log_data.count(b"\n")
+    return log_data, len(lines), parsed, partial_rollups.values() if rollups else []
+
+
+def parse_range(log_file_path: str, start: int, end: int, rollups: bool) -> ParsedChunk:
+    return parse_chunk(read_range(log_file_path, start, end), rollups)
+
+
+def compressed_chunks(log_file_path: str, chunk_bytes: int) -> Iterator[Tuple[bytes, int]]:
+    """
+    Complete lines of a gzipped file, about `chunk_bytes` decompressed bytes at a time, with the compressed bytes
+    read for them.
+    """
+    partial_line = b""
+    position = 0
+    with open_log_file(log_file_path) as log_file:
+        while block := log_file.read(chunk_bytes):
+            data = partial_line + block
+            last_newline = data.rfind(b"\n") + 1
+            partial_line = data[last_newline:]
+            if last_newline:
+                read, position = log_file.fileobj.tell() - position, log_file.fileobj.tell()
+                yield data[:last_newline], read
+    if partial_line:
+        yield partial_line, 0
+
+
+class Importer:
+    """Submits chunks to the process pool and stores what comes back in order, at most `max_pending` in flight."""
+
+    def __init__(self, pool: ProcessPoolExecutor, storage, rollups: bool, max_pending: int,
+                 progress_seconds: float, total_bytes: int):
+        self.pool = pool
+        self.storage = storage
+        self.rollups = rollups
+        self.max_pending = max_pending
+        self.progress_seconds = progress_seconds
+        self.total_bytes = total_bytes
+        self.pending: Deque[Tuple[Future, int]] = deque()
+        self.daily_rollups: Dict[Tuple[str, str], DailyRollup] = {}
+        self.lines = self.parsed = self.bytes_read = 0
+        self.started = self.last_progress = time.monotonic()
+
+    def submit(self, size: int, fn, *args) -> None:
+        """Parses fn(*args, rollups) in the pool, `size` is how many bytes of the files that is for the progress."""
+        while len(self.pending) >= self.max_pending:
+            self._store(*self.pending.popleft())
+        self.pending.append((self.pool.submit(fn, *args, self.rollups), size))
+
+    def drain(self) -> None:
+        while self.pending:
+            self._store(*self.pending.popleft())
+
+    def _store(self, future: Future, bytes_read: int) -> None:
+        log_data, lines, parsed, partial_rollups = future.result()
+        if self.storage is not None and parsed:
+            self.storage.store_log(log_data)
+        self.lines += lines
+        self.parsed += parsed
+        self.bytes_read += bytes_read
+        for partial in partial_rollups:
+            rollup = self.daily_rollups.get((partial.customer_id, partial.day))
+            if rollup is None:
+                self.daily_rollups[(partial.customer_id, partial.day)] = partial
+            else:
+                rollup.merge(partial)
+        if time.monotonic() - self.last_progress >= self.progress_seconds:
+            self.last_progress = time.monotonic()
+            self.log_progress()
+
+    def store_rollups(self) -> int:
+        if self.storage is not None and self.daily_rollups:
+            self.storage.store_log("".join(rollup.to_line_protocol() + "\n"
+                                           for rollup in self.daily_rollups.values()).encode())
+        return len(self.daily_rollups)
+
+    def log_progress(self) -> None:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        done = f"{100 * self.bytes_read / self.total_bytes:.1f}%" if self.total_bytes else "-"
+        written = self.storage.metrics()["points_written"] if self.storage is not None else 0
+        print(f"{done} {self.bytes_read / 1e6:.0f}MB, {self.lines} lines ({self.lines - self.parsed} rejected), "
+              f"{self.lines / elapsed:,.0f} lines/s, {self.bytes_read / 1e6 / elapsed:.1f}MB/s, "
+              f"{written} points written")
+
+
+def import_files(paths: List[str], storage, processes: int, chunk_bytes: int, rollups: bool, progress_seconds: float,
+                 parser: str = LOG_PARSER, dead_letter_path: str = LOG_DEAD_LETTER_PATH) -> Importer:
+    # the progress of gzipped files is counted in compressed bytes too
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(parser, dead_letter_path)) as pool:
+        importer = Importer(pool, storage, rollups, 2 * processes, progress_seconds, total_bytes)
+        for path in paths:
+            print(f"Importing {path}")
+            if path.endswith(".gz"):
+                for data, read in compressed_chunks(path, chunk_bytes):
+                    importer.submit(read, parse_chunk, data)
+            else:
+                size = os.path.getsize(path)
+                for start, end in split_ranges(size, max(1, -(-size // chunk_bytes))):
+                    importer.submit(end - start, parse_range, path, start, end)
+        importer.drain()
+    return importer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="log files, directories of *.log files or patterns")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="parsing processes")
+    parser.add_argument("--writers", type=int, default=LOG_WRITER_THREADS, help="InfluxDB writer threads")
+    parser.add_argument("--chunk-bytes", type=int, default=16 * 1024 * 1024, help="bytes parsed per task")
+    parser.add_argument("--progress-seconds", type=float, default=5)
+    parser.add_argument("--no-rollups", action="store_true", help="don't write the daily rollups")
+    parser.add_argument("--dry-run", action="store_true", help="only parse and count the lines")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s: %(message)s')
+
+    paths = [path for pattern in args.paths for path in resolve_log_files(pattern)]
+    missing = [path for path in paths if not os.path.isfile(path)]
+    if missing:
+        parser.error(f"no such file: {', '.join(missing)}")
+
+    # no spilling, a failed import is simply run again
+    storage = None if args.dry_run else InfluxDBStorage(spill_directory="", writer_threads=args.writers)
+    started = time.monotonic()
+    try:
+        importer = import_files(paths, storage, args.processes, args.chunk_bytes,
+                                LOG_DAILY_ROLLUPS and not args.no_rollups, args.progress_seconds)
+        rollups = importer.store_rollups()
+    finally:
+        if storage is not None:
+            storage.close()
+    elapsed = time.monotonic() - started
+    importer.log_progress()
+    metrics = storage.metrics() if storage is not None else {}
+    print(f"Imported {importer.parsed} of {importer.lines} lines and {rollups} daily rollups in {elapsed:.1f}s "
+          f"({importer.lines / max(elapsed, 1e-9):,.0f} lines/s), {metrics.get('points_written', 0)} points written")
+    if metrics.get("points_dropped"):
+        raise SystemExit(f"{metrics['points_dropped']} points could not be written, run the import again")
+
+
+if __name__ == "__main__":
+    main()
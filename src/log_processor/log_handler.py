@@ -1,7 +1,56 @@
 import logging
+import math
+import threading
+import time
 from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from functools import lru_cache
 from dateutil import parser as dateutil_parser
-from typing import List
+from typing import List, Optional
+
+from influxdb_client import Point
+from config import LOG_SCHEMA_MODE, LOG_TIMESTAMP_CACHE_SIZE
+from metrics import observe_parsed
+from rejections import (
+    REJECT_DURATION,
+    REJECT_MISSING_FIELDS,
+    REJECT_STATUS_CODE,
+    REJECT_STATUS_CODE_RANGE,
+    REJECT_TIMESTAMP,
+    Rejection,
+    Rejections,
+    default_rejections,
+)
+from schema import TAGGED_SCHEMA, measurement, normalize_path, status_class
+
+_ESCAPE_TAG = str.maketrans({"\\": "\\\\", ",": r"\,", " ": r"\ ", "=": r"\=", "\n": r"\n", "\r": r"\r", "\t": r"\t"})
+_ESCAPE_STRING = str.maketrans({"\\": "\\\\", '"': r"\""})
+_ESCAPE_CACHE_SIZE = 8192
+
+
+@lru_cache(maxsize=_ESCAPE_CACHE_SIZE)
+def escape_tag(value: str) -> str:
+    # customer ids repeat constantly, caching beats translating every line
+    return value.translate(_ESCAPE_TAG)
+
+
+@lru_cache(maxsize=_ESCAPE_CACHE_SIZE)
+def escape_string(value: str) -> str:
+    return value.translate(_ESCAPE_STRING)
+
+
+def invalid_fields(status_code: str, duration: str) -> Optional[str]:
+    """
+    The rejection reason if the status code isn't a number from 100 to 599 or the duration a decimal (`2`, `0.772`),
+    None if they are valid. Checked up front so dirty lines are rejected without raising and catching an exception each.
+    """
+    if not (status_code.isascii() and status_code.isdigit()):
+        return REJECT_STATUS_CODE
+    if len(status_code) != 3 or not 100 <= int(status_code) <= 599:
+        return REJECT_STATUS_CODE_RANGE
+    if not (duration.isascii() and duration.replace(".", "", 1).isdigit()):
+        return REJECT_DURATION
+    return None
 
 
 class LogHandlerBase(ABC):
@@ -11,50 +60,193 @@ class LogHandlerBase(ABC):
 
 
 class LogHandler(LogHandlerBase):
-    def __init__(self, storage):
+    def __init__(self, storage, schema_mode: str = LOG_SCHEMA_MODE, rejections: Optional[Rejections] = None):
         self.storage = storage
+        self.measurement = measurement(schema_mode)
+        self.tagged = schema_mode == TAGGED_SCHEMA
+        # counts, samples and dead-letters the lines that can't be parsed, see rejections.py
+        self.rejections = rejections if rejections is not None else default_rejections()
 
     def handle_log(self, log_lines: List[str]):
+        self.storage.store_log(self.prepare_log(log_lines))
+
+    def prepare_log(self, log_lines: List[str], rollups=None):
+        """
+        Parses the lines into what the storage accepts, every stored line is also added to `rollups`
+        (rollup.DailyRollups) when given.
+        """
         logging.info(f"LogHandler received {len(log_lines)}")
+        started = time.perf_counter()
         ready_logs = []
+        rejected: List[Rejection] = []
         for log_line in log_lines:
-            log_data = self._process_log(log_line)
+            log_data = self._process_log(log_line, rejected)
             if log_data:
                 ready_logs.append(log_data)
+                if rollups is not None:
+                    self._add_to_rollups(log_data, rollups)
 
+        observe_parsed(len(log_lines), len(ready_logs), time.perf_counter() - started)
+        self.rejections.record(rejected)
         logging.info(f"LogHandler ready to save {len(ready_logs)} logs in DB")
-        self.storage.store_log(ready_logs)
+        return ready_logs
+
+    @staticmethod
+    def _add_to_rollups(record, rollups) -> None:
+        rollups.add(record["tags"]["customer_id"], record["time"][:10], record["tags"]["success"],
+                    record["fields"]["duration"])
 
-    def _process_log(self, log_line: str):
-        try:
-            parts = log_line.split()
-            if len(parts) >= 6:
-                timestamp_str = f"{parts[0]} {parts[1]}"
+    def _process_log(self, log_line: str, rejected: Optional[List[Rejection]] = None):
+        """The record of a log line, None if it is rejected, in which case (reason, line) is added to `rejected`."""
+        parts = log_line.split()
+        reason = REJECT_MISSING_FIELDS if len(parts) < 6 else invalid_fields(parts[4], parts[5])
+        timestamp = None
+        if reason is None:
+            try:
                 # faster date parsing
-                timestamp = dateutil_parser.isoparse(timestamp_str)
-                customer_id = parts[2]
-                request_path = parts[3]
-                status_code = int(parts[4])
-                duration = float(parts[5])
-
-                # Determine if the request was successful (status_code 2xx or 3xx)
-                success = 1 if 200 <= status_code < 400 else 0
-                record = {
-                    "measurement": "api_requests",
-                    "tags": {
-                        "customer_id": customer_id,
-                        "success": success
-                    },
-                    "fields": {
-                        "duration": duration,
-                        "status_code": status_code,
-                        "request_path": request_path
-                    },
-                    "time":  timestamp.isoformat() + "Z"
-                }
-                return record
-            else:
-                logging.debug(f"Invalid log line: {log_line}")
-        except Exception as e:
-            logging.debug(f"Error processing log line: {log_line}. Error: {e}")
+                timestamp = dateutil_parser.isoparse(f"{parts[0]} {parts[1]}")
+            except ValueError:
+                reason = REJECT_TIMESTAMP
+        if reason is None:
+            duration = float(parts[5])
+            # enough digits overflow to inf
+            if not math.isfinite(duration):
+                reason = REJECT_DURATION
+        if reason is not None:
+            if rejected is not None:
+                rejected.append((reason, log_line))
             return None
+
+        customer_id = parts[2]
+        request_path = parts[3]
+        status_code = int(parts[4])
+
+        # Determine if the request was successful (status_code 2xx or 3xx)
+        success = 1 if 200 <= status_code < 400 else 0
+        if self.tagged:
+            tags = {
+                "customer_id": customer_id,
+                "path": normalize_path(request_path),
+                "status_class": status_class(status_code),
+                "success": success
+            }
+            fields = {"duration": duration}
+        else:
+            tags = {"customer_id": customer_id, "success": success}
+            fields = {"duration": duration, "status_code": status_code, "request_path": request_path}
+        record = {
+            "measurement": self.measurement,
+            "tags": tags,
+            "fields": fields,
+            "time":  timestamp.isoformat() + "Z"
+        }
+        return record
+
+
+@lru_cache(maxsize=LOG_TIMESTAMP_CACHE_SIZE)
+def epoch_ns(timestamp: str) -> Optional[str]:
+    """
+    Converts a `YYYY-MM-DD HH:MM:SS` (UTC) timestamp to epoch nanoseconds by slicing fixed offsets, returns None
+    if the timestamp is not in that layout. Logs are second resolution and arrive roughly in order, so the cache
+    turns most calls into a dict lookup.
+    """
+    if (len(timestamp) != 19 or timestamp[4] != "-" or timestamp[7] != "-" or timestamp[10] != " "
+            or timestamp[13] != ":" or timestamp[16] != ":"):
+        return None
+
+    digits = timestamp[0:4] + timestamp[5:7] + timestamp[8:10] + timestamp[11:13] + timestamp[14:16] + timestamp[17:19]
+    if not digits.isdigit():
+        return None
+
+    try:
+        seconds = datetime(
+            int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+            int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]), tzinfo=timezone.utc
+        ).timestamp()
+    except ValueError:
+        return None
+    return str(int(seconds) * 1_000_000_000)
+
+
+class LineProtocolLogHandler(LogHandler):
+    """
+    Fast path for the generator's fixed `YYYY-MM-DD HH:MM:SS cust path status duration` layout. Each line is
+    serialized straight to line protocol into a buffer reused across batches, skipping the per line dict and the
+    influx client's dict -> Point -> line protocol conversion. Lines with any other timestamp layout go through
+    the dict path so both handlers write the same points.
+    """
+
+    def __init__(self, storage, schema_mode: str = LOG_SCHEMA_MODE, rejections: Optional[Rejections] = None):
+        super().__init__(storage, schema_mode, rejections)
+        # one handler is shared by the worker threads of a process, each thread reuses its own buffer
+        self._local = threading.local()
+
+    def prepare_log(self, log_lines: List[str], rollups=None) -> bytes:
+        logging.info(f"LogHandler received {len(log_lines)}")
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = bytearray()
+        del buffer[:]
+
+        started = time.perf_counter()
+        ready_logs = 0
+        rejected: List[Rejection] = []
+        for log_line in log_lines:
+            if self._serialize_log(log_line, buffer, rejected, rollups):
+                ready_logs += 1
+
+        observe_parsed(len(log_lines), ready_logs, time.perf_counter() - started)
+        self.rejections.record(rejected)
+        logging.info(f"LogHandler ready to save {ready_logs} logs in DB")
+        return bytes(buffer)
+
+    def _serialize_log(self, log_line: str, buffer: bytearray, rejected: List[Rejection], rollups=None) -> bool:
+        timestamp = epoch_ns(log_line[:19]) if len(log_line) > 20 and log_line[19] == " " else None
+        if timestamp is None:
+            return self._serialize_record(log_line, buffer, rejected, rollups)
+
+        parts = log_line[20:].split()
+        reason = REJECT_MISSING_FIELDS if len(parts) < 4 else invalid_fields(parts[2], parts[3])
+        if reason is None:
+            status_code = int(parts[2])
+            duration = float(parts[3])
+            # enough digits overflow to inf
+            if not math.isfinite(duration):
+                reason = REJECT_DURATION
+        if reason is not None:
+            rejected.append((reason, log_line))
+            return False
+
+        # same float formatting as influxdb_client.Point, whole numbers lose their trailing ".0"
+        duration_str = str(duration)
+        if duration_str.endswith(".0"):
+            duration_str = duration_str[:-2]
+
+        success = 1 if 200 <= status_code < 400 else 0
+        if self.tagged:
+            buffer += (
+                f"{self.measurement},customer_id={escape_tag(parts[0])},path={escape_tag(normalize_path(parts[1]))},"
+                f"status_class={status_code // 100}xx,success={success} "
+                f"duration={duration_str} "
+                f"{timestamp}\n"
+            ).encode()
+        else:
+            buffer += (
+                f"{self.measurement},customer_id={escape_tag(parts[0])},"
+                f"success={success} "
+                f"duration={duration_str},request_path=\"{escape_string(parts[1])}\",status_code={status_code}i "
+                f"{timestamp}\n"
+            ).encode()
+        if rollups is not None:
+            rollups.add(parts[0], log_line[:10], success, duration)
+        return True
+
+    def _serialize_record(self, log_line: str, buffer: bytearray, rejected: List[Rejection], rollups=None) -> bool:
+        record = self._process_log(log_line, rejected)
+        if not record:
+            return False
+        buffer += Point.from_dict(record).to_line_protocol().encode()
+        buffer += b"\n"
+        if rollups is not None:
+            self._add_to_rollups(record, rollups)
+        return True
@@ -1,11 +1,17 @@
+import atexit
 import logging
+import os
 
 from config import (
+    LOG_DAILY_ROLLUPS,
     LOG_FILE_PATH,
+    LOG_METRICS_PORT,
+    LOG_SPILL_DIRECTORY,
     LOGGING_LEVEL
 )
 from storage import InfluxDBStorage
 from dataflow_manager import create_dataflow
+from metrics import serve_metrics
 
 
 logging.basicConfig(
@@ -17,7 +23,19 @@ logging.basicConfig(
     ]
 )
 
-influx_storage = InfluxDBStorage()
+influx_storage = InfluxDBStorage(spill_directory=LOG_SPILL_DIRECTORY)
+# a later rollup point must never be overwritten by an earlier one, so they are written in order by one thread
+rollup_storage = InfluxDBStorage(
+    spill_directory=os.path.join(LOG_SPILL_DIRECTORY, "daily_rollups") if LOG_SPILL_DIRECTORY else "", writer_threads=1
+) if LOG_DAILY_ROLLUPS else None
+# bytewax only closes sinks when the input is finite, make sure buffered points are written on any other exit too
+atexit.register(influx_storage.close)
+if rollup_storage is not None:
+    atexit.register(rollup_storage.close)
+if LOG_METRICS_PORT:
+    serve_metrics(LOG_METRICS_PORT, influx_storage)
 
 
-flow = create_dataflow(f"/log_generator/{LOG_FILE_PATH}", influx_storage)
+# the generator's whole directory is mounted at /log_generator, so rotated files and a directory or glob LOG_FILE_PATH
+# are visible too
+flow = create_dataflow(f"/log_generator/{LOG_FILE_PATH}", influx_storage, rollup_storage)
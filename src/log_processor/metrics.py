@@ -0,0 +1,68 @@
+"""
+Prometheus metrics of the log processor, served on LOG_METRICS_PORT by main.py. Everything per line is counted once
+per batch, the writer's and spill queue's own counters are read from InfluxDBStorage.metrics() on every scrape.
+"""
+from typing import Iterator
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+LINES_READ = Counter("log_processor_lines_read", "Log lines read from the log files")
+LINES_PARSED = Counter("log_processor_lines_parsed", "Log lines parsed into points")
+LINES_REJECTED = Counter("log_processor_lines_rejected", "Log lines that could not be parsed", ["reason"])
+DEAD_LETTERS = Counter("log_processor_dead_letters", "Rejected log lines written to the dead letter file")
+PARSE_SECONDS = Histogram(
+    "log_processor_parse_seconds", "Time to parse a batch of log lines",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+PARSE_BATCH_LINES = Histogram(
+    "log_processor_parse_batch_lines", "Log lines per parsed batch",
+    buckets=(1, 10, 100, 1_000, 10_000, 100_000)
+)
+WRITE_SECONDS = Histogram(
+    "log_processor_write_seconds", "InfluxDB write request latency",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+WRITE_BATCH_POINTS = Histogram(
+    "log_processor_write_batch_points", "Points per InfluxDB write request",
+    buckets=(1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+)
+WRITE_ERRORS = Counter("log_processor_write_errors", "Failed InfluxDB write requests, retries included", ["status"])
+ROLLUP_LATE_REQUESTS = Counter(
+    "log_processor_rollup_late_requests", "Requests of days closed before they were read, left out of the daily rollups"
+)
+SOURCE_LAG_BYTES = Gauge("log_processor_source_lag_bytes", "Bytes of a log file not read yet", ["file"])
+
+# cumulative values of InfluxDBStorage.metrics(), the rest (queue depth, batch size, backlog) are gauges
+_STORAGE_COUNTERS = (
+    "points_written", "points_retried", "points_dropped", "batches_written", "bytes_written", "bytes_sent",
+    "write_seconds_total", "backpressure_seconds_total", "points_spilled", "points_replayed", "replay_failures",
+    "replay_points_dropped",
+)
+
+
+def observe_parsed(lines: int, parsed: int, seconds: float) -> None:
+    # the rejected lines are counted by reason in rejections.py
+    LINES_PARSED.inc(parsed)
+    PARSE_SECONDS.observe(seconds)
+    PARSE_BATCH_LINES.observe(lines)
+
+
+class StorageCollector(Collector):
+    def __init__(self, storage):
+        self.storage = storage
+
+    def collect(self) -> Iterator:
+        for name, value in self.storage.metrics().items():
+            # the counter families add the _total suffix themselves
+            metric_name = "log_processor_storage_" + name.removesuffix("_total")
+            if name in _STORAGE_COUNTERS:
+                yield CounterMetricFamily(metric_name, f"InfluxDB storage {name}", value=value)
+            else:
+                yield GaugeMetricFamily(metric_name, f"InfluxDB storage {name}", value=value)
+
+
+def serve_metrics(port: int, storage) -> None:
+    REGISTRY.register(StorageCollector(storage))
+    start_http_server(port)
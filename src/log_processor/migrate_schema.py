@@ -0,0 +1,125 @@
+"""
+Rewrites the points stored with the legacy schema into the tagged one (see schema.py), a (UTC) day at a time:
+    python migrate_schema.py --from-date 2024-09-01 [--to-date 2024-10-01] [--delete-legacy] [--dry-run]
+
+Every legacy point is turned back into its log line and serialized by the same handler as the dataflow, migrated
+points are exactly what ingesting the line with LOG_SCHEMA_MODE=tagged writes, so running it again or over days
+already ingested in tagged mode just overwrites the same points. With --delete-legacy a day's legacy points are
+deleted once all of its migrated points were written and none of its points was rejected, a day with rejected points
+keeps them (see the dead letter file, rejections.py) and the migration ends with an error.
+"""
+import argparse
+import logging
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Iterator, Optional, Tuple
+
+from influxdb_client import InfluxDBClient
+from config import INFLUXDB_BUCKET, INFLUXDB_ORG, INFLUXDB_TOKEN, INFLUXDB_URL, LOG_BATCH_SIZE
+from log_handler import LineProtocolLogHandler
+from schema import LEGACY_SCHEMA, TAGGED_SCHEMA, measurement
+from storage import InfluxDBStorage
+
+
+def legacy_day_query(day: date) -> str:
+    """A row per legacy point with its three fields side by side."""
+    return """
+        from(bucket: "{bucket}")
+          |> range(start: {day}T00:00:00Z, stop: {next_day}T00:00:00Z)
+          |> filter(fn: (r) => r._measurement == "{measurement}")
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+        """.format(bucket=INFLUXDB_BUCKET, day=day, next_day=day + timedelta(days=1),
+                   measurement=measurement(LEGACY_SCHEMA))
+
+
+def to_log_line(record) -> Optional[str]:
+    """The log line a legacy point was ingested from, None if a field is missing."""
+    values = record.values
+    if any(values.get(field) is None for field in ("request_path", "status_code", "duration")):
+        return None
+    time = record.get_time()
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S") + (f".{time.microsecond:06d}" if time.microsecond else "")
+    return (f"{timestamp} {values['customer_id']} {values['request_path']} "
+            f"{int(values['status_code'])} {format_duration(values['duration'])}")
+
+
+def format_duration(duration) -> str:
+    """The shortest plain decimal of a float, 5e-05 is written 0.00005."""
+    return format(Decimal(repr(float(duration))), "f")
+
+
+def batches(lines: Iterator[Optional[str]], size: int) -> Iterator[list]:
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def migrate_day(client: InfluxDBClient, handler: LineProtocolLogHandler, storage: Optional[InfluxDBStorage],
+                day: date) -> Tuple[int, int]:
+    """The points of a day that were migrated and the ones that were rejected, by a missing field or the handler."""
+    migrated = rejected = 0
+    records = client.query_api().query_stream(org=INFLUXDB_ORG, query=legacy_day_query(day))
+    for batch in batches(map(to_log_line, records), LOG_BATCH_SIZE):
+        lines = [line for line in batch if line is not None]
+        log_data = handler.prepare_log(lines) if lines else b""
+        parsed = log_data.count(b"\n")
+        if storage is not None and parsed:
+            storage.store_log(log_data)
+        migrated += parsed
+        rejected += len(batch) - parsed
+    return migrated, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-date", type=date.fromisoformat, required=True)
+    parser.add_argument("--to-date", type=date.fromisoformat, default=datetime.now(timezone.utc).date(),
+                        help="last day to migrate, today by default")
+    parser.add_argument("--delete-legacy", action="store_true", help="delete each day's legacy points once migrated")
+    parser.add_argument("--dry-run", action="store_true", help="only count the points to migrate")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s: %(message)s')
+
+    # no spilling, a day's legacy points may only be deleted once its migrated points were written
+    storage = None if args.dry_run else InfluxDBStorage(spill_directory="")
+    handler = LineProtocolLogHandler(storage, schema_mode=TAGGED_SCHEMA)
+    with InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG) as client:
+        try:
+            kept_days = []
+            day = args.from_date
+            while day <= args.to_date:
+                dropped = storage.counters()["points_dropped"] if storage is not None else 0
+                migrated, rejected = migrate_day(client, handler, storage, day)
+                if storage is None:
+                    print(f"{day}: {migrated} points to migrate, {rejected} rejected")
+                else:
+                    storage.flush()
+                    if storage.counters()["points_dropped"] != dropped:
+                        raise SystemExit(f"{day}: writing migrated points failed, legacy points were kept")
+                    delete = args.delete_legacy and migrated and not rejected
+                    if args.delete_legacy and rejected:
+                        kept_days.append(day)
+                    if delete:
+                        client.delete_api().delete(
+                            start=f"{day}T00:00:00Z", stop=f"{day}T23:59:59.999999999Z",
+                            predicate=f'_measurement="{measurement(LEGACY_SCHEMA)}"',
+                            bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG
+                        )
+                    deleted = ", legacy points deleted" if delete else ""
+                    print(f"{day}: migrated {migrated} points, {rejected} rejected{deleted}")
+                day += timedelta(days=1)
+            if kept_days:
+                raise SystemExit(f"Points were rejected on {', '.join(map(str, kept_days))}, "
+                                 f"their legacy points were kept")
+        finally:
+            if storage is not None:
+                storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,225 @@
+import glob
+import gzip
 import logging
 import os
-from bytewax.inputs import SimplePollingSource
-from datetime import timedelta
+from bytewax.inputs import FixedPartitionedSource, StatefulSourcePartition
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Dict, List, Optional, Tuple
 
+from config import LOG_READ_BLOCK_SIZE, LOG_ROTATED_GLOB, LOG_START_POSITION
+from metrics import LINES_READ, SOURCE_LAG_BYTES
 
-class LogPollingSource(SimplePollingSource):
-    def __init__(self, log_file_path, poll_interval):
-        logging.info(f"Initializing LogPollingSource with log file: {log_file_path} and interval: {poll_interval}s")
+START_END = "end"
+START_BEGINNING = "beginning"
+START_SAVED = "saved"
+
+
+def resolve_log_files(log_file_path: str) -> List[str]:
+    """A directory stands for the `*.log` files in it, a pattern for the files it matches, anything else is one file."""
+    if os.path.isdir(log_file_path):
+        return sorted(glob.glob(os.path.join(log_file_path, "*.log")))
+    if any(char in log_file_path for char in "*?["):
+        return sorted(glob.glob(log_file_path))
+    return [log_file_path]
+
+
+def open_log_file(path: str) -> BinaryIO:
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+class LogFilePartition(StatefulSourcePartition):
+    """
+    Reads the log file in blocks of up to `block_size` bytes per poll and emits every complete line in the block
+    as one item, the trailing partial line (the writer may be half way through it) is kept until its newline
+    shows up in a later block. The snapshot is the byte offset of the first line not emitted yet plus the inode
+    of the file, so a resumed dataflow continues exactly where it left off.
+
+    Whenever the end of the file is reached the path is checked again: if it points to a new inode the file was
+    rotated, whatever is left in the old file is drained and reading continues from the start of the new file. If
+    the file shrank it was truncated and is read again from the start. Rotated files matching `rotated_glob` and
+    named after the log file (`<name>.*`) are read (oldest first, gzipped or not) before the live file when starting
+    from the beginning, or when the saved offset belongs to a file that has been rotated since.
+    """
+
+    def __init__(self, log_file_path: str, interval: timedelta, block_size: int, start_position: str,
+                 resume_state: Optional[Dict[str, int]], rotated_glob: Optional[str] = None):
         self.log_file_path = log_file_path
-        self.log_file = open(log_file_path, 'r')
-        self.log_file.seek(0, os.SEEK_END)  # Move to the end of file
-        logging.info(f"Opened log file: {log_file_path}, starting at the end.")
+        self.block_size = block_size
+        self.rotated_glob = rotated_glob
+        self._interval = interval
+        self._partial_line = b""
+        self._next_awake: Optional[datetime] = None
+        self._catch_up: List[Tuple[str, int]] = []
+        self._catch_up_file: Optional[BinaryIO] = None
+        self._catch_up_inode: Optional[int] = None
+        self.log_file = open(log_file_path, 'rb')
+        self._inode = os.fstat(self.log_file.fileno()).st_ino
+        self.log_file.seek(self._start_offset(start_position, resume_state))
+        logging.info(f"Opened log file: {log_file_path}, starting at offset {self.log_file.tell()}, "
+                     f"reading {block_size} bytes per poll.")
+        self._open_next_catch_up_file()
+
+    def _rotated_files(self) -> List[str]:
+        if not self.rotated_glob:
+            return []
+        # a relative pattern is relative to the directory of the log file
+        pattern = os.path.join(os.path.dirname(self.log_file_path), self.rotated_glob)
+        # with several log files in one directory the pattern may match the rotations of all of them
+        prefix = os.path.basename(self.log_file_path) + "."
+        rotated = [path for path in glob.glob(pattern) if os.path.basename(path).startswith(prefix)]
+        return sorted(rotated, key=os.path.getmtime)
+
+    def _start_offset(self, start_position: str, resume_state: Optional[Dict[str, int]]) -> int:
+        size = os.fstat(self.log_file.fileno()).st_size
+
+        if start_position == START_SAVED and resume_state is not None:
+            if resume_state["inode"] == self._inode and resume_state["offset"] <= size:
+                logging.info(f"Resuming {self.log_file_path} from saved offset {resume_state['offset']}")
+                return resume_state["offset"]
+
+            rotated = self._rotated_files()
+            for i, path in enumerate(rotated):
+                if os.stat(path).st_ino == resume_state["inode"]:
+                    logging.info(f"{self.log_file_path} was rotated to {path} since it was last read, catching up "
+                                 f"from saved offset {resume_state['offset']}")
+                    self._catch_up = [(path, resume_state["offset"])] + [(newer, 0) for newer in rotated[i + 1:]]
+                    return 0
+
+            logging.warning(f"{self.log_file_path} was replaced or truncated since it was last read, "
+                            f"reading it from the beginning")
+            return 0
+
+        if start_position == START_BEGINNING:
+            self._catch_up = [(path, 0) for path in self._rotated_files()]
+            return 0
+        return size
+
+    def _open_next_catch_up_file(self) -> None:
+        if not self._catch_up:
+            self._catch_up_file = None
+            self._catch_up_inode = None
+            return
+
+        path, offset = self._catch_up.pop(0)
+        logging.info(f"Catching up on rotated log file: {path} from offset {offset}")
+        self._catch_up_inode = os.stat(path).st_ino
+        self._catch_up_file = open_log_file(path)
+        self._catch_up_file.seek(offset)
+
+    def next_batch(self) -> List[Tuple[str, List[str]]]:
+        reader = self._catch_up_file or self.log_file
+        block = reader.read(self.block_size)
+        # a full block means the file probably has more, poll again right away instead of waiting an interval
+        read_again = len(block) == self.block_size
 
-        super().__init__(timedelta(milliseconds=poll_interval))
+        if block:
+            lines = self._split_lines(block)
+        elif self._catch_up_file is not None:
+            lines = self._drain(self._catch_up_file)
+            self._catch_up_file.close()
+            self._open_next_catch_up_file()
+            read_again = True
+        else:
+            lines = self._follow_rotation()
+            read_again = lines is not None
+
+        self._next_awake = None if read_again else datetime.now(timezone.utc) + self._interval
+        SOURCE_LAG_BYTES.labels(self.log_file_path).set(self.lag_bytes())
+        if lines:
+            LINES_READ.inc(len(lines))
+            return [(self.log_file_path, lines)]
+        return []
+
+    def lag_bytes(self) -> int:
+        """Bytes of the live file not read yet, the whole file while still catching up on rotated ones."""
+        return max(0, os.fstat(self.log_file.fileno()).st_size - self.log_file.tell())
+
+    def _follow_rotation(self) -> Optional[List[str]]:
+        """
+        Called at the end of the live file, returns the lines left in the old file if it was rotated or truncated
+        (reading continues from the start of the file at the path), None if nothing changed.
+        """
+        try:
+            stat = os.stat(self.log_file_path)
+        except FileNotFoundError:
+            # rotated and the new file is not there yet, keep reading the old one
+            return None
+
+        if stat.st_ino != self._inode:
+            lines = self._drain(self.log_file)
+            self.log_file.close()
+            self.log_file = open(self.log_file_path, 'rb')
+            self._inode = os.fstat(self.log_file.fileno()).st_ino
+            logging.info(f"{self.log_file_path} was rotated, reading the new file from the beginning")
+            return lines
+
+        if stat.st_size < self.log_file.tell():
+            logging.warning(f"{self.log_file_path} was truncated, reading it from the beginning")
+            self.log_file.seek(0)
+            self._partial_line = b""
+            return []
 
-    def next_item(self):
-        line = self.log_file.readline().strip()
-        if line:
-            return ("ALL", line)
         return None
 
+    def _drain(self, log_file: BinaryIO) -> List[str]:
+        """Everything left in a file that won't be written anymore, an unterminated last line included."""
+        data = self._partial_line + log_file.read()
+        self._partial_line = b""
+        return [line for line in data.decode(errors="replace").splitlines() if line.strip()]
+
+    def _split_lines(self, block: bytes) -> List[str]:
+        data = self._partial_line + block
+        last_newline = data.rfind(b"\n")
+        if last_newline == -1:
+            self._partial_line = data
+            return []
+
+        self._partial_line = data[last_newline + 1:]
+        return [line for line in data[:last_newline].decode(errors="replace").splitlines() if line.strip()]
+
+    def next_awake(self) -> Optional[datetime]:
+        return self._next_awake
+
+    def snapshot(self) -> Dict[str, int]:
+        if self._catch_up_file is not None:
+            return {"inode": self._catch_up_inode, "offset": self._catch_up_file.tell() - len(self._partial_line)}
+        return {"inode": self._inode, "offset": self.log_file.tell() - len(self._partial_line)}
+
     def close(self):
         logging.info(f"Closing log file: {self.log_file_path}")
+        if self._catch_up_file is not None:
+            self._catch_up_file.close()
         self.log_file.close()
+
+
+class LogPollingSource(FixedPartitionedSource):
+    """
+    Tails the log file, `start_position` decides where reading starts: "end" of the file, its "beginning" or the
+    "saved" offset from the last bytewax snapshot (the end of the file if there is no snapshot yet).
+
+    `log_file_path` may also be a directory or a glob pattern, every file it resolves to when the dataflow is built
+    is a partition of its own and bytewax spreads the partitions over its workers.
+    """
+
+    def __init__(self, log_file_path, poll_interval, block_size=LOG_READ_BLOCK_SIZE, start_position=LOG_START_POSITION,
+                 rotated_glob=LOG_ROTATED_GLOB):
+        logging.info(f"Initializing LogPollingSource with log file: {log_file_path} and interval: {poll_interval}ms, "
+                     f"start position: {start_position}")
+        self.log_file_path = log_file_path
+        self.log_file_paths = resolve_log_files(log_file_path)
+        if not self.log_file_paths:
+            logging.warning(f"No log files match {log_file_path}")
+        self.interval = timedelta(milliseconds=poll_interval)
+        self.block_size = block_size
+        self.start_position = start_position
+        self.rotated_glob = rotated_glob
+
+    def list_parts(self) -> List[str]:
+        return self.log_file_paths
+
+    def build_part(self, step_id: str, for_part: str, resume_state: Optional[Dict[str, int]]) -> LogFilePartition:
+        return LogFilePartition(
+            for_part, self.interval, self.block_size, self.start_position, resume_state, self.rotated_glob
+        )
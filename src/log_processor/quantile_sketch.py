@@ -0,0 +1,164 @@
+import base64
+import math
+import struct
+from typing import Dict, List, Optional, Tuple
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    value, shift = 0, 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def quantile_rank(q: float, count: int) -> int:
+    """
+    The 0 based rank of the q quantile of `count` sorted values as Flux quantile(method: "exact_selector") picks it:
+    the smallest value with at least q * count values at or below it. Every aggregation mode uses these ranks.
+    """
+    return max(math.ceil(q * count) - 1, 0)
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with a bounded relative error (DDSketch). Values are counted in logarithmic buckets,
+    bucket i holds the values in (gamma^(i-1), gamma^i] with gamma = (1 + a) / (1 - a), so the value reported for
+    any rank is within `relative_accuracy` of the true value at that rank. Sketches with the same accuracy merge by
+    adding up their bucket counts, per day rollups can be combined into any range of days or customers.
+
+    At most `max_bins` buckets are kept, past that the lowest buckets are collapsed into one. With the default 1%
+    accuracy 2048 buckets span values over 17 orders of magnitude, so in practice only the error of the very lowest
+    ranks could ever grow, medians and p99s keep their guarantee.
+    """
+
+    DEFAULT_RELATIVE_ACCURACY = 0.01
+    DEFAULT_MAX_BINS = 2048
+    # log() has no bucket for 0, durations at or below this are counted apart and reported as 0
+    MIN_VALUE = 1e-9
+    # first byte of the binary encoding
+    FORMAT_VERSION = 1
+    _HEADER = struct.Struct("<Bd")
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY, max_bins: int = DEFAULT_MAX_BINS):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative_accuracy must be between 0 and 1, got {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value <= self.MIN_VALUE:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            bins = self.bins
+            if index in bins:
+                bins[index] += count
+            else:
+                bins[index] = count
+                if len(bins) > self.max_bins:
+                    self._collapse()
+        self.count += count
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"Can't merge sketches with relative accuracy {self.relative_accuracy} "
+                             f"and {other.relative_accuracy}")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        """Folds the lowest buckets into the lowest one kept, so at most max_bins remain."""
+        indexes = sorted(self.bins)
+        collapsed = indexes[:len(indexes) - self.max_bins + 1]
+        self.bins[collapsed[-1]] += sum(self.bins.pop(index) for index in collapsed[:-1])
+
+    def value_at_rank(self, rank: int) -> Optional[float]:
+        """Value of the `rank`-th smallest (0 based) value added, None if the sketch is empty."""
+        return self.values_at_ranks([rank])[0]
+
+    def values_at_ranks(self, ranks: List[int]) -> List[Optional[float]]:
+        """value_at_rank for several ranks in a single pass over the buckets."""
+        values: List[Optional[float]] = [None] * len(ranks)
+        if not self.count:
+            return values
+
+        bins = iter(sorted(self.bins.items()))
+        seen, value = self.zero_count, 0.0
+        for i in sorted(range(len(ranks)), key=ranks.__getitem__):
+            rank = min(max(ranks[i], 0), self.count - 1)
+            while rank >= seen:
+                index, count = next(bins)
+                seen += count
+                value = self._bin_value(index)
+            values[i] = value
+        return values
+
+    def quantile(self, q: float) -> Optional[float]:
+        return self.value_at_rank(quantile_rank(q, self.count))
+
+    def _bin_value(self, index: int) -> float:
+        # the middle of the bucket in relative terms, at most relative_accuracy away from any value in it
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def to_bytes(self) -> bytes:
+        """
+        Version byte and accuracy, then varints: the zero count, the number of buckets, the first bucket index
+        (zigzag encoded, it may be negative) and the gaps to the following ones, and every bucket's count.
+        """
+        out = bytearray(self._HEADER.pack(self.FORMAT_VERSION, self.relative_accuracy))
+        _write_varint(out, self.zero_count)
+        _write_varint(out, len(self.bins))
+        previous = None
+        for index, count in sorted(self.bins.items()):
+            if previous is None:
+                _write_varint(out, (index << 1) ^ (index >> 63))
+            else:
+                _write_varint(out, index - previous)
+            _write_varint(out, count)
+            previous = index
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "QuantileSketch":
+        version, relative_accuracy = cls._HEADER.unpack_from(data)
+        if version != cls.FORMAT_VERSION:
+            raise ValueError(f"Unknown quantile sketch format version {version}")
+
+        sketch = cls(relative_accuracy)
+        sketch.zero_count, position = _read_varint(data, cls._HEADER.size)
+        bins, position = _read_varint(data, position)
+        index = None
+        for _ in range(bins):
+            delta, position = _read_varint(data, position)
+            index = (delta >> 1) ^ -(delta & 1) if index is None else index + delta
+            sketch.bins[index], position = _read_varint(data, position)
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
+
+    def to_string(self) -> str:
+        """Base64 of to_bytes(), what is stored in an InfluxDB string field."""
+        return base64.b64encode(self.to_bytes()).decode()
+
+    @classmethod
+    def from_string(cls, value: str) -> "QuantileSketch":
+        return cls.from_bytes(base64.b64decode(value))
@@ -0,0 +1,107 @@
+import logging
+import os
+from bytewax.inputs import FixedPartitionedSource, StatefulSourcePartition
+from typing import List, Optional, Tuple
+
+from config import LOG_READ_BLOCK_SIZE
+from metrics import LINES_READ, SOURCE_LAG_BYTES
+from polling_source import resolve_log_files
+
+
+def split_ranges(size: int, ranges: int) -> List[Tuple[int, int]]:
+    """Splits `size` bytes into `ranges` contiguous [start, end) ranges, empty ranges are dropped."""
+    bounds = [size * i // ranges for i in range(ranges + 1)]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def range_part(log_file_path: str, start: int, end: int) -> str:
+    return f"{log_file_path}:{start}-{end}"
+
+
+def parse_range_part(part: str) -> Tuple[str, int, int]:
+    log_file_path, byte_range = part.rsplit(":", 1)
+    start, end = byte_range.split("-")
+    return log_file_path, int(start), int(end)
+
+
+class LogFileRangePartition(StatefulSourcePartition):
+    """
+    Reads the lines of a static log file that start inside [start, end) once, block by block, then ends. A line
+    crossing `start` belongs to the previous range, a line crossing `end` is read to its newline. The snapshot is
+    the offset of the first line not emitted yet.
+    """
+
+    def __init__(self, part: str, block_size: int, resume_state: Optional[int]):
+        self.part = part
+        self.log_file_path, self.start, self.end = parse_range_part(part)
+        self.block_size = block_size
+        self._partial_line = b""
+        self._done = False
+        self.log_file = open(self.log_file_path, 'rb')
+
+        if resume_state is not None:
+            self.log_file.seek(resume_state)
+        elif self.start > 0:
+            # skip the rest of the line the previous range ends with
+            self.log_file.seek(self.start - 1)
+            self.log_file.readline()
+        self._offset = self.log_file.tell()
+        logging.info(f"Reading {part} from offset {self._offset}")
+
+    def next_batch(self) -> List[Tuple[str, List[str]]]:
+        if self._done or self._offset >= self.end:
+            raise StopIteration()
+
+        block = self.log_file.read(self.block_size)
+        data = self._partial_line + block
+        if not block:
+            # end of the file, its last line may not be terminated
+            self._done = True
+            cut = len(data)
+        else:
+            # the newline ending the line that holds the last byte of the range
+            newline = data.find(b"\n", self.end - 1 - self._offset)
+            if newline != -1:
+                self._done = True
+                cut = newline + 1
+            else:
+                cut = data.rfind(b"\n") + 1
+
+        self._partial_line = data[cut:]
+        self._offset += cut
+        lines = [line for line in data[:cut].decode(errors="replace").splitlines() if line.strip()]
+        SOURCE_LAG_BYTES.labels(self.part).set(0 if self._done else max(0, self.end - self._offset))
+        if lines:
+            LINES_READ.inc(len(lines))
+            return [(self.part, lines)]
+        return []
+
+    def snapshot(self) -> int:
+        return self._offset
+
+    def close(self):
+        self.log_file.close()
+
+
+class LogFileRangeSource(FixedPartitionedSource):
+    """
+    Reads static log files (a file, a directory or a glob pattern) once, each file split into `ranges` byte ranges
+    that are partitions of their own, so a single large file is parsed by all bytewax workers. The ranges are taken
+    from the file sizes when the dataflow is built, the files must not change afterwards.
+    """
+
+    def __init__(self, log_file_path, ranges, block_size=LOG_READ_BLOCK_SIZE):
+        self.log_file_path = log_file_path
+        self.block_size = block_size
+        self.parts = [
+            range_part(path, start, end)
+            for path in resolve_log_files(log_file_path)
+            for start, end in split_ranges(os.path.getsize(path), ranges)
+        ]
+        logging.info(f"Initializing LogFileRangeSource with {len(self.parts)} byte ranges of {log_file_path}")
+
+    def list_parts(self) -> List[str]:
+        return self.parts
+
+    def build_part(self, step_id: str, for_part: str, resume_state: Optional[int]) -> LogFileRangePartition:
+        return LogFileRangePartition(for_part, self.block_size, resume_state)
@@ -0,0 +1,117 @@
+"""
+What happens to the log lines the handlers reject. They are counted by reason (log_processor_lines_rejected_total),
+the first and then every LOG_REJECTED_LOG_EVERY-th rejection of a reason is logged with the line, and with a
+LOG_DEAD_LETTER_PATH every rejected line is appended to that file as a JSON line with its reason. The handlers collect
+a batch's rejections in a list and hand them over once per batch.
+"""
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from config import LOG_DEAD_LETTER_MAX_BYTES, LOG_DEAD_LETTER_PATH, LOG_REJECTED_LOG_EVERY
+from metrics import DEAD_LETTERS, LINES_REJECTED
+
+REJECT_MISSING_FIELDS = "missing_fields"
+REJECT_TIMESTAMP = "invalid_timestamp"
+REJECT_STATUS_CODE = "invalid_status_code"
+REJECT_STATUS_CODE_RANGE = "status_code_out_of_range"
+REJECT_DURATION = "invalid_duration"
+
+# (reason, raw line)
+Rejection = Tuple[str, str]
+
+
+class DeadLetterFile:
+    """
+    Appends rejected lines as `{"time": ..., "reason": ..., "line": ...}` JSON lines. The file is opened on the first
+    rejection, once it is `max_bytes` long further lines are only counted.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._file = None
+        self._lock = threading.Lock()
+        self._full = False
+
+    def write(self, rejected: List[Rejection]) -> int:
+        now = datetime.now(timezone.utc).isoformat()
+        data = "".join(json.dumps({"time": now, "reason": reason, "line": line}) + "\n"
+                       for reason, line in rejected).encode()
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "ab")
+            if self._file.tell() + len(data) > self.max_bytes:
+                if not self._full:
+                    logging.warning(f"Dead letter file {self.path} reached {self.max_bytes} bytes, "
+                                    f"rejected lines are only counted from now on")
+                self._full = True
+                return 0
+            self._file.write(data)
+            self._file.flush()
+        return len(rejected)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Rejections:
+    """Counts, samples to the log and dead-letters the rejected lines of a process, shared by its worker threads."""
+
+    def __init__(self, log_every: int = LOG_REJECTED_LOG_EVERY, dead_letter: Optional[DeadLetterFile] = None):
+        self.log_every = log_every
+        self.dead_letter = dead_letter
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, dead_letter_path: str = LOG_DEAD_LETTER_PATH) -> "Rejections":
+        dead_letter = DeadLetterFile(dead_letter_path, LOG_DEAD_LETTER_MAX_BYTES) if dead_letter_path else None
+        return cls(LOG_REJECTED_LOG_EVERY, dead_letter)
+
+    def record(self, rejected: List[Rejection]) -> None:
+        if not rejected:
+            return
+        by_reason = Counter(reason for reason, _ in rejected)
+        samples = []
+        with self._lock:
+            for reason, count in by_reason.items():
+                LINES_REJECTED.labels(reason).inc(count)
+                before = self._counts.get(reason, 0)
+                total = self._counts[reason] = before + count
+                # the first rejection of a reason, then one every log_every
+                if self.log_every and (before == 0 or before // self.log_every != total // self.log_every):
+                    samples.append((reason, total))
+        for reason, total in samples:
+            line = next(line for line_reason, line in rejected if line_reason == reason)
+            logging.warning(f"Rejected log line ({reason}, {total} so far): {line[:200]!r}")
+        if self.dead_letter is not None:
+            DEAD_LETTERS.inc(self.dead_letter.write(rejected))
+
+    def counts(self) -> Dict[str, int]:
+        """Rejected lines by reason since the start."""
+        with self._lock:
+            return dict(self._counts)
+
+
+_default_rejections: Optional[Rejections] = None
+_default_lock = threading.Lock()
+
+
+def default_rejections() -> Rejections:
+    """The process wide Rejections of LOG_DEAD_LETTER_PATH and LOG_REJECTED_LOG_EVERY, the handlers' default."""
+    global _default_rejections
+    with _default_lock:
+        if _default_rejections is None:
+            _default_rejections = Rejections.from_config()
+        return _default_rejections
@@ -0,0 +1,94 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from config import LOG_ROLLUP_OPEN_DAYS
+from log_handler import escape_tag
+from metrics import ROLLUP_LATE_REQUESTS
+from quantile_sketch import QuantileSketch
+
+ROLLUP_MEASUREMENT = "api_requests_daily"
+
+
+class DailyRollup:
+    """Request counts, duration sum and a duration sketch of one customer for one (UTC) day."""
+
+    def __init__(self, customer_id: str, day: str):
+        self.customer_id = customer_id
+        self.day = day
+        self.requests = 0
+        self.successful_requests = 0
+        self.duration_sum = 0.0
+        self.sketch = QuantileSketch()
+
+    @property
+    def failed_requests(self) -> int:
+        return self.requests - self.successful_requests
+
+    def add(self, success: int, duration: float) -> None:
+        self.requests += 1
+        self.successful_requests += success
+        self.duration_sum += duration
+        self.sketch.add(duration)
+
+    def merge(self, other: "DailyRollup") -> None:
+        self.requests += other.requests
+        self.successful_requests += other.successful_requests
+        self.duration_sum += other.duration_sum
+        self.sketch.merge(other.sketch)
+
+    def to_line_protocol(self) -> str:
+        # one point per customer and day at midnight, writing it again with newer totals overwrites the fields
+        midnight = datetime.fromisoformat(self.day).replace(tzinfo=timezone.utc)
+        return (
+            f"{ROLLUP_MEASUREMENT},customer_id={escape_tag(self.customer_id)} "
+            f"requests={self.requests}i,successful_requests={self.successful_requests}i,"
+            f"failed_requests={self.failed_requests}i,duration_sum={self.duration_sum!r},"
+            f"duration_sketch=\"{self.sketch.to_string()}\" "
+            f"{int(midnight.timestamp())}000000000"
+        )
+
+
+class DailyRollups:
+    """Partial rollups of one batch of log lines, the log handlers add every line they store."""
+
+    def __init__(self):
+        self._rollups: Dict[Tuple[str, str], DailyRollup] = {}
+
+    def add(self, customer_id: str, day: str, success: int, duration: float) -> None:
+        rollup = self._rollups.get((customer_id, day))
+        if rollup is None:
+            rollup = self._rollups[(customer_id, day)] = DailyRollup(customer_id, day)
+        rollup.add(success, duration)
+
+    def values(self) -> List[DailyRollup]:
+        return list(self._rollups.values())
+
+
+def update_daily_rollups(state: Optional[Dict[str, DailyRollup]],
+                         partial: DailyRollup) -> Tuple[Dict[str, DailyRollup], Optional[bytes]]:
+    """
+    Bytewax stateful_map step keyed by customer, the state holds the customer's rollups of the last
+    LOG_ROLLUP_OPEN_DAYS (UTC) days by the wall clock. Merges a batch's partial rollup into its day, in whatever order
+    the days arrive, and emits the day's updated point. Days that fall out of the window are dropped from the state,
+    lines of a closed day are too late to be rolled up and are counted by log_processor_rollup_late_requests. The API
+    checks the rollups against the raw points and doesn't serve such days from them.
+    """
+    state = state if state is not None else {}
+    horizon = (datetime.now(timezone.utc).date() - timedelta(days=LOG_ROLLUP_OPEN_DAYS - 1)).isoformat()
+    for day in [day for day in state if day < horizon]:
+        del state[day]
+
+    if partial.day < horizon:
+        ROLLUP_LATE_REQUESTS.inc(partial.requests)
+        logging.warning(f"Skipping rollup of {partial.requests} late requests of {partial.customer_id} "
+                        f"on {partial.day}, the day was closed")
+        return state, None
+
+    rollup = state.get(partial.day)
+    if rollup is None:
+        rollup = state[partial.day] = partial
+    else:
+        rollup.merge(partial)
+
+    return state, (rollup.to_line_protocol() + "\n").encode()
@@ -0,0 +1,34 @@
+import re
+from functools import lru_cache
+
+# "legacy": api_requests tagged by customer_id and success, with duration, status_code and request_path fields.
+# "tagged": api_requests_tagged, the (normalized) path and status class are tags too and duration the only field,
+# filtering by path or status class reads just the matching series.
+LEGACY_SCHEMA = "legacy"
+TAGGED_SCHEMA = "tagged"
+MEASUREMENTS = {LEGACY_SCHEMA: "api_requests", TAGGED_SCHEMA: "api_requests_tagged"}
+
+# numeric ids, UUIDs and long hex ids (object ids, hashes) would each become a series of their own
+_ID_SEGMENT = re.compile(
+    r"\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|[0-9a-fA-F]{24,}"
+)
+ID_PLACEHOLDER = ":id"
+_PATH_CACHE_SIZE = 8192
+
+
+def measurement(schema_mode: str) -> str:
+    if schema_mode not in MEASUREMENTS:
+        raise ValueError(f"Unknown schema mode {schema_mode!r}, expected one of {sorted(MEASUREMENTS)}")
+    return MEASUREMENTS[schema_mode]
+
+
+@lru_cache(maxsize=_PATH_CACHE_SIZE)
+def normalize_path(path: str) -> str:
+    """Drops the query string and trailing slash and replaces id segments, `/users/42/?a=1` -> `/users/:id`."""
+    path = path.split("?", 1)[0].split("#", 1)[0]
+    segments = [ID_PLACEHOLDER if _ID_SEGMENT.fullmatch(segment) else segment for segment in path.split("/")]
+    return "/".join(segments).rstrip("/") or "/"
+
+
+def status_class(status_code: int) -> str:
+    return f"{status_code // 100}xx"
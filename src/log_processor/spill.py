@@ -0,0 +1,208 @@
+import glob
+import logging
+import os
+import random
+import struct
+import threading
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+from writer import is_retryable
+
+# every record is a line protocol batch prefixed by its length and number of points
+_HEADER = struct.Struct("<II")
+_SEGMENT_SUFFIX = ".spill"
+
+
+class SpillQueue:
+    """
+    A FIFO of line protocol batches kept on disk in `directory`: append-only segment files of up to `segment_bytes`
+    each, named by an increasing sequence number so they are read back in the order they were written. A segment is
+    deleted once every batch in it was popped, append() refuses batches that would take the queue past `max_bytes`.
+
+    The batches found in `directory` on start are queued again. Popping only happens in memory until the segment is
+    deleted, so after a restart the batches of a partly replayed segment are written again, which InfluxDB treats as
+    overwriting the same points.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int, max_bytes: int):
+        self.directory = directory
+        self._segment_bytes = segment_bytes
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        # (segment sequence number, offset, length, points) of every queued batch, oldest first
+        self._batches: deque = deque()
+        self._segments: Dict[int, int] = {}  # sequence number -> queued batches
+        self._bytes = 0
+        self._points = 0
+        self._points_spilled = 0
+        self._file = None
+        self._file_seq = 0
+        self._file_size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:012d}{_SEGMENT_SUFFIX}")
+
+    def _load(self) -> None:
+        paths = sorted(glob.glob(os.path.join(self.directory, f"*{_SEGMENT_SUFFIX}")))
+        for path in paths:
+            seq = int(os.path.basename(path)[:-len(_SEGMENT_SUFFIX)])
+            self._file_seq = max(self._file_seq, seq)
+            offset, size = 0, os.path.getsize(path)
+            with open(path, "rb") as segment:
+                while offset + _HEADER.size <= size:
+                    length, points = _HEADER.unpack(segment.read(_HEADER.size))
+                    if offset + _HEADER.size + length > size:
+                        break
+                    self._add(seq, offset + _HEADER.size, length, points)
+                    offset += _HEADER.size + length
+                    segment.seek(offset)
+            if offset < size:
+                # a batch cut short by a crash, it was never acknowledged so it is still in the write pipeline
+                logging.warning(f"Truncating {size - offset} bytes of an incomplete batch from {path}")
+                os.truncate(path, offset)
+            if not self._segments.get(seq):
+                os.remove(path)
+        if self._batches:
+            logging.warning(f"Found {self._points} points spilled by a previous run in {self.directory}")
+
+    def _add(self, seq: int, offset: int, length: int, points: int) -> None:
+        self._batches.append((seq, offset, length, points))
+        self._segments[seq] = self._segments.get(seq, 0) + 1
+        self._bytes += _HEADER.size + length
+        self._points += points
+
+    def append(self, data: bytes, points: int) -> bool:
+        """Queues a batch, False if the queue is full."""
+        size = _HEADER.size + len(data)
+        with self._lock:
+            if self._bytes + size > self._max_bytes:
+                return False
+            if self._file is None or (self._file_size and self._file_size + size > self._segment_bytes):
+                self._roll()
+            self._file.write(_HEADER.pack(len(data), points))
+            self._file.write(data)
+            self._file.flush()
+            self._add(self._file_seq, self._file_size + _HEADER.size, len(data), points)
+            self._file_size += size
+            self._points_spilled += points
+            self._not_empty.notify_all()
+        return True
+
+    def _roll(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._file_seq += 1
+        self._file = open(self._path(self._file_seq), "ab")
+        self._file_size = 0
+
+    def peek(self, timeout: Optional[float] = None) -> Optional[Tuple[bytes, int]]:
+        """The oldest batch and its number of points, waits up to `timeout` seconds for one when empty."""
+        with self._lock:
+            if not self._batches and not self._not_empty.wait_for(lambda: self._batches, timeout):
+                return None
+            seq, offset, length, points = self._batches[0]
+            with open(self._path(seq), "rb") as segment:
+                segment.seek(offset)
+                return segment.read(length), points
+
+    def pop(self) -> None:
+        """Removes the oldest batch, deleting its segment when it was the segment's last."""
+        with self._lock:
+            seq, _, length, points = self._batches.popleft()
+            self._bytes -= _HEADER.size + length
+            self._points -= points
+            self._segments[seq] -= 1
+            if self._segments[seq]:
+                return
+            del self._segments[seq]
+            if seq == self._file_seq and self._file is not None:
+                self._file.close()
+                self._file = None
+            os.remove(self._path(seq))
+
+    def sync(self) -> None:
+        """Makes the appended batches durable, not just handed to the OS."""
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._batches)
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "spill_batches": len(self._batches),
+                "spill_points": self._points,
+                "spill_bytes": self._bytes,
+                "spill_segments": len(self._segments),
+                "points_spilled": self._points_spilled,
+            }
+
+
+class SpillReplayer:
+    """
+    Writes the spilled batches back with `send`, oldest first and one at a time from a single thread, so a recovering
+    InfluxDB gets the backlog at the pace it accepts it rather than all at once. While writes fail it backs off from
+    `retry_interval_ms` up to `max_retry_interval_ms` with jitter, batches rejected as invalid are dropped.
+    """
+
+    def __init__(self, spill: SpillQueue, send: Callable[[bytes], None], retry_interval_ms: int,
+                 max_retry_interval_ms: int):
+        self._spill = spill
+        self._send = send
+        self._retry_interval = retry_interval_ms / 1000
+        self._max_retry_interval = max_retry_interval_ms / 1000
+        self._stop = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"points_replayed": 0, "replay_failures": 0, "replay_points_dropped": 0}
+        self._thread = threading.Thread(target=self._run, name="influx-spill-replayer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        delay = self._retry_interval
+        while not self._stop.is_set():
+            batch = self._spill.peek(timeout=0.5)
+            if batch is None:
+                continue
+            data, points = batch
+            try:
+                self._send(data)
+            except Exception as e:
+                if not is_retryable(e):
+                    logging.error(f"Dropped {points} spilled points, InfluxDB rejected them: {e}")
+                    self._spill.pop()
+                    self._count("replay_points_dropped", points)
+                    continue
+                self._count("replay_failures", 1)
+                logging.warning(f"Replaying {points} spilled points failed, retrying in {delay:.1f}s: {e}")
+                self._stop.wait(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self._max_retry_interval)
+                continue
+            self._spill.pop()
+            self._count("points_replayed", points)
+            delay = self._retry_interval
+
+    def _count(self, metric: str, value: int) -> None:
+        with self._metrics_lock:
+            self._metrics[metric] += value
+
+    def close(self) -> None:
+        """Stops replaying, whatever is left stays on disk for the next run."""
+        self._stop.set()
+        self._thread.join()
+
+    def metrics(self) -> Dict[str, int]:
+        with self._metrics_lock:
+            return dict(self._metrics)
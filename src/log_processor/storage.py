@@ -1,15 +1,47 @@
+import gzip
 import logging
+import threading
+import time
 from abc import ABC, abstractmethod
+from typing import Dict
 
-from influxdb_client import InfluxDBClient, WriteOptions
-from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client import InfluxDBClient, Point, WritePrecision, WriteService
 from config import (
     INFLUXDB_BUCKET,
     INFLUXDB_ORG,
     INFLUXDB_URL,
     INFLUXDB_TOKEN,
+    LOG_BATCH_MAX_BYTES,
     LOG_BATCH_SIZE,
+    LOG_FLUSH_INTERVAL_MS,
+    LOG_MAX_RETRIES,
+    LOG_MAX_RETRY_INTERVAL_MS,
+    LOG_RETRY_INTERVAL_MS,
+    LOG_SPILL_MAX_BYTES,
+    LOG_SPILL_SEGMENT_BYTES,
+    LOG_WRITE_GZIP_LEVEL,
+    LOG_WRITE_LATENCY_TARGET_MS,
+    LOG_WRITE_QUEUE_SIZE,
+    LOG_WRITER_THREADS,
 )
+from metrics import WRITE_BATCH_POINTS, WRITE_ERRORS, WRITE_SECONDS
+from spill import SpillQueue, SpillReplayer
+from writer import AdaptiveBatchSize, BatchWriter, is_retryable
+
+
+def post_line_protocol(write_service: WriteService, data: bytes, gzip_level: int, bucket: str = INFLUXDB_BUCKET,
+                       org: str = INFLUXDB_ORG) -> int:
+    """
+    Writes a line protocol batch as is, gzipped at `gzip_level` unless it's 0, and returns the size of the request
+    body. The client's own enable_gzip always compresses at level 9, several times slower than level 1 for a few
+    percent smaller bodies.
+    """
+    if gzip_level:
+        data = gzip.compress(data, compresslevel=gzip_level)
+    write_service.post_write(org=org, bucket=bucket, body=data, precision=WritePrecision.NS,
+                             content_type="text/plain; charset=utf-8",
+                             content_encoding="gzip" if gzip_level else "identity")
+    return len(data)
 
 
 class LogStorage(ABC):
@@ -17,40 +49,131 @@ class LogStorage(ABC):
     def store_log(self, log_data):
         pass
 
+    def flush(self) -> None:
+        pass
 
-class InfluxDBStorage(LogStorage):
-    def __init__(self):
+    def close(self) -> None:
         pass
 
+
+class InfluxDBStorage(LogStorage):
+    """
+    Owns one InfluxDBClient and one BatchWriter (see writer.py) for the lifetime of the dataflow. store_log only
+    serializes the records and hands them over, LOG_WRITER_THREADS threads write them every LOG_BATCH_SIZE points or
+    LOG_FLUSH_INTERVAL_MS milliseconds, whichever comes first, while the dataflow parses the next lines. Once
+    LOG_WRITE_QUEUE_SIZE batches are waiting store_log blocks, which slows the dataflow down to what InfluxDB takes.
+    Batches are gzipped at LOG_WRITE_GZIP_LEVEL and grow from LOG_BATCH_SIZE points up to LOG_BATCH_MAX_BYTES while
+    writes take less than LOG_WRITE_LATENCY_TARGET_MS.
+
+    With a `spill_directory` batches that still fail after the retries are spilled to disk (see spill.py) instead of
+    dropped and replayed from there. Only main.py passes one (LOG_SPILL_DIRECTORY), tests and tools never load or
+    replay the dataflow's backlog. While spilled batches are waiting new ones are spilled behind them, which keeps
+    the points in order and leaves probing an InfluxDB that is down to the replayer alone.
+    """
+
+    def __init__(self, spill_directory: str = "", writer_threads: int = LOG_WRITER_THREADS):
+        self._client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
+        self._write_service = WriteService(self._client.api_client)
+        self._spill = None
+        self._replayer = None
+        if spill_directory:
+            self._spill = SpillQueue(spill_directory, LOG_SPILL_SEGMENT_BYTES, LOG_SPILL_MAX_BYTES)
+            self._replayer = SpillReplayer(self._spill, self._send, LOG_RETRY_INTERVAL_MS, LOG_MAX_RETRY_INTERVAL_MS)
+        self._writer = BatchWriter(
+            send=self._send,
+            batch_size=LOG_BATCH_SIZE,
+            flush_interval_ms=LOG_FLUSH_INTERVAL_MS,
+            queue_size=LOG_WRITE_QUEUE_SIZE,
+            threads=writer_threads,
+            retry_interval_ms=LOG_RETRY_INTERVAL_MS,
+            max_retries=LOG_MAX_RETRIES,
+            on_failure=self._spill_failed if self._spill is not None else None,
+            divert=self._spill_behind_backlog if self._spill is not None else None,
+            sizer=AdaptiveBatchSize(LOG_BATCH_SIZE, LOG_BATCH_MAX_BYTES, LOG_WRITE_LATENCY_TARGET_MS)
+            if LOG_WRITE_LATENCY_TARGET_MS > 0 else None,
+        )
+        self._close_lock = threading.Lock()
+        self._closed = False
+
     def __repr__(self):
         return f"{self.__class__.__name__}"
 
+    def _send(self, data: bytes) -> int:
+        started = time.perf_counter()
+        try:
+            sent = post_line_protocol(self._write_service, data, LOG_WRITE_GZIP_LEVEL)
+        except Exception as e:
+            WRITE_ERRORS.labels(status=str(getattr(e, "status", None) or "connection")).inc()
+            raise
+        WRITE_SECONDS.observe(time.perf_counter() - started)
+        WRITE_BATCH_POINTS.observe(data.count(b"\n") + 1)
+        return sent
+
+    def _spill_failed(self, data: bytes, error: Exception) -> bool:
+        if not is_retryable(error):
+            return False
+        if not self._spill.append(data, data.count(b"\n") + 1):
+            logging.error(f"Spill queue in {self._spill.directory} is full")
+            return False
+        logging.warning(f"Spilled a batch to {self._spill.directory}: {error}")
+        return True
+
+    def _spill_behind_backlog(self, data: bytes, points: int) -> bool:
+        return len(self._spill) > 0 and self._spill.append(data, points)
+
     def store_log(self, log_data) -> None:
         if not log_data:
             logging.info(f"{self}.{self.__class__.store_log.__name__} was passed empty log_data.")
             return
 
         try:
-            logging.info(f"InfluxDBClient writing: {len(log_data)} records")
-            with InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG) \
-                .write_api(write_options=WriteOptions(
-                    batch_size=500,
-                    flush_interval=1000,
-                    jitter_interval=500,
-                    retry_interval=5000),
-                    success_callback=self.success_cb, error_callback=self.error_cb, retry_callback=self.retry_cb
-            ) as _client:
-                _client.write(INFLUXDB_BUCKET, INFLUXDB_ORG, log_data)
-                _client.__del__()
+            if isinstance(log_data, (bytes, bytearray)):
+                # pre-serialized line protocol, one point per line so LOG_BATCH_SIZE still counts points
+                lines = log_data.splitlines()
+            else:
+                lines = [Point.from_dict(record).to_line_protocol().encode() for record in log_data]
         except Exception as e:
-            logging.error(f"Error writing log to InfluxDB: {e}")
+            logging.error(f"Error serializing logs for InfluxDB: {e}")
+            return
+        self._writer.write(lines)
+
+    def flush(self) -> None:
+        """Waits until every point handed to store_log so far was written (or dropped)."""
+        with self._close_lock:
+            if self._closed:
+                return
+        self._writer.flush()
+        if self._spill is not None:
+            self._spill.sync()
+        logging.info(f"{self} flushed, {self.metrics()}")
 
-    def success_cb(self, details, data):
-        data = data.decode('utf-8').split('\n')
-        logging.info(f"Total Rows Inserted: {len(data)}")
+    def close(self) -> None:
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._writer.close()
+        if self._spill is not None:
+            self._replayer.close()
+            self._spill.close()
+        self._client.close()
+        logging.info(f"{self} closed, {self.metrics()}")
 
-    def error_cb(self, details, data, exception):
-        logging.error(f"Influxdb error callback: details: {details}, exception: {exception}")
+    def counters(self) -> Dict[str, int]:
+        metrics = self.metrics()
+        return {
+            "points_written": metrics["points_written"] + metrics.get("points_replayed", 0),
+            "points_retried": metrics["points_retried"],
+            "points_dropped": metrics["points_dropped"] + metrics.get("replay_points_dropped", 0),
+        }
 
-    def retry_cb(self, details, data, exception):
-        logging.info('Influx db retry exception:', exception)
+    def metrics(self) -> Dict[str, float]:
+        """
+        The writer's counters plus its queue depth, pending points, write latency and time spent blocked, and with a
+        spill directory the spilled backlog (batches, points, bytes, segments) and replay counters.
+        """
+        metrics = self._writer.metrics()
+        if self._spill is not None:
+            metrics.update(self._spill.metrics())
+            metrics.update(self._replayer.metrics())
+        return metrics
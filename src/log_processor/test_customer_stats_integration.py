@@ -1,5 +1,6 @@
 from influxdb_client import InfluxDBClient
 from log_handler import LogHandler
+from rejections import Rejections
 from storage import InfluxDBStorage
 from test_influx_client import InfluxClient
 from test_base import TestBase
@@ -14,7 +15,7 @@ class TestCustomerStatsIntegration(TestBase):
 
     def setUp(self):
         self.storage = InfluxDBStorage()
-        self.processor = LogHandler(self.storage)
+        self.processor = LogHandler(self.storage, rejections=Rejections())
 
         self.logs_cust_1 = [
             "2024-09-29 01:00:00 cust_1 /api/v1/resource 200 0.5",
@@ -34,6 +35,7 @@ class TestCustomerStatsIntegration(TestBase):
         # process all logs, eventually they get saved in influxdb
         self.processor.handle_log(self.logs_cust_1)
         self.processor.handle_log(self.logs_cust_2)
+        self.storage.flush()
 
     def test_stats_for_cust_1(self):
         stats = InfluxClient().get_stats("cust_1", "2024-09-29")
@@ -58,6 +60,7 @@ class TestCustomerStatsIntegration(TestBase):
         self.assertEqual(stats["uptime"], 50.0)
 
     def tearDown(self):
+        self.storage.close()
         # nuke the db bucket ;D
         self.influx_client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
         delete_api = self.influx_client.delete_api()
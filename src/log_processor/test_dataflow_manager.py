@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+from bytewax.testing import run_main
+from dataflow_manager import LogStorageSink, create_dataflow, split_into_batches
+from rollup import ROLLUP_MEASUREMENT
+from test_base import TestBase
+
+
+class RecordingStorage:
+    def __init__(self):
+        self.stored = []
+        self.flushes = 0
+
+    def store_log(self, log_data):
+        self.stored.append(log_data)
+
+    def flush(self):
+        self.flushes += 1
+
+
+class TestSplitIntoBatches(TestBase):
+    def test_chunks_are_flattened_and_regrouped_by_max_size(self):
+        chunks = [["l1", "l2", "l3"], ["l4"], ["l5", "l6"]]
+
+        self.assertEqual(split_into_batches(chunks, max_size=4), [["l1", "l2", "l3", "l4"], ["l5", "l6"]])
+
+    def test_empty_chunks_produce_no_batches(self):
+        self.assertEqual(split_into_batches([[], []], max_size=4), [])
+
+
+class TestLogStorageSink(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.storage = RecordingStorage()
+        self.sink = LogStorageSink(["/logs/b.log", "/logs/c.log", "/logs/a.log"], self.storage)
+
+    def test_batches_are_routed_to_the_partition_of_their_input(self):
+        parts = self.sink.list_parts()
+        # bytewax indexes part_fn into the sorted partition keys
+        for part in parts:
+            self.assertEqual(sorted(parts)[self.sink.part_fn(part)], part)
+
+    def test_partition_stores_every_batch_and_flushes_on_snapshot(self):
+        partition = self.sink.build_part("store_logs", "/logs/a.log", None)
+
+        partition.write_batch([b"api_requests,customer_id=cust_5 duration=1 1\n",
+                               b"api_requests,customer_id=cust_6 duration=2 1\n"])
+        self.assertIsNone(partition.snapshot())
+
+        self.assertEqual(len(self.storage.stored), 2)
+        self.assertEqual(self.storage.flushes, 1)
+
+
+class TestCreateDataflow(TestBase):
+    def test_rollup_points_go_to_the_rollup_storage(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, "api_requests.log")
+        # rollups are only kept for the days open by the wall clock
+        today = datetime.now(timezone.utc).date()
+        with open(path, "w") as f:
+            f.write(f"{today} 16:15:35 cust_5 /api/v1/resource4 200 0.772\n"
+                    f"{today} 16:15:36 cust_6 /api/v1/resource4 500 1.5\n")
+        storage, rollup_storage = RecordingStorage(), RecordingStorage()
+
+        with patch("dataflow_manager.LOG_RANGE_PARTITIONS", 1), patch("dataflow_manager.LOG_DAILY_ROLLUPS", True):
+            run_main(create_dataflow(path, storage, rollup_storage))
+
+        self.assertEqual(b"".join(storage.stored).count(b"\n"), 2)
+        rollup_points = b"".join(rollup_storage.stored).decode().splitlines()
+        self.assertEqual(len(rollup_points), 2)
+        self.assertTrue(all(point.startswith(ROLLUP_MEASUREMENT + ",") for point in rollup_points))
+
+
+if __name__ == "__main__":
+    unittest.main()
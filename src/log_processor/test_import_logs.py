@@ -0,0 +1,74 @@
+import gzip
+import os
+import unittest
+from import_logs import compressed_chunks, import_files, read_range
+from range_source import split_ranges
+from test_base import TestBase
+
+
+class FakeStorage:
+    def __init__(self):
+        self.stored = []
+
+    def store_log(self, log_data):
+        self.stored.append(log_data)
+
+    def metrics(self):
+        return {"points_written": 0}
+
+
+class TestImportLogs(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.log_file_path = 'test_import.log'
+        self.gzip_file_path = 'test_import.log.1.gz'
+        self.lines = [f"2024-09-{14 + i % 2} 16:16:00 cust_{i % 3} /api/v1/resource{i % 4} {200 + i % 2 * 300} "
+                      f"{i}.5" for i in range(200)]
+        with open(self.log_file_path, 'w') as f:
+            f.write("\n".join(self.lines + ["invalid_log_format"]) + "\n")
+        with gzip.open(self.gzip_file_path, 'wt') as f:
+            f.write("\n".join(self.lines))
+
+    def test_every_line_is_read_once_whatever_the_ranges(self):
+        size = os.path.getsize(self.log_file_path)
+        for ranges in (1, 2, 3, 7, 64, size):
+            data = b"".join(read_range(self.log_file_path, start, end) for start, end in split_ranges(size, ranges))
+            self.assertEqual(data.decode().splitlines(), self.lines + ["invalid_log_format"], ranges)
+
+    def test_compressed_chunks_end_at_line_boundaries(self):
+        chunks = list(compressed_chunks(self.gzip_file_path, 100))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(data.endswith(b"\n") for data, _ in chunks[:-1]))
+        self.assertEqual(b"".join(data for data, _ in chunks).decode().splitlines(), self.lines)
+        self.assertEqual(sum(read for _, read in chunks), os.path.getsize(self.gzip_file_path))
+
+    def test_import_stores_every_parsed_line_and_the_merged_rollups(self):
+        storage = FakeStorage()
+
+        importer = import_files([self.log_file_path, self.gzip_file_path], storage, processes=2, chunk_bytes=512,
+                                rollups=True, progress_seconds=60, parser="fast", dead_letter_path="")
+        rollups = importer.store_rollups()
+
+        self.assertEqual(importer.lines, 2 * len(self.lines) + 1)
+        self.assertEqual(importer.parsed, 2 * len(self.lines))
+        self.assertEqual(sum(data.count(b"\n") for data in storage.stored), 2 * len(self.lines) + rollups)
+        # 3 customers on 2 days, the rollups of all chunks are merged into one point each
+        self.assertEqual(rollups, 6)
+        self.assertEqual(sum(rollup.requests for rollup in importer.daily_rollups.values()), 2 * len(self.lines))
+
+    def test_dry_run_only_counts(self):
+        importer = import_files([self.log_file_path], None, processes=1, chunk_bytes=1024, rollups=False,
+                                progress_seconds=60, parser="dict", dead_letter_path="")
+
+        self.assertEqual((importer.lines, importer.parsed), (len(self.lines) + 1, len(self.lines)))
+        self.assertEqual(importer.store_rollups(), 0)
+
+    def tearDown(self):
+        for path in (self.log_file_path, self.gzip_file_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
 import unittest
-from log_handler import LogHandler
+from influxdb_client import Point
+from log_handler import LogHandler, LineProtocolLogHandler, epoch_ns
+from rejections import Rejections
+from schema import TAGGED_SCHEMA
 from test_base import TestBase
 
 
@@ -15,7 +18,7 @@ class TestLogProcessor(TestBase):
     def setUp(self):
         self.log_lines = ["2024-09-14 16:15:35 cust_5 /api/v1/resource4 200 0.772"]
         self.mock_storage = MockStorage()
-        self.processor = LogHandler(self.mock_storage)
+        self.processor = LogHandler(self.mock_storage, rejections=Rejections())
 
     def test_log_handler_handler_valid_logs_and_transforms_them_to_influxdb_acceptable_iterable(self):
         input_log_lines = ["2024-09-14 16:15:35 cust_5 /api/v1/resource4 200 0.772"]
@@ -78,5 +81,114 @@ class TestLogProcessor(TestBase):
         self.assertListEqual(self.mock_storage.log_data, [])
 
 
+class TestLineProtocolLogHandler(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.mock_storage = MockStorage()
+        self.processor = LineProtocolLogHandler(self.mock_storage, rejections=Rejections())
+
+    def dict_path_line_protocol(self, log_line):
+        record = LogHandler(MockStorage(), rejections=Rejections())._process_log(log_line)
+        return Point.from_dict(record).to_line_protocol()
+
+    def test_fast_path_writes_same_line_protocol_as_dict_path(self):
+        log_lines = [
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4 200 0.772",
+            "2024-09-14 16:15:36 cust_1 /api/v1/resource1 500 1.000",
+            "2023-01-14 06:16:00 cust_2 /api/v1/resource3 301 2",
+            "2024-02-29 23:59:59 cust,odd=id /api/v1/\"quoted\" 404 0.1",
+        ]
+
+        self.processor.handle_log(log_lines)
+
+        self.assertEqual(
+            self.mock_storage.log_data.decode().splitlines(),
+            [self.dict_path_line_protocol(log_line) for log_line in log_lines]
+        )
+
+    def test_other_timestamp_layouts_fall_back_to_dict_path(self):
+        log_line = "2024-09-14 16:15:35.250 cust_5 /api/v1/resource4 200 0.772"
+
+        self.processor.handle_log([log_line])
+
+        self.assertEqual(self.mock_storage.log_data.decode().splitlines(), [self.dict_path_line_protocol(log_line)])
+
+    def test_invalid_log_lines_are_not_passed_to_storage(self):
+        log_lines = [
+            "invalid_log_format",
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4",
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4 OK 0.772",
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4 200 nan",
+            "2024-13-14 16:15:35 cust_5 /api/v1/resource4 200 0.772",
+        ]
+
+        self.processor.handle_log(log_lines)
+
+        self.assertEqual(self.mock_storage.log_data, b"")
+
+    def test_rejected_lines_are_recorded_with_their_reason(self):
+        log_lines = [
+            "invalid_log_format",
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4",
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4 OK 0.772",
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4 600 0.772",
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4 099 0.772",
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4 1" + "0" * 5000 + " 0.772",
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4 200 -1",
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4 200 1" + "0" * 400,
+            "2024-13-14 16:15:35 cust_5 /api/v1/resource4 200 0.772",
+            "2024-09-14 16:15:35 cust_5 /api/v1/resource4 200 0.772",
+        ]
+        for handler_cls in (LogHandler, LineProtocolLogHandler):
+            rejections = Rejections(log_every=0)
+
+            handler_cls(self.mock_storage, rejections=rejections).handle_log(log_lines)
+
+            self.assertEqual(rejections.counts(), {"missing_fields": 2, "invalid_status_code": 1,
+                                                   "status_code_out_of_range": 3, "invalid_duration": 2,
+                                                   "invalid_timestamp": 1}, handler_cls)
+            log_data = self.mock_storage.log_data
+            self.assertEqual(len(log_data) if handler_cls is LogHandler else log_data.count(b"\n"), 1)
+
+    def test_buffer_is_reused_between_batches(self):
+        self.processor.handle_log(["2024-09-14 16:15:35 cust_5 /api/v1/resource4 200 0.772"])
+        self.processor.handle_log(["2024-09-14 16:15:36 cust_6 /api/v1/resource4 400 0.5"])
+
+        lines = self.mock_storage.log_data.decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn("customer_id=cust_6,success=0", lines[0])
+
+    def test_tagged_schema_fast_path_matches_dict_path(self):
+        log_lines = [
+            "2024-09-14 16:15:35 cust_5 /api/v1/users/42/?page=2 200 0.772",
+            "2024-09-14 16:15:36 cust_1 /api/v1/resource1 503 1.000",
+            "2024-02-29 23:59:59 cust,odd=id /api/v1/a=b,c 404 0.1",
+        ]
+        processor = LineProtocolLogHandler(self.mock_storage, schema_mode=TAGGED_SCHEMA, rejections=Rejections())
+
+        processor.handle_log(log_lines)
+
+        dict_handler = LogHandler(MockStorage(), schema_mode=TAGGED_SCHEMA, rejections=Rejections())
+        self.assertEqual(
+            self.mock_storage.log_data.decode().splitlines(),
+            [Point.from_dict(dict_handler._process_log(log_line)).to_line_protocol() for log_line in log_lines]
+        )
+        self.assertEqual(
+            self.mock_storage.log_data.decode().splitlines()[0],
+            "api_requests_tagged,customer_id=cust_5,path=/api/v1/users/:id,status_class=2xx,success=1 "
+            "duration=0.772 1726330535000000000"
+        )
+
+    def test_unknown_schema_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            LineProtocolLogHandler(self.mock_storage, schema_mode="wide", rejections=Rejections())
+
+    def test_epoch_ns_converts_fixed_layout_timestamps_as_utc(self):
+        self.assertEqual(epoch_ns("2024-09-14 16:15:35"), "1726330535000000000")
+        self.assertEqual(epoch_ns("1970-01-01 00:00:00"), "0")
+        self.assertIsNone(epoch_ns("2024-09-14T16:15:35"))
+        self.assertIsNone(epoch_ns("2024-9-14 16:15:355"))
+
+
 if __name__ == "__main__":
     unittest.main()
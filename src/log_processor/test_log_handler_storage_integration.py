@@ -2,6 +2,7 @@ import unittest
 from influxdb_client import InfluxDBClient
 from storage import InfluxDBStorage
 from log_handler import LogHandler
+from rejections import Rejections
 from test_base import TestBase
 
 
@@ -22,10 +23,11 @@ class TestCustomerStatsIntegration(TestBase):
         self.influx_client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
         self.storage = InfluxDBStorage()
 
-        self.processor = LogHandler(self.storage)
+        self.processor = LogHandler(self.storage, rejections=Rejections())
 
     def test_log_handler_and_storage(self):
         self.processor.handle_log(self.test_log_data)
+        self.storage.flush()
 
         query = f'''
             from(bucket: "{INFLUXDB_BUCKET}")
@@ -74,6 +76,7 @@ class TestCustomerStatsIntegration(TestBase):
         ]
         self.processor.handle_log(cust_1_logs)
         self.processor.handle_log(cust_2_logs)
+        self.storage.flush()
 
         # Query for only cust_1 logs
         query = f'''
@@ -101,6 +104,7 @@ class TestCustomerStatsIntegration(TestBase):
             "2024-09-14 16:17:35 cust_1 /api/v1/resource4 201 0.654",
         ]
         self.processor.handle_log(log_data)
+        self.storage.flush()
 
         query_success = f'''
             from(bucket: "{INFLUXDB_BUCKET}")
@@ -127,6 +131,7 @@ class TestCustomerStatsIntegration(TestBase):
         self.assertEqual(len(failure_timestamps), 1)
 
     def tearDown(self):
+        self.storage.close()
         try:
             delete_api = self.influx_client.delete_api()
             delete_api.delete(
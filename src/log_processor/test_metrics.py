@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+from prometheus_client import CollectorRegistry, REGISTRY
+from log_handler import LogHandler, LineProtocolLogHandler
+from metrics import StorageCollector
+from polling_source import LogPollingSource, START_BEGINNING
+from rejections import Rejections
+from test_base import TestBase
+
+LINES = [
+    "2024-09-14 16:16:00 cust_5 /api/v1/resource4 404 1.345",
+    "2024-09-14 16:16:01 cust_2 /api/v1/resource3 200 0.150",
+    "invalid_log_format",
+]
+
+
+def sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class FakeStorage:
+    def metrics(self):
+        return {"points_written": 10, "write_seconds_total": 0.5, "queue_depth": 3}
+
+
+class TestMetrics(TestBase):
+    def test_handlers_count_parsed_and_rejected_lines(self):
+        for handler_cls in (LogHandler, LineProtocolLogHandler):
+            missing_fields = {"reason": "missing_fields"}
+            parsed = sample("log_processor_lines_parsed_total")
+            rejected = sample("log_processor_lines_rejected_total", missing_fields)
+            batches = sample("log_processor_parse_seconds_count")
+
+            handler_cls(None, rejections=Rejections()).prepare_log(LINES)
+
+            self.assertEqual(sample("log_processor_lines_parsed_total") - parsed, 2)
+            self.assertEqual(sample("log_processor_lines_rejected_total", missing_fields) - rejected, 1)
+            self.assertEqual(sample("log_processor_parse_seconds_count") - batches, 1)
+
+    def test_polling_source_reports_lines_read_and_lag(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, "lag.log")
+        with open(path, "w") as f:
+            f.write("\n".join(LINES) + "\n")
+        partition = LogPollingSource(path, poll_interval=1, block_size=60, start_position=START_BEGINNING) \
+            .build_part("polling_input", path, None)
+        self.addCleanup(partition.close)
+        read = sample("log_processor_lines_read_total")
+
+        partition.next_batch()
+        self.assertEqual(sample("log_processor_source_lag_bytes", {"file": path}), os.path.getsize(path) - 60)
+        partition.next_batch()
+        partition.next_batch()
+
+        self.assertEqual(sample("log_processor_lines_read_total") - read, 3)
+        self.assertEqual(sample("log_processor_source_lag_bytes", {"file": path}), 0)
+
+    def test_storage_collector_exports_counters_and_gauges(self):
+        registry = CollectorRegistry()
+        registry.register(StorageCollector(FakeStorage()))
+
+        self.assertEqual(registry.get_sample_value("log_processor_storage_points_written_total"), 10)
+        self.assertEqual(registry.get_sample_value("log_processor_storage_write_seconds_total"), 0.5)
+        self.assertEqual(registry.get_sample_value("log_processor_storage_queue_depth"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,53 +1,230 @@
+import gzip
 import unittest
 import os
 import time
-from polling_source import LogPollingSource
+from polling_source import LogPollingSource, resolve_log_files, START_BEGINNING, START_END, START_SAVED
 from test_base import TestBase
 
+LINE_1 = "2024-09-14 16:16:00 cust_5 /api/v1/resource4 404 1.345"
+LINE_2 = "2023-01-14 06:16:00 cust_2 /api/v1/resource3 400 1.150"
+
 
 class TestLogPollingSource(TestBase):
     def setUp(self):
         self.log_file_path = 'test_log.log'
         with open(self.log_file_path, 'w') as f:
             f.write("")
-        self.source = LogPollingSource(self.log_file_path, poll_interval=1)
+        self.partitions = []
+        self.source = self.build_part()
+
+    def build_part(self, start_position=START_SAVED, resume_state=None, block_size=1024 * 1024, rotated_glob=None):
+        source = LogPollingSource(self.log_file_path, poll_interval=1, block_size=block_size,
+                                  start_position=start_position, rotated_glob=rotated_glob)
+        self.assertEqual(source.list_parts(), [self.log_file_path])
+        partition = source.build_part("polling_input", self.log_file_path, resume_state)
+        self.partitions.append(partition)
+        return partition
+
+    def append(self, text):
+        with open(self.log_file_path, 'a') as f:
+            f.write(text)
+
+    def polled_lines(self, partition, polls=1):
+        lines = []
+        for _ in range(polls):
+            for key, chunk in partition.next_batch():
+                self.assertEqual(key, self.log_file_path)
+                lines.extend(chunk)
+        return lines
 
     def test_polling_new_line(self):
         # Simulate writing a new log line to the file
         time.sleep(.1)  # Wait for the poll interval
-        with open(self.log_file_path, 'a') as f:
-            f.write("2024-09-14 16:16:00 cust_5 /api/v1/resource4 404 1.345\n")
+        self.append(f"{LINE_1}\n")
 
         # By now LogPollingSource should detect changes
-        line = self.source.next_item()
-        self.assertIsNotNone(line)
-        self.assertEqual(line[1], "2024-09-14 16:16:00 cust_5 /api/v1/resource4 404 1.345")
+        self.assertEqual(self.polled_lines(self.source), [LINE_1])
 
     def test_polling_with_multiple_lines(self):
         # 1st poll
         time.sleep(.1)  # Wait for the poll interval
-        with open(self.log_file_path, 'a') as f:
-            f.write("2024-09-14 16:16:00 cust_5 /api/v1/resource4 404 1.345\n")
+        self.append(f"{LINE_1}\n")
 
         # LogPollingSource should detect 1st line
-        line1 = self.source.next_item()
-        self.assertIsNotNone(line1)
-        self.assertEqual(line1[1], "2024-09-14 16:16:00 cust_5 /api/v1/resource4 404 1.345")
+        self.assertEqual(self.polled_lines(self.source), [LINE_1])
 
         # 2nd poll
         time.sleep(.1)
-        with open(self.log_file_path, 'a') as f:
-            f.write("2023-01-14 06:16:00 cust_2 /api/v1/resource3 400 1.150\n")
+        self.append(f"{LINE_2}\n")
 
         # LogPollingSource should detect 2nd line
-        line2 = self.source.next_item()
-        self.assertIsNotNone(line2)
-        self.assertEqual(line2[1], "2023-01-14 06:16:00 cust_2 /api/v1/resource3 400 1.150")
+        self.assertEqual(self.polled_lines(self.source), [LINE_2])
+
+    def test_polling_burst_returns_all_complete_lines_in_one_poll(self):
+        burst = [f"2024-09-14 16:16:00 cust_{i} /api/v1/resource4 200 1.345" for i in range(1000)]
+        self.append("\n".join(burst) + "\n")
+
+        self.assertEqual(self.polled_lines(self.source), burst)
+        self.assertEqual(self.source.next_batch(), [])
+
+    def test_partial_line_is_kept_until_its_newline_is_written(self):
+        self.append(f"{LINE_1}\n2024-09-14 16:16:01 cust_6 ")
+
+        self.assertEqual(self.polled_lines(self.source), [LINE_1])
+
+        self.append("/api/v1/resource1 200 0.5\n")
+
+        self.assertEqual(self.polled_lines(self.source), ["2024-09-14 16:16:01 cust_6 /api/v1/resource1 200 0.5"])
+
+    def test_block_size_limits_bytes_read_per_poll(self):
+        partition = self.build_part(block_size=64)
+        self.append(f"{LINE_1}\n" * 3)
+
+        # 56 byte lines, the first 64 byte block holds one complete line and the start of the next
+        self.assertEqual(self.polled_lines(partition, polls=1), [LINE_1])
+        self.assertIsNone(partition.next_awake())  # a full block was read, poll again right away
+        self.assertEqual(self.polled_lines(partition, polls=4), [LINE_1] * 2)
+        self.assertIsNotNone(partition.next_awake())
+
+    def test_existing_lines_are_skipped_when_starting_at_the_end(self):
+        self.append(f"{LINE_1}\n")
+
+        partition = self.build_part(start_position=START_END)
+        self.append(f"{LINE_2}\n")
+
+        self.assertEqual(self.polled_lines(partition), [LINE_2])
+
+    def test_existing_lines_are_read_when_starting_at_the_beginning(self):
+        self.append(f"{LINE_1}\n")
+
+        partition = self.build_part(start_position=START_BEGINNING)
+
+        self.assertEqual(self.polled_lines(partition), [LINE_1])
+
+    def test_snapshot_resumes_after_last_emitted_line(self):
+        self.append(f"{LINE_1}\n{LINE_2[:10]}")
+        self.assertEqual(self.polled_lines(self.source), [LINE_1])
+        snapshot = self.source.snapshot()
+
+        # lines written while the processor was down are picked up, the partial line is not lost
+        self.append(f"{LINE_2[10:]}\n{LINE_1}\n")
+        resumed = self.build_part(resume_state=snapshot)
+
+        self.assertEqual(self.polled_lines(resumed), [LINE_2, LINE_1])
+
+    def test_snapshot_is_ignored_unless_starting_from_saved_offset(self):
+        self.append(f"{LINE_1}\n")
+        snapshot = {"inode": os.stat(self.log_file_path).st_ino, "offset": 0}
+
+        partition = self.build_part(start_position=START_END, resume_state=snapshot)
+
+        self.assertEqual(self.polled_lines(partition), [])
+
+    def test_replaced_file_is_read_from_the_beginning_on_resume(self):
+        self.append(f"{LINE_1}\n")
+        snapshot = {"inode": os.stat(self.log_file_path).st_ino + 1, "offset": 1000}
+
+        partition = self.build_part(resume_state=snapshot)
+
+        self.assertEqual(self.polled_lines(partition), [LINE_1])
+
+    def rotate(self, rotated_path):
+        os.rename(self.log_file_path, rotated_path)
+        with open(self.log_file_path, 'w') as f:
+            f.write("")
+
+    def test_rotated_file_is_drained_then_new_file_is_read(self):
+        self.append(f"{LINE_1}\n")
+        self.assertEqual(self.polled_lines(self.source), [LINE_1])
+
+        # the writer gets one more (unterminated) line into the old file before it is rotated
+        self.append(LINE_2)
+        self.rotate(f"{self.log_file_path}.1")
+        self.append(f"{LINE_1}\n")
+
+        self.assertEqual(self.polled_lines(self.source, polls=3), [LINE_2, LINE_1])
+        self.assertEqual(self.source.snapshot()["inode"], os.stat(self.log_file_path).st_ino)
+
+    def test_old_file_is_kept_until_new_file_is_created(self):
+        self.append(f"{LINE_1}\n")
+        os.rename(self.log_file_path, f"{self.log_file_path}.1")
+
+        self.assertEqual(self.polled_lines(self.source, polls=2), [LINE_1])
+
+        with open(self.log_file_path, 'w') as f:
+            f.write(f"{LINE_2}\n")
+
+        self.assertEqual(self.polled_lines(self.source, polls=2), [LINE_2])
+
+    def test_truncated_file_is_read_from_the_beginning(self):
+        self.append(f"{LINE_1}\n{LINE_1}\n")
+        self.assertEqual(self.polled_lines(self.source), [LINE_1, LINE_1])
+
+        with open(self.log_file_path, 'w') as f:
+            f.write(f"{LINE_2}\n")
+
+        self.assertEqual(self.polled_lines(self.source, polls=2), [LINE_2])
+
+    def test_rotated_files_are_read_oldest_first_when_starting_at_the_beginning(self):
+        with gzip.open(f"{self.log_file_path}.2.gz", 'wt') as f:
+            f.write(f"{LINE_1}\n")
+        os.utime(f"{self.log_file_path}.2.gz", (1, 1))
+        with open(f"{self.log_file_path}.1", 'w') as f:
+            f.write(f"{LINE_2}\n{LINE_2}")
+        self.append(f"{LINE_1}\n")
+
+        partition = self.build_part(start_position=START_BEGINNING, rotated_glob="test_log.log.*")
+
+        self.assertEqual(self.polled_lines(partition, polls=5), [LINE_1, LINE_2, LINE_2, LINE_1])
+
+    def test_resume_catches_up_on_file_rotated_while_down(self):
+        self.append(f"{LINE_1}\n")
+        self.assertEqual(self.polled_lines(self.source), [LINE_1])
+        snapshot = self.source.snapshot()
+
+        self.append(f"{LINE_2}\n")
+        self.rotate(f"{self.log_file_path}.1")
+        self.append(f"{LINE_1}\n")
+        resumed = self.build_part(resume_state=snapshot, rotated_glob="test_log.log.*")
+
+        self.assertEqual(self.polled_lines(resumed, polls=3), [LINE_2, LINE_1])
+
+    def test_snapshot_during_catch_up_points_into_rotated_file(self):
+        with open(f"{self.log_file_path}.1", 'w') as f:
+            f.write(f"{LINE_1}\n{LINE_2}\n")
+        partition = self.build_part(start_position=START_BEGINNING, block_size=64, rotated_glob="test_log.log.*")
+
+        self.assertEqual(self.polled_lines(partition), [LINE_1])
+        snapshot = partition.snapshot()
+        self.assertEqual(snapshot, {"inode": os.stat(f"{self.log_file_path}.1").st_ino, "offset": len(LINE_1) + 1})
+
+        resumed = self.build_part(resume_state=snapshot, rotated_glob="test_log.log.*")
+        self.assertEqual(self.polled_lines(resumed, polls=3), [LINE_2])
+
+    def test_each_matching_file_is_a_partition(self):
+        with open('test_log_2.log', 'w') as f:
+            f.write(f"{LINE_2}\n")
+        self.addCleanup(os.remove, 'test_log_2.log')
+        self.append(f"{LINE_1}\n")
+
+        self.assertEqual(resolve_log_files('test_log*.log'), ['test_log.log', 'test_log_2.log'])
+        self.assertEqual(resolve_log_files('.'), sorted(resolve_log_files('./*.log')))
+        self.assertEqual(resolve_log_files('missing.log'), ['missing.log'])
+
+        source = LogPollingSource('test_log*.log', poll_interval=1, start_position=START_BEGINNING)
+        lines = []
+        for part in source.list_parts():
+            partition = source.build_part("polling_input", part, None)
+            self.partitions.append(partition)
+            lines.extend(line for key, chunk in partition.next_batch() for line in chunk if key == part)
+        self.assertEqual(lines, [LINE_1, LINE_2])
 
     def tearDown(self):
-        self.source.close()
-        if os.path.exists(self.log_file_path):
-            os.remove(self.log_file_path)
+        for partition in self.partitions:
+            partition.close()
+        for path in (self.log_file_path, f"{self.log_file_path}.1", f"{self.log_file_path}.2.gz"):
+            if os.path.exists(path):
+                os.remove(path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+import random
+import unittest
+from quantile_sketch import QuantileSketch, quantile_rank
+from test_base import TestBase
+
+RANKS = (0.01, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999)
+
+
+def latencies(count, seed=42):
+    """Lognormal around 0.2s with a Pareto tail, roughly what request durations look like."""
+    rng = random.Random(seed)
+    return [
+        rng.paretovariate(1.5) if rng.random() < 0.05 else rng.lognormvariate(-1.6, 0.6)
+        for _ in range(count)
+    ]
+
+
+def sketch_of(values, **kwargs):
+    sketch = QuantileSketch(**kwargs)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+class TestQuantileSketch(TestBase):
+    def assert_within_accuracy(self, sketch, values, relative_accuracy=QuantileSketch.DEFAULT_RELATIVE_ACCURACY):
+        exact = sorted(values)
+        for q in RANKS:
+            rank = int(q * (len(exact) - 1))
+            self.assertAlmostEqual(
+                sketch.value_at_rank(rank), exact[rank], delta=exact[rank] * relative_accuracy, msg=f"q={q}"
+            )
+
+    def test_quantiles_are_within_relative_accuracy_of_exact_sort(self):
+        values = latencies(100_000)
+
+        for relative_accuracy in (0.01, 0.05):
+            sketch = sketch_of(values, relative_accuracy=relative_accuracy)
+            self.assertEqual(sketch.count, len(values))
+            self.assert_within_accuracy(sketch, values, relative_accuracy)
+
+    def test_merged_days_are_within_relative_accuracy_of_all_values(self):
+        days = [latencies(5_000, seed=day) for day in range(30)]
+        merged = QuantileSketch()
+        for day in days:
+            merged.merge(QuantileSketch.from_string(sketch_of(day).to_string()))
+
+        values = [value for day in days for value in day]
+        self.assertEqual(merged.count, len(values))
+        self.assert_within_accuracy(merged, values)
+
+    def test_merged_sketch_equals_sketch_of_all_values(self):
+        first, second = sketch_of([0, 0.5, 1.5]), sketch_of([2.5, 3.5])
+        both = sketch_of([0, 0.5, 1.5, 2.5, 3.5])
+
+        first.merge(second)
+
+        self.assertEqual((first.bins, first.zero_count, first.count), (both.bins, both.zero_count, both.count))
+        self.assertEqual(first.value_at_rank(0), 0.0)
+
+    def test_quantile_takes_the_rank_flux_exact_selector_picks(self):
+        sketch = sketch_of([0.4, 0.1, 0.3, 0.2])
+
+        # the lower middle value of an even count, and the largest one for the p99
+        self.assertAlmostEqual(sketch.quantile(0.5), 0.2, delta=0.2 * sketch.relative_accuracy)
+        self.assertAlmostEqual(sketch.quantile(0.99), 0.4, delta=0.4 * sketch.relative_accuracy)
+        self.assertEqual([quantile_rank(q, 200) for q in (0.5, 0.99, 1.0)], [99, 197, 199])
+
+    def test_sketches_of_different_accuracy_do_not_merge(self):
+        with self.assertRaises(ValueError):
+            QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+    def test_values_at_ranks_matches_value_at_rank(self):
+        sketch = sketch_of(latencies(1_000))
+        ranks = [990, 0, 500, 2000, -1]
+
+        self.assertEqual(sketch.values_at_ranks(ranks), [sketch.value_at_rank(rank) for rank in ranks])
+        self.assertEqual(QuantileSketch().values_at_ranks([0, 1]), [None, None])
+
+    def test_bins_are_bounded_and_high_ranks_keep_their_accuracy(self):
+        values = [10 ** (i / 100) for i in range(-600, 600)]
+        sketch = sketch_of(values, max_bins=256)
+
+        self.assertEqual(len(sketch.bins), 256)
+        self.assertEqual(sketch.count, len(values))
+        exact = sorted(values)
+        for rank in (1000, 1100, 1199):
+            self.assertAlmostEqual(sketch.value_at_rank(rank), exact[rank], delta=exact[rank] * 0.01)
+
+    def test_binary_round_trip_is_compact(self):
+        sketch = sketch_of([0] + latencies(10_000))
+
+        restored = QuantileSketch.from_bytes(sketch.to_bytes())
+
+        self.assertEqual((restored.bins, restored.zero_count, restored.count), (sketch.bins, 1, 10_001))
+        self.assertEqual(restored.relative_accuracy, sketch.relative_accuracy)
+        # a few bytes per bucket instead of a float per value
+        self.assertLess(len(sketch.to_bytes()), 4 * len(sketch.bins) + 32)
+        self.assertEqual(QuantileSketch.from_string(sketch.to_string()).bins, sketch.bins)
+
+    def test_unknown_format_version_is_rejected(self):
+        data = bytearray(QuantileSketch().to_bytes())
+        data[0] = 99
+
+        with self.assertRaises(ValueError):
+            QuantileSketch.from_bytes(bytes(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
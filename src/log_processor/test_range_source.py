@@ -0,0 +1,76 @@
+import unittest
+import os
+from range_source import LogFileRangeSource, split_ranges
+from test_base import TestBase
+
+
+class TestLogFileRangeSource(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.log_file_path = 'test_range.log'
+        self.lines = [f"2024-09-14 16:16:00 cust_{i} /api/v1/resource{i % 4} 200 {i}.5" for i in range(200)]
+        with open(self.log_file_path, 'w') as f:
+            f.write("\n".join(self.lines) + "\n")
+
+    def read_part(self, partition):
+        lines = []
+        try:
+            while True:
+                for key, chunk in partition.next_batch():
+                    self.assertEqual(key, partition.part)
+                    lines.extend(chunk)
+        except StopIteration:
+            pass
+        finally:
+            partition.close()
+        return lines
+
+    def read_all(self, source, block_size=None):
+        lines = []
+        for part in source.list_parts():
+            partition = source.build_part("polling_input", part, None)
+            if block_size:
+                partition.block_size = block_size
+            lines.extend(self.read_part(partition))
+        return lines
+
+    def test_split_ranges_covers_the_file(self):
+        self.assertEqual(split_ranges(10, 3), [(0, 3), (3, 6), (6, 10)])
+        self.assertEqual(split_ranges(2, 4), [(0, 1), (1, 2)])
+
+    def test_every_line_is_read_once_whatever_the_ranges(self):
+        for ranges in (1, 2, 3, 7, 64):
+            for block_size in (16, 100, 1024 * 1024):
+                source = LogFileRangeSource(self.log_file_path, ranges=ranges)
+                self.assertEqual(len(source.list_parts()), ranges)
+                self.assertEqual(self.read_all(source, block_size), self.lines, (ranges, block_size))
+
+    def test_unterminated_last_line_is_read(self):
+        with open(self.log_file_path, 'a') as f:
+            f.write("2024-09-14 16:16:01 cust_x /api/v1/resource1 200 0.5")
+
+        self.assertEqual(self.read_all(LogFileRangeSource(self.log_file_path, ranges=3))[-1],
+                         "2024-09-14 16:16:01 cust_x /api/v1/resource1 200 0.5")
+
+    def test_snapshot_resumes_after_last_emitted_line(self):
+        source = LogFileRangeSource(self.log_file_path, ranges=2)
+        part = source.list_parts()[1]
+        partition = source.build_part("polling_input", part, None)
+        partition.block_size = 100
+        first = [line for _, chunk in partition.next_batch() for line in chunk]
+        snapshot = partition.snapshot()
+        partition.close()
+
+        rest = self.read_part(source.build_part("polling_input", part, snapshot))
+
+        self.assertTrue(first)
+        self.assertEqual(first + rest, self.read_part(source.build_part("polling_input", part, None)))
+        self.assertEqual(first + rest, self.lines[-len(first + rest):])
+
+    def tearDown(self):
+        if os.path.exists(self.log_file_path):
+            os.remove(self.log_file_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
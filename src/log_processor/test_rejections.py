@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from prometheus_client import REGISTRY
+from rejections import DeadLetterFile, Rejections
+from test_base import TestBase
+
+
+class TestRejections(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.path = os.path.join(self.directory, "dead_letter", "rejected.jsonl")
+
+    def read_dead_letters(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_counts_by_reason_and_writes_dead_letters(self):
+        dead_letter = DeadLetterFile(self.path, max_bytes=1024 * 1024)
+        self.addCleanup(dead_letter.close)
+        rejections = Rejections(log_every=0, dead_letter=dead_letter)
+        counted = REGISTRY.get_sample_value("log_processor_lines_rejected_total", {"reason": "invalid_duration"}) or 0
+
+        rejections.record([("invalid_duration", "a 1 \"x\""), ("missing_fields", "b")])
+        rejections.record([("invalid_duration", "c")])
+
+        self.assertEqual(rejections.counts(), {"invalid_duration": 2, "missing_fields": 1})
+        self.assertEqual(
+            REGISTRY.get_sample_value("log_processor_lines_rejected_total", {"reason": "invalid_duration"}) - counted, 2
+        )
+        self.assertEqual([(entry["reason"], entry["line"]) for entry in self.read_dead_letters()],
+                         [("invalid_duration", "a 1 \"x\""), ("missing_fields", "b"), ("invalid_duration", "c")])
+
+    def test_dead_letter_file_stops_at_max_bytes(self):
+        dead_letter = DeadLetterFile(self.path, max_bytes=200)
+        self.addCleanup(dead_letter.close)
+
+        self.assertEqual(dead_letter.write([("missing_fields", "x" * 50)]), 1)
+        self.assertEqual(dead_letter.write([("missing_fields", "y" * 100)]), 0)
+
+        self.assertEqual(len(self.read_dead_letters()), 1)
+
+    def test_logs_the_first_and_then_every_nth_rejection_of_a_reason(self):
+        rejections = Rejections(log_every=3)
+
+        with self.assertLogs(level="WARNING") as logs:
+            for i in range(7):
+                rejections.record([("missing_fields", f"line {i}")])
+
+        self.assertEqual([output.split(": ", 1)[1] for output in logs.output], ["'line 0'", "'line 2'", "'line 5'"])
+
+    def test_nothing_is_opened_without_rejections(self):
+        Rejections(dead_letter=DeadLetterFile(self.path, max_bytes=1024)).record([])
+
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
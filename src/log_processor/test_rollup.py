@@ -0,0 +1,110 @@
+import re
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from random import Random
+from unittest.mock import patch
+
+import rollup
+from log_handler import LogHandler, LineProtocolLogHandler
+from rejections import Rejections
+from rollup import DailyRollup, DailyRollups, update_daily_rollups
+from test_base import TestBase
+
+
+class MockStorage:
+    def store_log(self, log_data):
+        pass
+
+
+def partial(customer_id, day, durations, failed=0):
+    rollup = DailyRollup(customer_id, day)
+    for i, duration in enumerate(durations):
+        rollup.add(0 if i < failed else 1, duration)
+    return rollup
+
+
+class TestDailyRollups(TestBase):
+    LOG_LINES = [
+        "2024-09-14 16:15:35 cust_5 /api/v1/resource4 200 0.5",
+        "2024-09-14 23:59:59 cust_5 /api/v1/resource4 500 1.5",
+        "2024-09-15 00:00:00 cust_5 /api/v1/resource4 200 2.0",
+        "2024-09-14 16:15:35.250 cust_6 /api/v1/resource1 404 0.25",
+        "invalid_log_format",
+    ]
+
+    def assert_rollups(self, rollups):
+        by_key = {(rollup.customer_id, rollup.day): rollup for rollup in rollups.values()}
+        self.assertEqual(sorted(by_key), [("cust_5", "2024-09-14"), ("cust_5", "2024-09-15"), ("cust_6", "2024-09-14")])
+
+        rollup = by_key[("cust_5", "2024-09-14")]
+        self.assertEqual((rollup.requests, rollup.successful_requests, rollup.failed_requests), (2, 1, 1))
+        self.assertEqual(rollup.duration_sum, 2.0)
+        self.assertEqual(rollup.sketch.count, 2)
+        self.assertEqual(by_key[("cust_6", "2024-09-14")].failed_requests, 1)
+
+    def test_both_handlers_add_stored_lines_to_rollups(self):
+        for handler_cls in (LogHandler, LineProtocolLogHandler):
+            rollups = DailyRollups()
+            handler_cls(MockStorage(), rejections=Rejections()).prepare_log(self.LOG_LINES, rollups)
+            self.assert_rollups(rollups)
+
+    def test_line_protocol_is_one_point_per_customer_and_day(self):
+        rollup = partial("cust,5", "2024-09-14", [0.5, 1.5], failed=1)
+
+        self.assertEqual(
+            rollup.to_line_protocol(),
+            f'api_requests_daily,customer_id=cust\\,5 requests=2i,successful_requests=1i,failed_requests=1i,'
+            f'duration_sum=2.0,duration_sketch="{rollup.sketch.to_string()}" 1726272000000000000'
+        )
+
+    def test_partials_are_merged_into_their_day(self):
+        today = datetime.now(timezone.utc).date().isoformat()
+        state, point = update_daily_rollups(None, partial("cust_5", today, [0.5]))
+        state, point = update_daily_rollups(state, partial("cust_5", today, [1.5, 2.5], failed=1))
+
+        self.assertEqual(state[today].requests, 3)
+        self.assertIn(b"requests=3i,successful_requests=2i,failed_requests=1i,duration_sum=4.5", point)
+
+    def test_days_outside_the_open_days_are_dropped_and_late_lines_skipped(self):
+        today = datetime.now(timezone.utc).date()
+        yesterday, closed = (today - timedelta(days=1)).isoformat(), (today - timedelta(days=2)).isoformat()
+
+        with patch.object(rollup, "LOG_ROLLUP_OPEN_DAYS", 2):
+            state = {closed: partial("cust_5", closed, [0.5])}
+            state, _ = update_daily_rollups(state, partial("cust_5", yesterday, [0.5]))
+            self.assertEqual(sorted(state), [yesterday])
+
+            state, point = update_daily_rollups(state, partial("cust_5", closed, [0.5]))
+            self.assertIsNone(point)
+            self.assertEqual(sorted(state), [yesterday])
+
+            # yesterday is still open, whatever day came last
+            state, _ = update_daily_rollups(state, partial("cust_5", today.isoformat(), [0.5]))
+            state, point = update_daily_rollups(state, partial("cust_5", yesterday, [0.5]))
+            self.assertIn(b"requests=2i", point)
+
+    def test_out_of_order_days_roll_up_every_line(self):
+        today = datetime.now(timezone.utc).date()
+        days = [(today - timedelta(days=day)).isoformat() for day in range(7)]
+        random = Random(7)
+        lines = [f"{random.choice(days)} {random.randrange(24):02}:15:35 cust_{random.randrange(3)} /api/v1/resource1 "
+                 f"{random.choice([200, 500])} {random.randrange(1, 2000) / 1000}" for _ in range(10_000)]
+        raw_counts = Counter(tuple(line.split(" ")[2::-2]) for line in lines)
+
+        points, states = {}, {}
+        with patch.object(rollup, "LOG_ROLLUP_OPEN_DAYS", 7):
+            for start in range(0, len(lines), 250):
+                rollups = DailyRollups()
+                handler = LineProtocolLogHandler(MockStorage(), rejections=Rejections())
+                handler.prepare_log(lines[start:start + 250], rollups)
+                for part in rollups.values():
+                    states[part.customer_id], point = update_daily_rollups(states.get(part.customer_id), part)
+                    points[(part.customer_id, part.day)] = point
+
+        self.assertEqual({key: int(re.search(rb" requests=(\d+)i", point)[1]) for key, point in points.items()},
+                         dict(raw_counts))
+
+
+if __name__ == "__main__":
+    unittest.main()
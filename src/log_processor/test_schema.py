@@ -0,0 +1,59 @@
+import unittest
+from datetime import date, datetime, timezone
+from unittest.mock import MagicMock
+from influxdb_client.client.flux_table import FluxRecord
+from log_handler import LineProtocolLogHandler
+from migrate_schema import migrate_day, to_log_line
+from rejections import Rejections
+from schema import TAGGED_SCHEMA, normalize_path, status_class
+from test_base import TestBase
+
+
+class MockStorage:
+    def store_log(self, log_data):
+        pass
+
+
+class TestSchema(TestBase):
+    def test_paths_are_normalized(self):
+        self.assertEqual(normalize_path("/api/v1/resource1"), "/api/v1/resource1")
+        self.assertEqual(normalize_path("/users/42/orders/7/?sort=asc#top"), "/users/:id/orders/:id")
+        self.assertEqual(normalize_path("/objects/507f1f77bcf86cd799439011"), "/objects/:id")
+        self.assertEqual(normalize_path("/files/123e4567-e89b-12d3-a456-426614174000/v2"), "/files/:id/v2")
+        self.assertEqual(normalize_path("/?q=1"), "/")
+
+    def test_status_codes_are_grouped_by_class(self):
+        self.assertEqual([status_class(code) for code in (200, 301, 404, 503)], ["2xx", "3xx", "4xx", "5xx"])
+
+    def test_migrated_legacy_point_equals_tagged_ingestion_of_its_line(self):
+        handler = LineProtocolLogHandler(MockStorage(), schema_mode=TAGGED_SCHEMA, rejections=Rejections())
+        for log_line, time in (
+            ("2024-09-14 16:15:35 cust_5 /api/v1/users/42 404 0.772", datetime(2024, 9, 14, 16, 15, 35)),
+            ("2024-09-14 16:15:35.250 cust_5 /api/v1/resource4 200 2.0", datetime(2024, 9, 14, 16, 15, 35, 250000)),
+        ):
+            parts = log_line.split()
+            record = FluxRecord(table=0, values={
+                "_time": time.replace(tzinfo=timezone.utc), "customer_id": parts[2], "success": "0",
+                "request_path": parts[3], "status_code": int(parts[4]), "duration": float(parts[5]),
+            })
+
+            self.assertEqual(handler.prepare_log([to_log_line(record)]), handler.prepare_log([log_line]))
+
+        self.assertIsNone(to_log_line(FluxRecord(table=0, values={"duration": 0.5})))
+
+    def test_migrate_day_counts_the_points_the_handler_rejected(self):
+        handler = LineProtocolLogHandler(MockStorage(), schema_mode=TAGGED_SCHEMA,
+                                         rejections=Rejections(log_every=0))
+        records = [FluxRecord(table=0, values={
+            "_time": datetime(2024, 9, 14, 16, 15, 35, tzinfo=timezone.utc), "customer_id": "cust_5",
+            "request_path": "/api/v1/resource1", "status_code": 200, "duration": duration,
+        }) for duration in (0.00005, 1e-07, 2.5, -1.0)] + [FluxRecord(table=0, values={"duration": 0.5})]
+        client = MagicMock()
+        client.query_api.return_value.query_stream.return_value = iter(records)
+
+        self.assertIn(" 200 0.00005", to_log_line(records[0]))
+        self.assertEqual(migrate_day(client, handler, None, date(2024, 9, 14)), (3, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
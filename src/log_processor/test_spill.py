@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from influxdb_client.rest import ApiException
+from spill import SpillQueue, SpillReplayer
+from test_base import TestBase
+
+
+def batch(i, points=2):
+    return b"\n".join(f"m v={i} {j}".encode() for j in range(points))
+
+
+class TestSpillQueue(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.spill = self.queue()
+
+    def queue(self, segment_bytes=50, max_bytes=10_000):
+        spill = SpillQueue(self.directory, segment_bytes=segment_bytes, max_bytes=max_bytes)
+        self.addCleanup(spill.close)
+        return spill
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory))
+
+    def drain(self, spill):
+        drained = []
+        while len(spill):
+            drained.append(spill.peek()[0])
+            spill.pop()
+        return drained
+
+    def test_batches_come_back_in_order_over_segments(self):
+        for i in range(5):
+            self.assertTrue(self.spill.append(batch(i), 2))
+
+        self.assertEqual(len(self.segments()), 3)
+        self.assertEqual(self.spill.metrics(), {
+            "spill_batches": 5, "spill_points": 10, "spill_bytes": 5 * (8 + len(batch(0))), "spill_segments": 3,
+            "points_spilled": 10,
+        })
+        self.assertEqual(self.drain(self.spill), [batch(i) for i in range(5)])
+        self.assertEqual(self.segments(), [])
+
+    def test_replayed_segments_are_deleted(self):
+        for i in range(4):
+            self.spill.append(batch(i), 2)
+        first = self.segments()[0]
+
+        self.spill.pop()
+        self.assertIn(first, self.segments())
+        self.spill.pop()
+        self.assertNotIn(first, self.segments())
+
+    def test_append_refuses_batches_past_the_size_cap(self):
+        capped = os.path.join(self.directory, "capped")
+        spill = SpillQueue(capped, segment_bytes=100, max_bytes=2 * (8 + len(batch(0))))
+        self.addCleanup(spill.close)
+
+        self.assertEqual([spill.append(batch(i), 2) for i in range(3)], [True, True, False])
+        self.assertEqual(spill.metrics()["spill_batches"], 2)
+
+    def test_batches_left_on_disk_are_queued_on_start(self):
+        for i in range(3):
+            self.spill.append(batch(i), 2)
+        self.spill.pop()
+        self.spill.close()
+        # a crash in the middle of the next append
+        with open(os.path.join(self.directory, self.segments()[-1]), "ab") as segment:
+            segment.write(b"\x40\x00\x00\x00\x02\x00\x00\x00m v=")
+
+        restarted = self.queue()
+        restarted.append(batch(3), 2)
+
+        # the popped batch's segment wasn't done yet, so it is replayed again
+        self.assertEqual(self.drain(restarted), [batch(0), batch(1), batch(2), batch(3)])
+
+    def test_peek_waits_for_a_batch(self):
+        self.assertIsNone(self.spill.peek(timeout=0.01))
+        threading.Timer(0.05, self.spill.append, args=(batch(0), 2)).start()
+
+        self.assertEqual(self.spill.peek(timeout=5), (batch(0), 2))
+
+
+class TestSpillReplayer(TestBase):
+    def test_replays_in_order_once_writes_succeed_again(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        spill = SpillQueue(directory, segment_bytes=100, max_bytes=10_000)
+        self.addCleanup(spill.close)
+        for i in range(3):
+            spill.append(batch(i), 2)
+        failures = [ConnectionError("refused"), ApiException(status=503), ApiException(status=400)]
+        sent = []
+
+        def send(data):
+            if failures:
+                raise failures.pop(0)
+            sent.append(data)
+
+        replayer = SpillReplayer(spill, send, retry_interval_ms=1, max_retry_interval_ms=5)
+        deadline = time.monotonic() + 5
+        while len(spill) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        replayer.close()
+
+        # the batch rejected as invalid is dropped, the others are written in order
+        self.assertEqual(sent, [batch(1), batch(2)])
+        self.assertEqual(replayer.metrics(), {"points_replayed": 4, "replay_failures": 2, "replay_points_dropped": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,15 @@
+import gzip
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from unittest.mock import patch
 from influxdb_client import InfluxDBClient
+from influxdb_client.rest import ApiException
 from storage import InfluxDBStorage
 from test_base import TestBase
+from config import LOG_BATCH_SIZE
 
 INFLUXDB_URL = "http://rated_db:8086"
 INFLUXDB_TOKEN = "MyInitialAdminToken0=="
@@ -23,6 +31,7 @@ class TestStorage(TestBase):
 
     def test_store_and_query_log(self):
         self.storage.store_log(self.test_log_data)
+        self.storage.flush()
 
         customer_id = self.test_log_data[0]['tags']['customer_id']
         success = self.test_log_data[0]['tags']['success']
@@ -62,6 +71,7 @@ class TestStorage(TestBase):
             self.assertEqual(record['success'], str(success))
 
     def tearDown(self):
+        self.storage.close()
         # Clean up the InfluxDB data after the test
         try:
             delete_api = self.influx_client.delete_api()
@@ -78,5 +88,117 @@ class TestStorage(TestBase):
             print(f"Error during data cleanup: {e}")
 
 
+class TestInfluxDBStorageWriter(TestBase):
+    def setUp(self):
+        super().setUp()
+        patcher = patch("storage.InfluxDBClient")
+        self.mock_client_cls = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("storage.WriteService")
+        self.write_service = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.storage = InfluxDBStorage()
+        self.addCleanup(self.storage.close)
+        self.mock_client = self.mock_client_cls.return_value
+
+    @staticmethod
+    def body(call):
+        body = call.kwargs["body"]
+        return gzip.decompress(body) if call.kwargs["content_encoding"] == "gzip" else body
+
+    def written_points(self):
+        return [line for call in self.write_service.post_write.call_args_list for line in self.body(call).split(b"\n")]
+
+    def test_client_is_reused_across_batches(self):
+        self.storage.store_log(b"a v=1 1\na v=2 2\n")
+        self.storage.flush()
+        self.storage.store_log(b"a v=3 3\n")
+        self.storage.flush()
+
+        self.mock_client_cls.assert_called_once()
+        self.assertEqual(self.write_service.post_write.call_count, 2)
+        self.assertEqual(self.written_points(), [b"a v=1 1", b"a v=2 2", b"a v=3 3"])
+
+    def test_batches_start_at_the_configured_size(self):
+        self.assertEqual(self.storage._writer.batch_size, LOG_BATCH_SIZE)
+
+    def test_writes_are_gzipped_at_the_configured_level(self):
+        data = b"\n".join(b"api_requests,customer_id=cust_5,success=1 duration=0.772 %d" % i for i in range(100))
+        for level in (0, 1):
+            with patch("storage.LOG_WRITE_GZIP_LEVEL", level):
+                self.storage.store_log(data)
+                self.storage.flush()
+
+        plain, gzipped = self.write_service.post_write.call_args_list
+        self.assertEqual((plain.kwargs["content_encoding"], gzipped.kwargs["content_encoding"]), ("identity", "gzip"))
+        self.assertEqual(self.body(gzipped), data)
+        metrics = self.storage.metrics()
+        self.assertEqual(metrics["bytes_written"], 2 * len(data))
+        self.assertEqual(metrics["bytes_sent"], len(data) + len(gzipped.kwargs["body"]))
+        self.assertLess(len(gzipped.kwargs["body"]), len(data) / 5)
+
+    def test_records_are_serialized_to_line_protocol(self):
+        self.storage.store_log([{
+            "measurement": "api_requests", "tags": {"customer_id": "cust_5", "success": 1},
+            "fields": {"duration": 0.772}, "time": 1726330535000000000,
+        }])
+        self.storage.flush()
+
+        self.assertEqual(self.written_points(), [b"api_requests,customer_id=cust_5,success=1 duration=0.772 "
+                                                 b"1726330535000000000"])
+
+    def test_close_is_idempotent(self):
+        self.storage.close()
+        self.storage.close()
+        self.storage.flush()
+
+        self.mock_client.close.assert_called_once()
+
+    def test_counters_count_written_and_dropped_points(self):
+        self.write_service.post_write.side_effect = [None, ApiException(status=400)]
+        self.storage.store_log(b"a v=1 1\na v=2 2\na v=3 3")
+        self.storage.flush()
+        self.storage.store_log(b"a v=1 1")
+        self.storage.flush()
+
+        self.assertEqual(self.storage.counters(), {
+            "points_written": 3,
+            "points_retried": 0,
+            "points_dropped": 1,
+        })
+        self.assertEqual(self.storage.metrics()["batches_written"], 1)
+
+    @patch("storage.LOG_RETRY_INTERVAL_MS", 1)
+    @patch("storage.LOG_MAX_RETRIES", 0)
+    def test_failed_batches_are_spilled_and_replayed_in_order(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        storage = InfluxDBStorage(spill_directory=directory)
+        self.addCleanup(storage.close)
+        influx_down = threading.Event()
+        influx_down.set()
+        written = []
+
+        def post_write(**kwargs):
+            if influx_down.is_set():
+                raise ApiException(status=503)
+            written.append(gzip.decompress(kwargs["body"]) if kwargs["content_encoding"] == "gzip" else kwargs["body"])
+
+        self.write_service.post_write.side_effect = post_write
+        storage.store_log(b"a v=1 1")
+        storage.flush()
+        storage.store_log(b"a v=2 2")
+        storage.flush()
+        self.assertEqual(storage.metrics()["spill_points"], 2)
+
+        influx_down.clear()
+        deadline = time.monotonic() + 5
+        while storage.metrics()["spill_points"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(written, [b"a v=1 1", b"a v=2 2"])
+        self.assertEqual(storage.counters(), {"points_written": 2, "points_retried": 0, "points_dropped": 0})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,162 @@
+import threading
+import time
+import unittest
+from influxdb_client.rest import ApiException
+from test_base import TestBase
+from writer import AdaptiveBatchSize, BatchWriter, is_retryable
+
+
+class RecordingSend:
+    """Collects the written batches, every write waits for `gate` when one is given."""
+
+    def __init__(self, gate: threading.Event = None, failures=()):
+        self.batches = []
+        self.gate = gate
+        self.failures = list(failures)
+        self.lock = threading.Lock()
+
+    def __call__(self, data: bytes):
+        if self.gate is not None:
+            self.gate.wait(5)
+        with self.lock:
+            if self.failures:
+                raise self.failures.pop(0)
+            self.batches.append(data.split(b"\n"))
+
+
+def lines(count, start=0):
+    return [f"m v={i} {i}".encode() for i in range(start, start + count)]
+
+
+class TestBatchWriter(TestBase):
+    def writer(self, send, **kwargs):
+        options = dict(batch_size=3, flush_interval_ms=60_000, queue_size=2, threads=1, retry_interval_ms=1,
+                       max_retries=2)
+        options.update(kwargs)
+        writer = BatchWriter(send, **options)
+        self.addCleanup(writer.close)
+        return writer
+
+    def test_full_batches_are_written_and_flush_writes_the_rest(self):
+        send = RecordingSend()
+        writer = self.writer(send)
+
+        writer.write(lines(4))
+        writer.write(lines(3, start=4))
+        writer.flush()
+
+        self.assertEqual([len(batch) for batch in send.batches], [3, 3, 1])
+        self.assertEqual(sorted(line for batch in send.batches for line in batch), sorted(lines(7)))
+        metrics = writer.metrics()
+        self.assertEqual((metrics["points_written"], metrics["batches_written"]), (7, 3))
+        self.assertEqual((metrics["pending_points"], metrics["queue_depth"]), (0, 0))
+
+    def test_partial_batch_is_written_after_the_flush_interval(self):
+        send = RecordingSend()
+        writer = self.writer(send, flush_interval_ms=20)
+
+        writer.write(lines(1))
+        deadline = time.monotonic() + 5
+        while not send.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(send.batches, [lines(1)])
+
+    def test_write_blocks_while_the_queue_is_full(self):
+        gate = threading.Event()
+        send = RecordingSend(gate)
+        writer = self.writer(send, batch_size=1, queue_size=1)
+        # the writer thread holds one batch and the queue the next, the third has to wait
+        writer.write(lines(2))
+        blocked = threading.Thread(target=writer.write, args=(lines(1, start=2),))
+        blocked.start()
+        blocked.join(0.1)
+        self.assertTrue(blocked.is_alive())
+        self.assertEqual(writer.metrics()["queue_depth"], 1)
+
+        gate.set()
+        blocked.join(5)
+        writer.flush()
+
+        self.assertFalse(blocked.is_alive())
+        self.assertEqual(writer.metrics()["points_written"], 3)
+        self.assertGreater(writer.metrics()["backpressure_seconds_total"], 0)
+
+    def test_failed_writes_are_retried_then_dropped(self):
+        send = RecordingSend(failures=[ConnectionError("refused"), ApiException(status=503)])
+        writer = self.writer(send)
+        writer.write(lines(3))
+        writer.flush()
+        self.assertEqual(len(send.batches), 1)
+
+        send.failures = [ApiException(status=503)] * 3
+        writer.write(lines(3))
+        writer.flush()
+
+        self.assertEqual(writer.metrics()["points_retried"], 3 * 2 + 3 * 2)
+        self.assertEqual(writer.metrics()["points_dropped"], 3)
+
+    def test_client_errors_are_not_retried(self):
+        failed = []
+
+        def on_failure(data, error):
+            failed.append((data, error.status))
+            return True
+
+        send = RecordingSend(failures=[ApiException(status=400)])
+        writer = self.writer(send, on_failure=on_failure)
+        writer.write(lines(3))
+        writer.flush()
+
+        self.assertEqual(failed, [(b"\n".join(lines(3)), 400)])
+        self.assertEqual((writer.metrics()["points_retried"], writer.metrics()["points_dropped"]), (0, 0))
+
+    def test_diverted_batches_are_not_sent(self):
+        diverted = []
+
+        def divert(data, points):
+            diverted.append(points)
+            return points < 3
+
+        send = RecordingSend()
+        writer = self.writer(send, divert=divert)
+        writer.write(lines(4))
+        writer.flush()
+
+        self.assertEqual((diverted, len(send.batches)), ([3, 1], 1))
+        self.assertEqual(writer.metrics()["points_written"], 3)
+
+    def test_adaptive_batch_size_follows_write_latency(self):
+        send = RecordingSend()
+        sizer = AdaptiveBatchSize(min_size=2, max_bytes=10_000, latency_target_ms=1000)
+        writer = self.writer(send, batch_size=2, sizer=sizer)
+        writer.write(lines(2))
+        writer.flush()
+        self.assertEqual(writer.batch_size, 3)
+        # a partial batch doesn't count
+        writer.write(lines(1))
+        writer.flush()
+        self.assertEqual(writer.metrics()["batch_size"], 3)
+
+        sizer.observe(points=3, data_bytes=30, latency=2.0)
+        self.assertEqual(sizer.size, 2)
+
+    def test_adaptive_batch_size_stays_within_the_byte_budget(self):
+        sizer = AdaptiveBatchSize(min_size=10, max_bytes=1000, latency_target_ms=1000)
+        for _ in range(50):
+            sizer.observe(points=sizer.size, data_bytes=sizer.size * 20, latency=0.01)
+        self.assertEqual(sizer.size, 50)
+
+        for _ in range(10):
+            sizer.observe(points=sizer.size, data_bytes=sizer.size * 20, latency=5.0)
+        self.assertEqual(sizer.size, 10)
+
+    def test_is_retryable(self):
+        self.assertTrue(is_retryable(ConnectionError()))
+        self.assertTrue(is_retryable(ApiException(status=429)))
+        self.assertTrue(is_retryable(ApiException(status=500)))
+        self.assertFalse(is_retryable(ApiException(status=422)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+import logging
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+_STOP = object()
+
+
+def is_retryable(error: Exception) -> bool:
+    """Connection errors, timeouts, 429 and 5xx are worth retrying, any other 4xx would fail again."""
+    status = getattr(error, "status", None)
+    return status is None or status == 429 or status >= 500
+
+
+class AdaptiveBatchSize:
+    """
+    A batch size in points that grows while writes stay fast and shrinks when they get slow: every full batch written
+    within `latency_target_ms` grows it by a quarter, a slower one halves it. It starts at and never drops below
+    `min_size`, and never grows past what fits in `max_bytes` at the average point size seen so far.
+    """
+
+    def __init__(self, min_size: int, max_bytes: int, latency_target_ms: int):
+        self.size = min_size
+        self._min_size = min_size
+        self._max_bytes = max_bytes
+        self._latency_target = latency_target_ms / 1000
+        self._point_bytes = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, points: int, data_bytes: int, latency: float) -> None:
+        with self._lock:
+            point_bytes = data_bytes / points
+            self._point_bytes = 0.8 * self._point_bytes + 0.2 * point_bytes if self._point_bytes else point_bytes
+            if latency > self._latency_target:
+                self.size = max(self._min_size, self.size // 2)
+            else:
+                max_size = max(self._min_size, int(self._max_bytes / self._point_bytes))
+                self.size = min(max_size, self.size + self.size // 4 + 1)
+
+
+class BatchWriter:
+    """
+    Decouples serializing points from writing them: write() appends line protocol lines to a pending batch and
+    queues every full batch of `batch_size` points, `threads` writer threads send the queued batches with `send`
+    (one blocking HTTP write each) so parsing the next lines overlaps the writes. The queue holds at most
+    `queue_size` batches, once it is full write() blocks until a writer frees a slot, which stalls the bytewax
+    worker instead of buffering without bound. A partial batch is queued after `flush_interval_ms` at the latest.
+
+    With a `sizer` the batch size follows the write latency instead of staying at `batch_size` (see AdaptiveBatchSize).
+    `send` may return the bytes it actually sent (after compression), counted as bytes_sent.
+
+    Failed writes are retried `max_retries` times with exponential backoff from `retry_interval_ms`, batches that
+    still fail are handed to `on_failure` and dropped unless it returns True. `divert` sees every batch before it is
+    sent, a batch it returns True for was taken over and isn't sent.
+    """
+
+    def __init__(self, send: Callable[[bytes], None], batch_size: int, flush_interval_ms: int, queue_size: int,
+                 threads: int, retry_interval_ms: int, max_retries: int,
+                 on_failure: Optional[Callable[[bytes, Exception], bool]] = None,
+                 divert: Optional[Callable[[bytes, int], bool]] = None,
+                 sizer: Optional[AdaptiveBatchSize] = None):
+        self._send = send
+        self._batch_size = batch_size
+        self._sizer = sizer
+        self._flush_interval = flush_interval_ms / 1000
+        self._retry_interval = retry_interval_ms / 1000
+        self._max_retries = max_retries
+        self._on_failure = on_failure
+        self._divert = divert
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._pending: List[bytes] = []
+        self._pending_since = 0.0
+        self._pending_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "points_written": 0,
+            "points_retried": 0,
+            "points_dropped": 0,
+            "batches_written": 0,
+            "bytes_written": 0,
+            "bytes_sent": 0,
+            "write_seconds_total": 0.0,
+            "write_seconds_max": 0.0,
+            "backpressure_seconds_total": 0.0,
+        }
+        self._threads = [
+            threading.Thread(target=self._run, name=f"influx-writer-{i}", daemon=True) for i in range(threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def batch_size(self) -> int:
+        return self._sizer.size if self._sizer is not None else self._batch_size
+
+    def write(self, lines: List[bytes]) -> None:
+        """Adds points, blocks while the queue is full."""
+        with self._pending_lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.extend(lines)
+            size = self.batch_size
+            if len(self._pending) < size:
+                return
+            batches = [self._pending[i:i + size] for i in range(0, len(self._pending), size)]
+            self._pending = batches.pop() if len(batches[-1]) < size else []
+            self._pending_since = time.monotonic()
+        for batch in batches:
+            self._enqueue(batch, full=True)
+
+    def flush(self) -> None:
+        """Queues the partial batch and waits until every queued batch was written (or given up on)."""
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._enqueue(batch, full=False)
+        self._queue.join()
+
+    def close(self) -> None:
+        self.flush()
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def metrics(self) -> Dict[str, float]:
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        with self._pending_lock:
+            metrics["pending_points"] = len(self._pending)
+        metrics["queue_depth"] = self._queue.qsize()
+        batches = metrics["batches_written"]
+        metrics["write_seconds_avg"] = metrics["write_seconds_total"] / batches if batches else 0.0
+        metrics["batch_size"] = self.batch_size
+        return metrics
+
+    def _enqueue(self, batch: List[bytes], full: bool) -> None:
+        try:
+            self._queue.put_nowait((batch, full))
+        except queue.Full:
+            started = time.monotonic()
+            self._queue.put((batch, full))
+            self._count("backpressure_seconds_total", time.monotonic() - started)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                self._queue_stale_pending()
+                continue
+            try:
+                if item is _STOP:
+                    return
+                batch, full = item
+                self._write(b"\n".join(batch), len(batch), full)
+            finally:
+                self._queue.task_done()
+
+    def _queue_stale_pending(self) -> None:
+        with self._pending_lock:
+            if not self._pending or time.monotonic() - self._pending_since < self._flush_interval:
+                return
+            batch, self._pending = self._pending, []
+        try:
+            # never block a writer on its own queue, if it's full the points wait for the next batch instead
+            self._queue.put_nowait((batch, False))
+        except queue.Full:
+            with self._pending_lock:
+                self._pending[:0] = batch
+
+    def _write(self, data: bytes, points: int, full: bool) -> None:
+        if self._divert is not None and self._divert(data, points):
+            return
+        for attempt in range(self._max_retries + 1):
+            started = time.monotonic()
+            try:
+                sent = self._send(data)
+            except Exception as e:
+                if attempt == self._max_retries or not is_retryable(e):
+                    if self._on_failure is None or not self._on_failure(data, e):
+                        self._drop(points, e)
+                    return
+                delay = self._retry_interval * 2 ** attempt
+                logging.warning(f"Writing {points} points failed, retrying in {delay:.1f}s: {e}")
+                self._count("points_retried", points)
+                # jitter so the writers of every worker don't all come back at the same time
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                continue
+
+            elapsed = time.monotonic() - started
+            if full and self._sizer is not None:
+                # partial batches queued by flushes say nothing about how long a full one takes
+                self._sizer.observe(points, len(data), elapsed)
+            with self._metrics_lock:
+                self._metrics["points_written"] += points
+                self._metrics["batches_written"] += 1
+                self._metrics["bytes_written"] += len(data)
+                self._metrics["bytes_sent"] += len(data) if sent is None else sent
+                self._metrics["write_seconds_total"] += elapsed
+                self._metrics["write_seconds_max"] = max(self._metrics["write_seconds_max"], elapsed)
+            return
+
+    def _drop(self, points: int, error: Exception) -> None:
+        self._count("points_dropped", points)
+        logging.error(f"Dropped {points} points, writing them failed: {error}")
+
+    def _count(self, metric: str, value: float) -> None:
+        with self._metrics_lock:
+            self._metrics[metric] += value